@@ -1,5 +1,8 @@
 import streamlit as st
 
+from pfas_score.startup import warm_up
+from pfas_score.ui import figure
+
 st.markdown("""
     <h1>Prediction Tool for PFAS in California WWTPs</h1>
     """, unsafe_allow_html=True)
@@ -72,14 +75,14 @@ Our machine learning models achieved ~80% accuracy in predicting total PFAS risk
 
 st.write(abstract)
 
-st.image("figures/Figure1.jpg", caption = """Figure 1: Graphical Abstract for Machine Learning for Monitoring Per- and Polyfluoroalkyl Substance (PFAS) in California's Wastewater Treatment 
+figure("Figure1.jpg", caption = """Figure 1: Graphical Abstract for Machine Learning for Monitoring Per- and Polyfluoroalkyl Substance (PFAS) in California's Wastewater Treatment 
                                             Plants: An Assessment of Occurrence and Fate""")
-st.image("figures/Figure2.jpg", caption = """Figure 2: PFAS occurrence in California WWTPs. Panel A:  Mean concentrations and standard deviations (divided by 10) of total PFASs in 
+figure("Figure2.jpg", caption = """Figure 2: PFAS occurrence in California WWTPs. Panel A:  Mean concentrations and standard deviations (divided by 10) of total PFASs in 
          influent, effluent, and biosolids. Panel B: Mean concentrations of 39 PFASs in influent, effluent, and biosolids. Insert: SC-PFCA represents short-chain (C4-C6) PFCAs; 
          LC-PFCA represents long-chain (C7+) PFCAs; SC-PFSA represents short-chain PFSAs; LC-PFSA represents long-chain PFSAs; FT represents fluorotelomers; FASA represents 
          perfluoroalkane sulfonamide; Other represents other PFAS (ADONA, HFPO-DA (GenX), 11ClPF3OUDS, 9ClPF3ONS). Panel C: Detection frequency of 39 PFASs across California WWTPs, 
          represented in a radar chart. Panel D: Percent of California WWTPs exhibiting higher PFAS concentrations in effluent compared to influent.""")
-st.image("figures/Figure3.jpg", caption = """Figure 3: Geographic distribution and Risk Assessment of PFAS Contaminants in California WWTPs. Panel A: Total PFAS risk in WWTP influent (INF). 
+figure("Figure3.jpg", caption = """Figure 3: Geographic distribution and Risk Assessment of PFAS Contaminants in California WWTPs. Panel A: Total PFAS risk in WWTP influent (INF). 
          Panel B: Total PFAS risk in WWTP effluent (EFF). Panel C: Total PFAS risk in WWTP biosolids (BIO). Panel D: County-wise distribution of total PFAS average concentrations in 
          INF/EFF/BIO.""")
 
@@ -101,4 +104,6 @@ st.markdown("""
 
 st.markdown("If you want to discover more, then please contact the <a href=https://olivareslab.org/join-the-lab/)>Olivares Lab</a>.", unsafe_allow_html=True)
 
-
+# Preload the page models on a background thread once this page has rendered, so the first prediction
+# on a model page does not wait for numpy, catboost and the model files (see pfas_score/startup.py)
+warm_up()
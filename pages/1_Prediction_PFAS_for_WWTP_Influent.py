@@ -1,6 +1,10 @@
 import streamlit as st
-import pickle
-import numpy as np
+
+from pfas_score.cache import predict_cached
+from pfas_score.history import log_prediction
+from pfas_score.metrics import span, timed
+from pfas_score.ui import (batch_upload, explanation, input_mode, sensitivity_sweep, time_series,
+                           uncertainty_analysis)
 
 st.title("Risk Prediction of Total PFAS in Influent (Non-PFAS as Input Features)")
 
@@ -22,143 +26,158 @@ st.write("""When using the model, please ensure that all inputs are in the corre
 # BIOSOLID - biosolid in wastewater treatment
 # EFFLUENT - effluent in wastewater treament plant
 
-# Specify the path to the model's .pkl file
-file_path = 'models/CatBoost_model_inf.pkl'
-
-# Open the file in binary read mode and load the model
-with open(file_path, 'rb') as file:
-    inf_classifier = pickle.load(file)
-
+# Input mode - one hand-typed sample, a whole CSV/Excel file scored at once, the
+# monthly history of many plants scored incrementally, a sweep of one or two inputs
+# around the typed sample, or its measurement uncertainty
+mode = input_mode()
+if mode == "Batch upload":
+    batch_upload("influent")
+    st.stop()
+if mode == "Time series":
+    time_series("influent")
+    st.stop()
+
+@timed("validate", page="influent")
 def check_input(input, title):
     try:
-        converted_input = np.float64(input)
+        converted_input = float(input)
         return converted_input
     except ValueError:
         st.error("Please enter a valid number for {0}".format(title))
         return False
 
-inputs = dict()
+# Inputs - collected in a form, so editing them does not rerun the page; they are
+# validated and scored once Make Prediction is clicked
+with st.form("inputs"), span("render", page="influent"):
+    inputs = dict()
 
-# INPUT - Year
-year = st.number_input("Select a Year", min_value=1900, max_value=2100, value=2024, step=1)
-inputs["Year"] = year
+    # INPUT - Plant (not a model input; recorded with the prediction in the prediction history)
+    plant = st.text_input("Plant name or ID (optional, recorded in the prediction history)", "")
 
-#--------------------------------------------------------------------------------------------------
+    #------------------------------------------------------------------------------------------
 
-# INPUT - Month
-months = [
-    "January", "February", "March", "April", "May", "June",
-    "July", "August", "September", "October", "November", "December"
-]
+    # INPUT - Year
+    year = st.number_input("Select a Year", min_value=1900, max_value=2100, value=2024, step=1)
+    inputs["Year"] = year
 
-# Mapping of months to their corresponding integer values
-month_to_int = {month: i+1 for i, month in enumerate(months)}
+    #------------------------------------------------------------------------------------------
 
-# Dropdown menu for selecting month
-selected_month = st.selectbox("Select a Month", months)
+    # INPUT - Month
+    months = [
+        "January", "February", "March", "April", "May", "June",
+        "July", "August", "September", "October", "November", "December"
+    ]
 
-# Get the corresponding integer value for the selected month
-inputs["Month"] = month_to_int[selected_month]
+    # Mapping of months to their corresponding integer values
+    month_to_int = {month: i+1 for i, month in enumerate(months)}
 
-#--------------------------------------------------------------------------------------------------
+    # Dropdown menu for selecting month
+    selected_month = st.selectbox("Select a Month", months)
 
-# INPUT - Flow
-flow = st.text_input("Flow in Influent (The flow rate of the influent to the facility (MGD))", "3.1334")
+    # Get the corresponding integer value for the selected month
+    inputs["Month"] = month_to_int[selected_month]
 
-inputs["Flow"] = check_input(flow, "Flow")
+    #------------------------------------------------------------------------------------------
 
-#--------------------------------------------------------------------------------------------------
+    # INPUT - Flow
+    flow = st.text_input("Flow in Influent (The flow rate of the influent to the facility (MGD))", "3.1334")
 
-# INPUT - Influent Volume
-influent_volume = st.text_input("Influent Volume (acre-feet/month)", "387")
+    inputs["Flow"] = check_input(flow, "Flow")
 
-inputs["Influent Volume"] = check_input(influent_volume, "Influent Volume")
+    #------------------------------------------------------------------------------------------
 
-#--------------------------------------------------------------------------------------------------
+    # INPUT - Influent Volume
+    influent_volume = st.text_input("Influent Volume (acre-feet/month)", "387")
 
-# INPUT - Discharge Volume
-discharge_volume = st.text_input("Discharge Volume in Influent (acre-feet/month)", "169.25")
+    inputs["Influent Volume"] = check_input(influent_volume, "Influent Volume")
 
-inputs["Discharge Volume"] = check_input(discharge_volume, "Discharge Volume")
+    #------------------------------------------------------------------------------------------
 
-#--------------------------------------------------------------------------------------------------
+    # INPUT - Discharge Volume
+    discharge_volume = st.text_input("Discharge Volume in Influent (acre-feet/month)", "169.25")
 
-# INPUT - Industrial Total
-industrial_total = st.text_input("Industrial Total in Influent (Percentage of total industrial inflow in all inflow) (%)", "0.625")
+    inputs["Discharge Volume"] = check_input(discharge_volume, "Discharge Volume")
 
-inputs["Industrial Total"] = check_input(industrial_total, "Industrial Total")
+    #------------------------------------------------------------------------------------------
 
-#--------------------------------------------------------------------------------------------------
+    # INPUT - Industrial Total
+    industrial_total = st.text_input("Industrial Total in Influent (Percentage of total industrial inflow in all inflow) (%)", "0.625")
 
-# INPUT 6 - Total ammonia
-total_ammonia = st.text_input("Total Ammonia in Influent (NH4 + NH3 (ng/L))", "22300000")
+    inputs["Industrial Total"] = check_input(industrial_total, "Industrial Total")
 
-inputs["Total Ammonia"] = check_input(total_ammonia, "Total Ammonia")
+    #------------------------------------------------------------------------------------------
 
-#--------------------------------------------------------------------------------------------------
+    # INPUT 6 - Total ammonia
+    total_ammonia = st.text_input("Total Ammonia in Influent (NH4 + NH3 (ng/L))", "22300000")
 
-# INPUT - Biochemical Oxygen Demand
-biochemical_oxygen_demand = st.text_input("Biochemical Oxygen Demand in Influent (BOD was measured in 5 days at 20 deg. C (ng/L))", "255668102.2")
+    inputs["Total Ammonia"] = check_input(total_ammonia, "Total Ammonia")
 
-inputs["Biochemical Oxygen Demand"] = check_input(biochemical_oxygen_demand, 
-                                                    "Biochemical Oxygen Demand")
+    #------------------------------------------------------------------------------------------
 
-#--------------------------------------------------------------------------------------------------
+    # INPUT - Biochemical Oxygen Demand
+    biochemical_oxygen_demand = st.text_input("Biochemical Oxygen Demand in Influent (BOD was measured in 5 days at 20 deg. C (ng/L))", "255668102.2")
 
-# INPUT - Carbonaceous Biochemical Oxygen Demand
-carbonaceous_biochemical_oxygen_demand = st.text_input("Carbonaceous Biochemical Oxygen Demand in Influent (CBOD was measured in 5 days at 20 deg. C (ng/L))", 
-                                                       "645000000")
+    inputs["Biochemical Oxygen Demand"] = check_input(biochemical_oxygen_demand, 
+                                                        "Biochemical Oxygen Demand")
 
-inputs["Carbonaceous Biochemical Oxygen Demand"] = check_input(
-                                                        carbonaceous_biochemical_oxygen_demand,
-                                                        "Carbonaceous Biochemical Oxygen Demand"
-                                                        )
+    #------------------------------------------------------------------------------------------
 
-#--------------------------------------------------------------------------------------------------
+    # INPUT - Carbonaceous Biochemical Oxygen Demand
+    carbonaceous_biochemical_oxygen_demand = st.text_input("Carbonaceous Biochemical Oxygen Demand in Influent (CBOD was measured in 5 days at 20 deg. C (ng/L))", 
+                                                           "645000000")
 
-# INPUT - Total Dissolved Solids
-total_dissolved_solids = st.text_input("Total Dissolved Solids in Influent (TDS (ng/L))", "507170067")
+    inputs["Carbonaceous Biochemical Oxygen Demand"] = check_input(
+                                                            carbonaceous_biochemical_oxygen_demand,
+                                                            "Carbonaceous Biochemical Oxygen Demand"
+                                                            )
 
-inputs["Total Dissolved Solids"] = check_input(total_dissolved_solids,
-                                               "Total Dissolved Solids")
+    #------------------------------------------------------------------------------------------
 
-#--------------------------------------------------------------------------------------------------
+    # INPUT - Total Dissolved Solids
+    total_dissolved_solids = st.text_input("Total Dissolved Solids in Influent (TDS (ng/L))", "507170067")
 
-# INPUT - Total Organic Carbon
-total_organic_carbon = st.text_input("Total Organic Carbon in Influent (TOC (ng/L))", "16043614")
+    inputs["Total Dissolved Solids"] = check_input(total_dissolved_solids,
+                                                   "Total Dissolved Solids")
 
-inputs["Total Organic Carbon"] = check_input(total_organic_carbon,
-                                             "Total Organic Carbon")
+    #------------------------------------------------------------------------------------------
 
-#--------------------------------------------------------------------------------------------------
+    # INPUT - Total Organic Carbon
+    total_organic_carbon = st.text_input("Total Organic Carbon in Influent (TOC (ng/L))", "16043614")
 
-# INPUT - Total Suspended Solids
-total_suspended_solids = st.text_input("Total Suspended Solids in Influent (TSS (ng/L))", "240900372.8")
+    inputs["Total Organic Carbon"] = check_input(total_organic_carbon,
+                                                 "Total Organic Carbon")
 
-inputs["Total Suspended Solids"] = check_input(total_suspended_solids,
-                                               "Total Suspended Solids")
+    #------------------------------------------------------------------------------------------
 
-#--------------------------------------------------------------------------------------------------
+    # INPUT - Total Suspended Solids
+    total_suspended_solids = st.text_input("Total Suspended Solids in Influent (TSS (ng/L))", "240900372.8")
 
-# INPUT - pH
-ph = st.text_input("pH of Influent", "7.0")
+    inputs["Total Suspended Solids"] = check_input(total_suspended_solids,
+                                                   "Total Suspended Solids")
 
-# custom pH error checking function
-try:
-    converted_input = np.float64(ph)
-    if 0 <= converted_input <= 14:
-        inputs["pH"] = converted_input
-    else:
-        st.error("The {0} value must be between 0 and 14".format('pH'))
+    #------------------------------------------------------------------------------------------
+
+    # INPUT - pH
+    ph = st.text_input("pH of Influent", "7.0")
+
+    # custom pH error checking function
+    try:
+        converted_input = float(ph)
+        if 0 <= converted_input <= 14:
+            inputs["pH"] = converted_input
+        else:
+            st.error("The {0} value must be between 0 and 14".format('pH'))
+            inputs["pH"] = False
+    except ValueError:
+        st.error("Please enter a valid number for {0}".format("pH"))
         inputs["pH"] = False
-except ValueError:
-    st.error("Please enter a valid number for {0}".format("pH"))
-    inputs["pH"] = False
 
-#--------------------------------------------------------------------------------------------------
+    #------------------------------------------------------------------------------------------
+
+    submitted = st.form_submit_button("Make Prediction")
 
 # User Prediction
-if st.button("Make Prediction"):
+if submitted:
     # obtain any invalid inputs
     invalid_inputs = [key for key, value in inputs.items() if value is False]
 
@@ -168,10 +187,24 @@ if st.button("Make Prediction"):
         st.error("The following inputs are invalid: " + ", ".join(invalid_inputs))
     else:
         # inputs are all valid, make prediction
-        prediction = inf_classifier.predict(list(inputs.values()))
+        # identical inputs from any session are scored once (see pfas_score/cache.py)
+        with span("predict", page="influent"):
+            prediction, probability = predict_cached("influent", list(inputs.values()))
+        # appended to the prediction history off the request path (see pfas_score/history.py)
+        log_prediction("influent", list(inputs.values()), prediction, probability, plant)
 
         if prediction == 0:
             st.write("Total PFAS risk is lower than 70 nanograms per liter (70 ng/L).")
         else:
             st.write("Total PFAS risk is greater than 70 nanograms per liter (70 ng/L).")
 
+        # which inputs pushed the prediction up or down (see pfas_score/explain.py)
+        explanation("influent", list(inputs.values()))
+
+# Sensitivity sweep - how the risk changes as one or two of the inputs above vary
+if mode == "Sensitivity sweep":
+    sensitivity_sweep("influent", inputs)
+
+# Uncertainty - the share of high risk predictions when the inputs above carry measurement error
+if mode == "Uncertainty":
+    uncertainty_analysis("influent", inputs)
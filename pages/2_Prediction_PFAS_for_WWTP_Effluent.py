@@ -1,13 +1,10 @@
 import streamlit as st
-import numpy as np
-import pickle
 
-# Specify the path to the model's .pkl file
-file_path = 'models/CatBoost_eff2_web.pkl'
-
-# Open the file in binary read mode and load the model
-with open(file_path, 'rb') as file:
-    eff_classifier = pickle.load(file)
+from pfas_score.cache import predict_cached
+from pfas_score.history import log_prediction
+from pfas_score.metrics import span, timed
+from pfas_score.ui import (batch_upload, explanation, input_mode, sensitivity_sweep, time_series,
+                           uncertainty_analysis)
 
 st.title("Risk Prediction of Total PFAS in Effluent (Non-PFAS as Input Features)")
 
@@ -23,243 +20,265 @@ st.write("""When using the model, please ensure that all inputs are in the corre
          be adjusted based on your specific input data.
          """)
 
+# Input mode - one hand-typed sample, a whole CSV/Excel file scored at once, the
+# monthly history of many plants scored incrementally, a sweep of one or two inputs
+# around the typed sample, or its measurement uncertainty
+mode = input_mode()
+if mode == "Batch upload":
+    batch_upload("effluent")
+    st.stop()
+if mode == "Time series":
+    time_series("effluent")
+    st.stop()
+
+@timed("validate", page="effluent")
 def check_input(input, title):
     try:
-        converted_input = np.float64(input)
+        converted_input = float(input)
         return converted_input
     except ValueError:
         st.error("Please enter a valid number for {0}".format(title))
         return False
 
-inputs = dict()
+# Inputs - collected in a form, so editing them does not rerun the page; they are
+# validated and scored once Make Prediction is clicked
+with st.form("inputs"), span("render", page="effluent"):
+    inputs = dict()
 
-# INPUT - Year
-year = st.number_input("Select a Year", min_value=1900, max_value=2100, value=2024, step=1)
-inputs["Year"] = year
+    # INPUT - Plant (not a model input; recorded with the prediction in the prediction history)
+    plant = st.text_input("Plant name or ID (optional, recorded in the prediction history)", "")
 
-#--------------------------------------------------------------------------------------------------
+    #------------------------------------------------------------------------------------------
 
-# INPUT - Month
-months = [
-    "January", "February", "March", "April", "May", "June",
-    "July", "August", "September", "October", "November", "December"
-]
+    # INPUT - Year
+    year = st.number_input("Select a Year", min_value=1900, max_value=2100, value=2024, step=1)
+    inputs["Year"] = year
 
-# Mapping of months to their corresponding integer values
-month_to_int = {month: i+1 for i, month in enumerate(months)}
+    #------------------------------------------------------------------------------------------
 
-# Dropdown menu for selecting month
-selected_month = st.selectbox("Select a Month", months)
+    # INPUT - Month
+    months = [
+        "January", "February", "March", "April", "May", "June",
+        "July", "August", "September", "October", "November", "December"
+    ]
 
-# Get the corresponding integer value for the selected month
-inputs["Month"] = month_to_int[selected_month]
+    # Mapping of months to their corresponding integer values
+    month_to_int = {month: i+1 for i, month in enumerate(months)}
 
-#--------------------------------------------------------------------------------------------------
+    # Dropdown menu for selecting month
+    selected_month = st.selectbox("Select a Month", months)
 
-# INPUT - Flow (Influent)
-flow = st.text_input("Flow in Influent (The flow rate of the influent to the facility (MGD))", "3.1334")
+    # Get the corresponding integer value for the selected month
+    inputs["Month"] = month_to_int[selected_month]
 
-inputs["Flow (Influent)"] = check_input(flow, "Flow (Influent)")
+    #------------------------------------------------------------------------------------------
 
-#--------------------------------------------------------------------------------------------------
+    # INPUT - Flow (Influent)
+    flow = st.text_input("Flow in Influent (The flow rate of the influent to the facility (MGD))", "3.1334")
 
-# INPUT - Influent Volume
-influent_volume = st.text_input("Influent Volume (acre-feet/month)", "387")
+    inputs["Flow (Influent)"] = check_input(flow, "Flow (Influent)")
 
-inputs["Influent Volume"] = check_input(influent_volume, "Influent Volume")
+    #------------------------------------------------------------------------------------------
 
-#--------------------------------------------------------------------------------------------------
+    # INPUT - Influent Volume
+    influent_volume = st.text_input("Influent Volume (acre-feet/month)", "387")
 
-# INPUT - Discharge Volume
-discharge_volume = st.text_input("Discharge Volume in Influent (acre-feet/month)", "169.25")
+    inputs["Influent Volume"] = check_input(influent_volume, "Influent Volume")
 
-inputs["Discharge Volume"] = check_input(discharge_volume, "Discharge Volume (Influent)")
+    #------------------------------------------------------------------------------------------
 
-#--------------------------------------------------------------------------------------------------
+    # INPUT - Discharge Volume
+    discharge_volume = st.text_input("Discharge Volume in Influent (acre-feet/month)", "169.25")
 
-# INPUT - Industrial Total
-industrial_total = st.text_input("Industrial Total in Influent (Percentage of total industrial inflow in all inflow) (%)", "0.625")
+    inputs["Discharge Volume"] = check_input(discharge_volume, "Discharge Volume (Influent)")
 
-inputs["Industrial Total"] = check_input(industrial_total, "Industrial Total (Influent)")
+    #------------------------------------------------------------------------------------------
 
-#--------------------------------------------------------------------------------------------------
+    # INPUT - Industrial Total
+    industrial_total = st.text_input("Industrial Total in Influent (Percentage of total industrial inflow in all inflow) (%)", "0.625")
 
-# INPUT - Total Ammonia (Influent)
-total_ammonia = st.text_input("Total Ammonia in Influent (NH4 + NH3 (ng/L))", "22300000")
+    inputs["Industrial Total"] = check_input(industrial_total, "Industrial Total (Influent)")
 
-inputs["Total Ammonia (Influent)"] = check_input(total_ammonia, "Total Ammonia (Influent)")
+    #------------------------------------------------------------------------------------------
 
-#--------------------------------------------------------------------------------------------------
+    # INPUT - Total Ammonia (Influent)
+    total_ammonia = st.text_input("Total Ammonia in Influent (NH4 + NH3 (ng/L))", "22300000")
 
-# INPUT - Biochemical Oxygen Demand (Influent)
-biochemical_oxygen_demand = st.text_input("Biochemical Oxygen Demand in Influent (BOD was measured in 5 days at 20 deg. C (ng/L))", "255668102.2")
+    inputs["Total Ammonia (Influent)"] = check_input(total_ammonia, "Total Ammonia (Influent)")
 
-inputs["Biochemical Oxygen Demand (Influent)"] = check_input(biochemical_oxygen_demand, 
-                                                    "Biochemical Oxygen Demand (Influent)")
+    #------------------------------------------------------------------------------------------
 
-#--------------------------------------------------------------------------------------------------
+    # INPUT - Biochemical Oxygen Demand (Influent)
+    biochemical_oxygen_demand = st.text_input("Biochemical Oxygen Demand in Influent (BOD was measured in 5 days at 20 deg. C (ng/L))", "255668102.2")
 
-# INPUT - Carbonaceous Biochemical Oxygen Demand (Influent)
-carbonaceous_biochemical_oxygen_demand = st.text_input("Carbonaceous Biochemical Oxygen Demand in Influent (CBOD was measured in 5 days at 20 deg. C (ng/L))", 
-                                                       "645000000")
+    inputs["Biochemical Oxygen Demand (Influent)"] = check_input(biochemical_oxygen_demand, 
+                                                        "Biochemical Oxygen Demand (Influent)")
 
-inputs["Carbonaceous Biochemical Oxygen Demand (Influent)"] = check_input(
-                                                        carbonaceous_biochemical_oxygen_demand,
-                                                        "Carbonaceous Biochemical Oxygen Demand (Influent)"
-                                                        )
-#--------------------------------------------------------------------------------------------------
+    #------------------------------------------------------------------------------------------
 
-# INPUT - Total Dissolved Solids (Influent)
-total_dissolved_solids = st.text_input("Total Dissolved Solids in Influent (TDS (ng/L))", "507170067")
+    # INPUT - Carbonaceous Biochemical Oxygen Demand (Influent)
+    carbonaceous_biochemical_oxygen_demand = st.text_input("Carbonaceous Biochemical Oxygen Demand in Influent (CBOD was measured in 5 days at 20 deg. C (ng/L))", 
+                                                           "645000000")
 
-inputs["Total Dissolved Solids (Influent)"] = check_input(total_dissolved_solids,
-                                               "Total Dissolved Solids (Influent)")
+    inputs["Carbonaceous Biochemical Oxygen Demand (Influent)"] = check_input(
+                                                            carbonaceous_biochemical_oxygen_demand,
+                                                            "Carbonaceous Biochemical Oxygen Demand (Influent)"
+                                                            )
+    #------------------------------------------------------------------------------------------
 
-#--------------------------------------------------------------------------------------------------
+    # INPUT - Total Dissolved Solids (Influent)
+    total_dissolved_solids = st.text_input("Total Dissolved Solids in Influent (TDS (ng/L))", "507170067")
 
-# INPUT - Total Organic Carbon (Influent)
-total_organic_carbon = st.text_input("Total Organic Carbon in Influent (TOC (ng/L))", "16043614")
+    inputs["Total Dissolved Solids (Influent)"] = check_input(total_dissolved_solids,
+                                                   "Total Dissolved Solids (Influent)")
 
-inputs["Total Organic Carbon (Influent)"] = check_input(total_organic_carbon,
-                                             "Total Organic Carbon (Influent)")
+    #------------------------------------------------------------------------------------------
 
-#--------------------------------------------------------------------------------------------------
+    # INPUT - Total Organic Carbon (Influent)
+    total_organic_carbon = st.text_input("Total Organic Carbon in Influent (TOC (ng/L))", "16043614")
 
-# INPUT - Total Suspended Solids (Influent)
-total_suspended_solids = st.text_input("Total Suspended Solids in Influent (TSS (ng/L))", "240900372.8")
+    inputs["Total Organic Carbon (Influent)"] = check_input(total_organic_carbon,
+                                                 "Total Organic Carbon (Influent)")
 
-inputs["Total Suspended Solids (Influent)"] = check_input(total_suspended_solids,
-                                               "Total Suspended Solids (Influent)")
+    #------------------------------------------------------------------------------------------
 
-#--------------------------------------------------------------------------------------------------
+    # INPUT - Total Suspended Solids (Influent)
+    total_suspended_solids = st.text_input("Total Suspended Solids in Influent (TSS (ng/L))", "240900372.8")
 
-# INPUT - pH (Influent)
-ph = st.text_input("pH of Influent", "7.0")
+    inputs["Total Suspended Solids (Influent)"] = check_input(total_suspended_solids,
+                                                   "Total Suspended Solids (Influent)")
 
-# custom pH error checking function
-try:
-    converted_input = np.float64(ph)
-    if 0 <= converted_input <= 14:
-        inputs["pH (Influent)"] = converted_input
-    else:
-        st.error("The {0} value must be between 0 and 14".format('influent pH.'))
+    #------------------------------------------------------------------------------------------
+
+    # INPUT - pH (Influent)
+    ph = st.text_input("pH of Influent", "7.0")
+
+    # custom pH error checking function
+    try:
+        converted_input = float(ph)
+        if 0 <= converted_input <= 14:
+            inputs["pH (Influent)"] = converted_input
+        else:
+            st.error("The {0} value must be between 0 and 14".format('influent pH.'))
+            inputs["pH (Influent)"] = False
+    except ValueError:
+        st.error("Please enter a valid number for the {0}".format("influent pH."))
         inputs["pH (Influent)"] = False
-except ValueError:
-    st.error("Please enter a valid number for the {0}".format("influent pH."))
-    inputs["pH (Influent)"] = False
 
-#--------------------------------------------------------------------------------------------------
+    #------------------------------------------------------------------------------------------
 
-# INPUT 14 - Total Ammonia (Effluent)
-total_ammonia_eff = st.text_input("Total Ammonia in Effluent", "176526.7692")
+    # INPUT 14 - Total Ammonia (Effluent)
+    total_ammonia_eff = st.text_input("Total Ammonia in Effluent", "176526.7692")
 
-inputs["Total Ammonia (Effluent)"] = check_input(total_ammonia_eff, "Total Ammonia (Effluent)")
+    inputs["Total Ammonia (Effluent)"] = check_input(total_ammonia_eff, "Total Ammonia (Effluent)")
 
-#--------------------------------------------------------------------------------------------------
+    #------------------------------------------------------------------------------------------
 
-# INPUT 15 - Biochemical Oxygen Demand, Percent Removal (Effluent)
-bod_pr_eff = st.text_input("Biochemical Oxygen Demand, Percent Removal in Effluent", "0")
+    # INPUT 15 - Biochemical Oxygen Demand, Percent Removal (Effluent)
+    bod_pr_eff = st.text_input("Biochemical Oxygen Demand, Percent Removal in Effluent", "0")
 
-inputs["Biochemical Oxygen Demand, Percent Removal (Effluent)"] = check_input(bod_pr_eff, 
-                                                          "Biochemical Oxygen Demand, Percent Removal (Effluent)")
+    inputs["Biochemical Oxygen Demand, Percent Removal (Effluent)"] = check_input(bod_pr_eff, 
+                                                              "Biochemical Oxygen Demand, Percent Removal (Effluent)")
 
-#--------------------------------------------------------------------------------------------------
+    #------------------------------------------------------------------------------------------
 
-# INPUT 16 - Biochemical Oxygen Demand (Effluent)
-biochemical_oxygen_demand_eff = st.text_input("Biochemical Oxygen Demand in Effluent", "2873391.258")
+    # INPUT 16 - Biochemical Oxygen Demand (Effluent)
+    biochemical_oxygen_demand_eff = st.text_input("Biochemical Oxygen Demand in Effluent", "2873391.258")
 
-inputs["Biochemical Oxygen Demand (Effluent)"] = check_input(biochemical_oxygen_demand_eff, 
-                                                    "Biochemical Oxygen Demand (Effluent)")
+    inputs["Biochemical Oxygen Demand (Effluent)"] = check_input(biochemical_oxygen_demand_eff, 
+                                                        "Biochemical Oxygen Demand (Effluent)")
 
-#--------------------------------------------------------------------------------------------------
+    #------------------------------------------------------------------------------------------
 
-# INPUT 17 - Carbonaceous Biochemical Oxygen Demand (Effluent)
-carbonaceous_biochemical_oxygen_demand_eff = st.text_input("Carbonaceous Biochemical Oxygen Demand in Effluent", 
-                                                       "2372284.641")
+    # INPUT 17 - Carbonaceous Biochemical Oxygen Demand (Effluent)
+    carbonaceous_biochemical_oxygen_demand_eff = st.text_input("Carbonaceous Biochemical Oxygen Demand in Effluent", 
+                                                           "2372284.641")
 
-inputs["Carbonaceous Biochemical Oxygen Demand (Effluent)"] = check_input(
-                                                        carbonaceous_biochemical_oxygen_demand_eff,
-                                                        "Carbonaceous Biochemical Oxygen Demand (Effluent)"
-                                                        )
+    inputs["Carbonaceous Biochemical Oxygen Demand (Effluent)"] = check_input(
+                                                            carbonaceous_biochemical_oxygen_demand_eff,
+                                                            "Carbonaceous Biochemical Oxygen Demand (Effluent)"
+                                                            )
 
-#--------------------------------------------------------------------------------------------------
+    #------------------------------------------------------------------------------------------
 
-# INPUT 18 - Total Nitrate
+    # INPUT 18 - Total Nitrate
 
-total_nitrate = st.text_input("Total Nitrate in Effluent", "0")
+    total_nitrate = st.text_input("Total Nitrate in Effluent", "0")
 
-inputs["Total Nitrate"] = check_input(total_nitrate, "Total Nitrate")
+    inputs["Total Nitrate"] = check_input(total_nitrate, "Total Nitrate")
 
-#--------------------------------------------------------------------------------------------------
+    #------------------------------------------------------------------------------------------
 
-# INPUT 19 - Total Nitrite
+    # INPUT 19 - Total Nitrite
 
-total_nitrite = st.text_input("Total Nitrite in Effluent", "0")
+    total_nitrite = st.text_input("Total Nitrite in Effluent", "0")
 
-inputs["Total Nitrite"] = check_input(total_nitrite, "Total Nitrite")
+    inputs["Total Nitrite"] = check_input(total_nitrite, "Total Nitrite")
 
-#--------------------------------------------------------------------------------------------------
+    #------------------------------------------------------------------------------------------
 
-# INPUT 20 - Total Nitrogen
+    # INPUT 20 - Total Nitrogen
 
-total_nitrogen = st.text_input("Total Nitrogen in Effluent", "0")
+    total_nitrogen = st.text_input("Total Nitrogen in Effluent", "0")
 
-inputs["Total Nitrogen"] = check_input(total_nitrogen, "Total Nitrogen")
+    inputs["Total Nitrogen"] = check_input(total_nitrogen, "Total Nitrogen")
 
-#--------------------------------------------------------------------------------------------------
+    #------------------------------------------------------------------------------------------
 
-# INPUT 21 - Total Dissolved Solids (Effluent)
-total_dissolved_solids_eff = st.text_input("Total Dissolved Solids in Effluent", "507170067.4")
+    # INPUT 21 - Total Dissolved Solids (Effluent)
+    total_dissolved_solids_eff = st.text_input("Total Dissolved Solids in Effluent", "507170067.4")
 
-inputs["Total Dissolved Solids (Effluent)"] = check_input(total_dissolved_solids_eff,
-                                               "Total Dissolved Solids (Effluent)")
+    inputs["Total Dissolved Solids (Effluent)"] = check_input(total_dissolved_solids_eff,
+                                                   "Total Dissolved Solids (Effluent)")
 
-#--------------------------------------------------------------------------------------------------
+    #------------------------------------------------------------------------------------------
 
-# INPUT 22 - Total Organic Carbon (Effluent)
-total_organic_carbon_eff = st.text_input("Total Organic Carbon in Effluent", "16000000")
+    # INPUT 22 - Total Organic Carbon (Effluent)
+    total_organic_carbon_eff = st.text_input("Total Organic Carbon in Effluent", "16000000")
 
-inputs["Total Organic Carbon (Effluent)"] = check_input(total_organic_carbon_eff,
-                                             "Total Organic Carbon (Effluent)")
+    inputs["Total Organic Carbon (Effluent)"] = check_input(total_organic_carbon_eff,
+                                                 "Total Organic Carbon (Effluent)")
 
-#--------------------------------------------------------------------------------------------------
+    #------------------------------------------------------------------------------------------
 
-# INPUT 23 - Total Suspended Solids (Effluent)
-total_suspended_solids_eff = st.text_input("Total Suspended Solids in Effluent", "2336653.964")
+    # INPUT 23 - Total Suspended Solids (Effluent)
+    total_suspended_solids_eff = st.text_input("Total Suspended Solids in Effluent", "2336653.964")
 
-inputs["Total Suspended Solids (Effluent)"] = check_input(total_suspended_solids_eff,
-                                               "Total Suspended Solids (Effluent)")
+    inputs["Total Suspended Solids (Effluent)"] = check_input(total_suspended_solids_eff,
+                                                   "Total Suspended Solids (Effluent)")
 
-#--------------------------------------------------------------------------------------------------
+    #------------------------------------------------------------------------------------------
 
-# INPUT 24 - Total Suspended Solids, Percent Removal (Effluent)
-total_suspended_solids_pr_eff = st.text_input("Total Suspended Solids, Percent Removal in Effluent", 
-                                           "0")
+    # INPUT 24 - Total Suspended Solids, Percent Removal (Effluent)
+    total_suspended_solids_pr_eff = st.text_input("Total Suspended Solids, Percent Removal in Effluent", 
+                                               "0")
 
-inputs["Total Suspended Solids, Percent Removal (Effluent)"] = check_input(total_suspended_solids_pr_eff,
-                                               "Total Suspended Solids, Percent Removal (Effluent)")
+    inputs["Total Suspended Solids, Percent Removal (Effluent)"] = check_input(total_suspended_solids_pr_eff,
+                                                   "Total Suspended Solids, Percent Removal (Effluent)")
 
-#--------------------------------------------------------------------------------------------------
+    #------------------------------------------------------------------------------------------
 
-# INPUT 25 - pH (Influent)
-ph_eff = st.text_input("pH of Effluent", "7.0")
+    # INPUT 25 - pH (Influent)
+    ph_eff = st.text_input("pH of Effluent", "7.0")
 
-# custom pH error checking function
-try:
-    converted_ph_eff = np.float64(ph_eff)
-    if 0 <= converted_ph_eff <= 14:
-        inputs["pH (Effluent)"] = converted_ph_eff
-    else:
-        st.error("The {0} value must be between 0 and 14".format('effluent pH.'))
+    # custom pH error checking function
+    try:
+        converted_ph_eff = float(ph_eff)
+        if 0 <= converted_ph_eff <= 14:
+            inputs["pH (Effluent)"] = converted_ph_eff
+        else:
+            st.error("The {0} value must be between 0 and 14".format('effluent pH.'))
+            inputs["pH (Effluent)"] = False
+    except ValueError:
+        st.error("Please enter a valid number for the {0}".format("effluent pH."))
         inputs["pH (Effluent)"] = False
-except ValueError:
-    st.error("Please enter a valid number for the {0}".format("effluent pH."))
-    inputs["pH (Effluent)"] = False
 
-#--------------------------------------------------------------------------------------------------
+    #------------------------------------------------------------------------------------------
+
+    submitted = st.form_submit_button("Make Prediction")
 
 # User Prediction
-if st.button("Make Prediction"):
+if submitted:
     # obtain any invalid inputs
     invalid_inputs = [key for key, value in inputs.items() if value is False]
 
@@ -269,9 +288,24 @@ if st.button("Make Prediction"):
         st.error("The following inputs are invalid: " + ", ".join(invalid_inputs))
     else:
         # inputs are all valid, make prediction
-        prediction = eff_classifier.predict(list(inputs.values()))
+        # identical inputs from any session are scored once (see pfas_score/cache.py)
+        with span("predict", page="effluent"):
+            prediction, probability = predict_cached("effluent", list(inputs.values()))
+        # appended to the prediction history off the request path (see pfas_score/history.py)
+        log_prediction("effluent", list(inputs.values()), prediction, probability, plant)
 
         if prediction == 0:
             st.write("Total PFAS risk is lower than 70 nanograms per liter (70 ng/L).")
         else:
-            st.write("Total PFAS risk is greater than 70 nanograms per liter (70 ng/L).")
\ No newline at end of file
+            st.write("Total PFAS risk is greater than 70 nanograms per liter (70 ng/L).")
+
+        # which inputs pushed the prediction up or down (see pfas_score/explain.py)
+        explanation("effluent", list(inputs.values()))
+
+# Sensitivity sweep - how the risk changes as one or two of the inputs above vary
+if mode == "Sensitivity sweep":
+    sensitivity_sweep("effluent", inputs)
+
+# Uncertainty - the share of high risk predictions when the inputs above carry measurement error
+if mode == "Uncertainty":
+    uncertainty_analysis("effluent", inputs)
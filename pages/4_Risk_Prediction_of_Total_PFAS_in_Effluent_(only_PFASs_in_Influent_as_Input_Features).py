@@ -1,6 +1,9 @@
 import streamlit as st
-import pickle
-import numpy as np
+
+from pfas_score.cache import predict_cached
+from pfas_score.history import log_prediction
+from pfas_score.metrics import span, timed
+from pfas_score.ui import explanation, input_mode, lab_report, sensitivity_sweep, uncertainty_analysis
 
 st.title("Risk Prediction of Total PFAS in Effluent (only PFASs in Influent as Input Features)")
 
@@ -14,40 +17,50 @@ st.write("""When using the model, please ensure that all input values are numeri
          the total PFAS risk in the effluent or biosolid. Providing more detailed PFAS information will yield more accurate results.
          """)
 
-# Specify the path to the model's .pkl file
-file_path = 'models/CatBoost_model_eff_web.pkl'
-
-# Open the file in binary read mode and load the model
-with open(file_path, 'rb') as file:
-    eff_classifier = pickle.load(file)
+# Input mode - one hand-typed sample, a whole lab export with one row per sample and
+# analyte, a sweep of one or two inputs around the typed sample, or its measurement
+# uncertainty
+mode = input_mode(["Single entry", "Lab report", "Sensitivity sweep", "Uncertainty"])
+if mode == "Lab report":
+    lab_report("effluent_pfas")
+    st.stop()
 
+@timed("validate", page="effluent_pfas")
 def check_input(input, title):
     try:
-        converted_input = np.float64(input)
+        converted_input = float(input)
         return converted_input
     except ValueError:
         st.error("Please enter a valid number for {0}".format(title))
         return False
 
-inputs = dict()
+# Inputs - collected in a form, so editing them does not rerun the page; they are
+# validated and scored once Make Prediction is clicked
+with st.form("inputs"), span("render", page="effluent_pfas"):
+    inputs = dict()
+
+    # INPUT - Plant (not a model input; recorded with the prediction in the prediction history)
+    plant = st.text_input("Plant name or ID (optional, recorded in the prediction history)", "")
+
+    chemicals = [
+        "PFBA (ng/L)", "PFPeA (ng/L)", "PFHxA (ng/L)", "PFHpA (ng/L)", "PFOA (ng/L)", 
+        "PFNA (ng/L)", "PFDA (ng/L)", "PFUnA (ng/L)", "PFDoA (ng/L)", "PFTrDA (ng/L)", 
+        "PFTA (ng/L)", "PFHxDA (ng/L)", "PFODA (ng/L)", "3:3 FTCA (ng/L)", "5:3 FTCA (ng/L)", 
+        "7:3 FTCA (ng/L)", "4:2 FTS (ng/L)", "6:2 FTS (ng/L)", "8:2 FTS (ng/L)", "10:2 FTS (ng/L)", 
+        "PFBS (ng/L)", "PFPeS (ng/L)", "PFHxS (ng/L)", "PFHpS (ng/L)", "PFOS (ng/L)", 
+        "PFNS (ng/L)", "PFDS (ng/L)", "PFDoS (ng/L)", "FOSA (ng/L)", "MeFOSA (ng/L)", 
+        "EtFOSA (ng/L)", "MeFOSE (ng/L)", "EtFOSE (ng/L)", "NMeFOSAA (ng/L)", "NEtFOSAA (ng/L)", 
+        "ADONA (ng/L)", "HFPO_DA (GenX) (ng/L)", "11ClPF3OUDS (ng/L)", "9ClPF3ONS (ng/L)"
+    ]
 
-chemicals = [
-    "PFBA (ng/L)", "PFPeA (ng/L)", "PFHxA (ng/L)", "PFHpA (ng/L)", "PFOA (ng/L)", 
-    "PFNA (ng/L)", "PFDA (ng/L)", "PFUnA (ng/L)", "PFDoA (ng/L)", "PFTrDA (ng/L)", 
-    "PFTA (ng/L)", "PFHxDA (ng/L)", "PFODA (ng/L)", "3:3 FTCA (ng/L)", "5:3 FTCA (ng/L)", 
-    "7:3 FTCA (ng/L)", "4:2 FTS (ng/L)", "6:2 FTS (ng/L)", "8:2 FTS (ng/L)", "10:2 FTS (ng/L)", 
-    "PFBS (ng/L)", "PFPeS (ng/L)", "PFHxS (ng/L)", "PFHpS (ng/L)", "PFOS (ng/L)", 
-    "PFNS (ng/L)", "PFDS (ng/L)", "PFDoS (ng/L)", "FOSA (ng/L)", "MeFOSA (ng/L)", 
-    "EtFOSA (ng/L)", "MeFOSE (ng/L)", "EtFOSE (ng/L)", "NMeFOSAA (ng/L)", "NEtFOSAA (ng/L)", 
-    "ADONA (ng/L)", "HFPO_DA (GenX) (ng/L)", "11ClPF3OUDS (ng/L)", "9ClPF3ONS (ng/L)"
-]
+    for chemical in chemicals:
+        value = st.text_input(chemical, "0")
+        inputs[chemical.lower().replace(" ", "_")] = check_input(value, chemical)
 
-for chemical in chemicals:
-    value = st.text_input(chemical, "0")
-    inputs[chemical.lower().replace(" ", "_")] = check_input(value, chemical)
+    submitted = st.form_submit_button("Make Prediction")
 
 # User Prediction
-if st.button("Make Prediction"):
+if submitted:
     # obtain any invalid inputs
     invalid_inputs = [key for key, value in inputs.items() if value is False]
 
@@ -57,8 +70,23 @@ if st.button("Make Prediction"):
         st.error("The following inputs are invalid: " + ", ".join(invalid_inputs))
     else:
         # inputs are all valid, make prediction
-        prediction = eff_classifier.predict(list(inputs.values()))
+        # identical inputs from any session are scored once (see pfas_score/cache.py)
+        with span("predict", page="effluent_pfas"):
+            prediction, probability = predict_cached("effluent_pfas", list(inputs.values()))
+        # appended to the prediction history off the request path (see pfas_score/history.py)
+        log_prediction("effluent_pfas", list(inputs.values()), prediction, probability, plant)
         if prediction == 0:
             st.write("Total PFAS is at low risk for detection in effluent.")
         else:
             st.write("Total PFAS is at high risk for detection in effluent.")
+
+        # which inputs pushed the prediction up or down (see pfas_score/explain.py)
+        explanation("effluent_pfas", list(inputs.values()))
+
+# Sensitivity sweep - how the risk changes as one or two of the inputs above vary
+if mode == "Sensitivity sweep":
+    sensitivity_sweep("effluent_pfas", inputs)
+
+# Uncertainty - the share of high risk predictions when the inputs above carry measurement error
+if mode == "Uncertainty":
+    uncertainty_analysis("effluent_pfas", inputs)
@@ -0,0 +1,95 @@
+import streamlit as st
+
+from pfas_score.features import MONTHS, PLANT_DEFAULTS
+from pfas_score.metrics import span
+from pfas_score.ui import batch_upload, input_mode
+
+st.title("Whole Plant Risk Prediction (Influent, Effluent and Biosolid)")
+
+# model description
+st.write("""This page runs the influent, effluent and biosolid models of the previous pages at once. The operational parameters
+         they share (year, month, influent/effluent volumes, ammonia, BOD, CBOD, TDS, TOC, TSS, pH, ...) are entered only once
+         and passed to each model, and all three total PFAS risks are predicted together.""")
+
+st.write("""When using the model, please ensure that all inputs are in the correct format. Input values should strictly be numerical
+         floats; avoid using letters or non-numeric characters. The default values visible upon loading the website are set to median
+         values derived from the dataset used during model training. These defaults serve as starting points for predictions and can
+         be adjusted based on your specific input data.
+         """)
+
+# Input mode - one plant-month typed by hand, or one row per plant-month in a CSV/Excel file
+if input_mode(["Single entry", "Batch upload"]) == "Batch upload":
+    batch_upload("plant")
+    st.stop()
+
+# labels of the inputs, as on the influent and effluent pages
+labels = {
+    "Flow (Influent)": "Flow in Influent (The flow rate of the influent to the facility (MGD))",
+    "Influent Volume": "Influent Volume (acre-feet/month)",
+    "Discharge Volume": "Discharge Volume in Influent (acre-feet/month)",
+    "Industrial Total": "Industrial Total in Influent (Percentage of total industrial inflow in all inflow) (%)",
+    "Total Ammonia (Influent)": "Total Ammonia in Influent (NH4 + NH3 (ng/L))",
+    "Biochemical Oxygen Demand (Influent)": "Biochemical Oxygen Demand in Influent (BOD was measured in 5 days at 20 deg. C (ng/L))",
+    "Carbonaceous Biochemical Oxygen Demand (Influent)": "Carbonaceous Biochemical Oxygen Demand in Influent (CBOD was measured in 5 days at 20 deg. C (ng/L))",
+    "Total Dissolved Solids (Influent)": "Total Dissolved Solids in Influent (TDS (ng/L))",
+    "Total Organic Carbon (Influent)": "Total Organic Carbon in Influent (TOC (ng/L))",
+    "Total Suspended Solids (Influent)": "Total Suspended Solids in Influent (TSS (ng/L))",
+    "pH (Influent)": "pH of Influent",
+    "Total Ammonia (Effluent)": "Total Ammonia in Effluent",
+    "Biochemical Oxygen Demand, Percent Removal (Effluent)": "Biochemical Oxygen Demand, Percent Removal in Effluent",
+    "Biochemical Oxygen Demand (Effluent)": "Biochemical Oxygen Demand in Effluent",
+    "Carbonaceous Biochemical Oxygen Demand (Effluent)": "Carbonaceous Biochemical Oxygen Demand in Effluent",
+    "Total Nitrate": "Total Nitrate in Effluent",
+    "Total Nitrite": "Total Nitrite in Effluent",
+    "Total Nitrogen": "Total Nitrogen in Effluent",
+    "Total Dissolved Solids (Effluent)": "Total Dissolved Solids in Effluent",
+    "Total Organic Carbon (Effluent)": "Total Organic Carbon in Effluent",
+    "Total Suspended Solids (Effluent)": "Total Suspended Solids in Effluent",
+    "Total Suspended Solids, Percent Removal (Effluent)": "Total Suspended Solids, Percent Removal in Effluent",
+    "pH (Effluent)": "pH of Effluent",
+}
+
+# Inputs - collected in a form, so editing them does not rerun the page; they are
+# validated and scored once Make Prediction is clicked
+with st.form("inputs"), span("render", page="plant"):
+    inputs = dict()
+
+    # INPUT - Year
+    inputs["Year"] = st.number_input("Select a Year", min_value=1900, max_value=2100, value=2024, step=1)
+
+    # INPUT - Month
+    selected_month = st.selectbox("Select a Month", MONTHS)
+    inputs["Month"] = MONTHS.index(selected_month) + 1
+
+    # INPUT - everything else, with the page 2 defaults
+    for feature, label in labels.items():
+        inputs[feature] = st.text_input(label, str(PLANT_DEFAULTS[feature]))
+
+    submitted = st.form_submit_button("Make Prediction")
+
+# User Prediction
+if submitted:
+    from pfas_score.plant import score_row
+
+    # the three models are scored concurrently (see pfas_score/plant.py)
+    with span("predict", page="plant"):
+        results, problems = score_row(inputs)
+
+    if problems:
+        # print an error message if any inputs are invalid
+        st.error("The following inputs are invalid:\n\n" + "\n".join("- " + problem for problem in problems))
+    else:
+        if results["influent"][0] == 0:
+            st.write("Influent: Total PFAS risk is lower than 70 nanograms per liter (70 ng/L).")
+        else:
+            st.write("Influent: Total PFAS risk is greater than 70 nanograms per liter (70 ng/L).")
+
+        if results["effluent"][0] == 0:
+            st.write("Effluent: Total PFAS risk is lower than 70 nanograms per liter (70 ng/L).")
+        else:
+            st.write("Effluent: Total PFAS risk is greater than 70 nanograms per liter (70 ng/L).")
+
+        if results["biosolid"][0] == 0:
+            st.write("Biosolid: Total PFAS is at low risk for detection in biosolids.")
+        else:
+            st.write("Biosolid: Total PFAS is at high risk for detection in biosolids.")
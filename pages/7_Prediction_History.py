@@ -0,0 +1,66 @@
+import datetime
+
+import altair as alt
+import streamlit as st
+
+from pfas_score.history import ENABLED, daily_counts, plants, recent
+from pfas_score.metrics import span
+
+st.title("Prediction History")
+
+st.write("""Every prediction made on pages 1-5, typed in, uploaded or scored in the background, is recorded with the model,
+         the model file it was made with, the plant it was entered for, its inputs and its result. Filter them by model,
+         plant and date below.""")
+
+if not ENABLED:
+    st.info("The prediction history is turned off on this server (PFAS_HISTORY=0); showing what was recorded before.")
+
+# the models of pages 1-5
+MODEL_NAMES = {
+    "influent": "Influent (page 1)",
+    "effluent": "Effluent (page 2)",
+    "biosolid": "Biosolid (page 3)",
+    "effluent_pfas": "Effluent from influent PFAS (page 4)",
+    "biosolid_pfas": "Biosolid from influent PFAS (page 5)",
+}
+
+# Filters - model, plant and a range of UTC days
+today = datetime.datetime.now(datetime.timezone.utc).date()
+left, middle, right = st.columns(3)
+models = left.multiselect("Models", list(MODEL_NAMES), format_func=MODEL_NAMES.get, placeholder="All models")
+plant = middle.selectbox("Plant", [""] + plants(), format_func=lambda plant: plant or "All plants")
+dates = right.date_input("Days (UTC)", value=(today - datetime.timedelta(days=30), today), max_value=today)
+# a single day while the end of the range is being picked
+start, end = (dates[0], dates[-1]) if dates else (None, None)
+
+with span("query", page="history"):
+    counts = daily_counts(models, plant, start, end)
+    latest = recent(models, plant, start, end)
+
+if counts.empty:
+    st.write("No predictions were recorded for these filters.")
+    st.stop()
+
+# Totals
+total, high_risk = int(counts["predictions"].sum()), int(counts["high_risk"].sum())
+left, middle, right = st.columns(3)
+left.metric("Predictions", "{0:,}".format(total))
+middle.metric("High risk", "{0:,}".format(high_risk))
+right.metric("Share high risk", "{0:.1%}".format(high_risk / total))
+
+# Predictions per day and model
+counts["model"] = counts["model_id"].map(MODEL_NAMES).fillna(counts["model_id"])
+chart = alt.Chart(counts).mark_bar().encode(
+    x=alt.X("day:T", title="Day (UTC)"),
+    y=alt.Y("predictions:Q", title="Predictions"),
+    color=alt.Color("model:N", title=None),
+    tooltip=["day:T", "model:N", "predictions:Q", "high_risk:Q"])
+st.altair_chart(chart, use_container_width=True)
+
+# Latest predictions, with their inputs when a single model is selected
+st.subheader("Latest predictions")
+st.caption("The {0} most recent of these predictions{1}. The model file is identified by the start of its SHA-256.".format(
+    len(latest), "" if len(models) == 1 else "; select a single model to see their inputs"))
+st.dataframe(latest, hide_index=True)
+st.download_button("Download these predictions", latest.to_csv(index=False).encode("utf-8"),
+                   file_name="prediction_history.csv", mime="text/csv")
@@ -0,0 +1,78 @@
+import time
+
+import altair as alt
+import streamlit as st
+
+from pfas_score.metrics import span
+from pfas_score.statewide import county_table, last_refresh, plant_table
+
+st.title("Statewide Risk Map")
+
+st.write("""Total PFAS risk of every WWTP in the plant table, predicted with the influent, effluent and biosolid models of
+         pages 1-3 and totalled by county. The predictions are computed ahead of time and only read here: after plant
+         inputs change, an administrator refreshes the plants and counties affected with
+         `python -m pfas_score.statewide refresh plants.csv`.""")
+
+latest = last_refresh()
+if latest is None:
+    st.info("No plant table has been scored yet. Run `python -m pfas_score.statewide refresh plants.csv` with one WWTP "
+            "per row: a Plant and a County column, optional Latitude and Longitude, and the inputs of the whole plant page.")
+    st.stop()
+
+
+@st.cache_data(show_spinner=False, max_entries=2)
+def load_tables(refreshed):
+    # read once per refresh of the store
+    return county_table(), plant_table()
+
+
+with span("render", page="statewide"):
+    counties, plants = load_tables(latest["time"])
+
+# Model - which of the three risks to map
+models = {"Influent": "influent", "Effluent": "effluent", "Biosolid": "biosolid"}
+model_id = models[st.radio("Risk", list(models), horizontal=True)]
+high_risk, mean_probability = "{0}_high_risk".format(model_id), "{0}_mean_probability".format(model_id)
+counties["share_high_risk"] = counties[high_risk] / counties["plants"]
+
+# Totals
+left, middle, right = st.columns(3)
+left.metric("Plants", "{0:,}".format(len(plants)))
+middle.metric("Counties", "{0:,}".format(len(counties)))
+right.metric("Plants at high risk", "{0:,}".format(int(counties[high_risk].sum())))
+
+# Map - one circle per county at the mean position of its plants, sized by the
+# number of plants and coloured by the share of them at high risk
+located = counties.dropna(subset=["latitude", "longitude"])
+color = alt.Color("share_high_risk:Q", title="Share at high risk", scale=alt.Scale(domain=[0, 1], scheme="reds"))
+tooltip = ["county:N", "plants:Q", alt.Tooltip("{0}:Q".format(high_risk), title="high risk"),
+           alt.Tooltip("share_high_risk:Q", title="share", format=".0%"),
+           alt.Tooltip("{0}:Q".format(mean_probability), title="mean probability", format=".2f")]
+if located.empty:
+    # no coordinates in the plant table
+    chart = alt.Chart(counties).mark_bar().encode(
+        x=alt.X("share_high_risk:Q", title="Share of plants at high risk", scale=alt.Scale(domain=[0, 1])),
+        y=alt.Y("county:N", sort="-x", title=None), color=color, tooltip=tooltip)
+else:
+    chart = alt.Chart(located).mark_circle(opacity=0.8, stroke="black", strokeWidth=0.5).encode(
+        longitude="longitude:Q", latitude="latitude:Q",
+        size=alt.Size("plants:Q", title="Plants", scale=alt.Scale(range=[30, 1500])),
+        color=color, tooltip=tooltip).project(type="mercator").properties(height=600)
+    if st.checkbox("Show individual plants"):
+        points = alt.Chart(plants.dropna(subset=["latitude", "longitude"])).mark_point(size=12).encode(
+            longitude="longitude:Q", latitude="latitude:Q",
+            color=alt.Color("{0}_prediction:N".format(model_id), title="Prediction",
+                            scale=alt.Scale(domain=[0, 1], range=["#1f77b4", "#d62728"])),
+            tooltip=["plant:N", "county:N", alt.Tooltip("{0}_probability:Q".format(model_id), format=".2f")])
+        chart = chart + points
+st.altair_chart(chart, use_container_width=True)
+
+# Counties
+st.subheader("Counties")
+table = counties[["county", "plants", high_risk, "share_high_risk", mean_probability]].sort_values(
+    "share_high_risk", ascending=False)
+table.columns = ["County", "Plants", "High risk", "Share at high risk", "Mean probability of high risk"]
+st.dataframe(table, hide_index=True)
+st.caption("Last refreshed {0}: {1} plants scored, {2} removed, {3} counties recomputed.".format(
+    time.strftime("%Y-%m-%d %H:%M", time.localtime(latest["time"])), latest["scored"], latest["removed"],
+    latest["counties"]))
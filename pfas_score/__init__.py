@@ -0,0 +1 @@
+"""Shared scoring code for the PFAS risk prediction pages."""
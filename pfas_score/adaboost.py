@@ -0,0 +1,202 @@
+"""Vectorized evaluation of the AdaBoost biosolid model.
+
+    python -m pfas_score.adaboost export       # compile, verify and record the AdaBoost model
+    python -m pfas_score.adaboost verify       # re-check the export against the pickle
+    python -m pfas_score.adaboost benchmark    # rows/s for 1, 1k and 1M rows, NumPy vs scikit-learn
+
+scikit-learn's ``AdaBoostClassifier`` calls every fitted tree in a Python loop.
+Here the trees are stacked into padded ``(estimators, nodes)`` arrays and walked
+all at once, one level per step, and each leaf stores its finished
+contribution to the decision function. Scoring a batch is then ``max_depth``
+gathers plus one sum over the estimators, computed with the same arithmetic,
+in the same order, as scikit-learn, so the results are identical.
+"""
+
+import sys
+
+import numpy as np
+
+from .exports import ExportFormat
+from .registry import load_pickle, model_path
+from .store import load_arrays, save_arrays
+
+# bound on the estimators x rows node indices materialized per chunk
+_CHUNK_NODES = 1 << 22
+
+
+class BoostedTreesModel:
+    """An ``AdaBoostClassifier`` of decision trees as stacked NumPy arrays.
+
+    Node ``i`` of estimator ``e`` tests ``X[:, feature[e, i]] <= threshold[e, i]``
+    and continues with ``left[e, i]`` or ``right[e, i]``; leaves point to
+    themselves. ``leaf_values[e, i]`` is what a row ending in node ``i`` adds
+    to the decision function, already including the estimator weight.
+    """
+
+    def __init__(self, feature, threshold, left, right, leaf_values, weight_sum, max_depth, classes):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.leaf_values = leaf_values
+        self.weight_sum = float(weight_sum)
+        self.max_depth = int(max_depth)
+        self.classes_ = classes
+        self.n_features = int(feature.max()) + 1
+
+    @classmethod
+    def from_sklearn(cls, model):
+        """Compile a fitted AdaBoostClassifier (or a GridSearchCV around one)."""
+        model = getattr(model, "best_estimator_", model)
+        estimators = model.estimators_
+        n_classes = model.n_classes_
+        nodes = max(estimator.tree_.node_count for estimator in estimators)
+
+        feature = np.zeros((len(estimators), nodes), dtype=np.int32)
+        threshold = np.full((len(estimators), nodes), np.inf)
+        left = np.tile(np.arange(nodes, dtype=np.int32), (len(estimators), 1))
+        right = left.copy()
+        leaf_values = np.zeros((len(estimators), nodes, n_classes))
+
+        for e, (estimator, weight) in enumerate(zip(estimators, model.estimator_weights_)):
+            tree = estimator.tree_
+            count = tree.node_count
+            internal = tree.children_left != -1
+            feature[e, :count] = np.where(internal, tree.feature, 0)
+            threshold[e, :count] = np.where(internal, tree.threshold, np.inf)
+            left[e, :count] = np.where(internal, tree.children_left, np.arange(count))
+            right[e, :count] = np.where(internal, tree.children_right, np.arange(count))
+
+            # DecisionTreeClassifier.predict_proba for every node
+            proba = tree.value[:, 0, :n_classes].copy()
+            normalizer = proba.sum(axis=1)[:, np.newaxis]
+            normalizer[normalizer == 0.0] = 1.0
+            proba /= normalizer
+
+            if model.algorithm == "SAMME.R":
+                # sklearn.ensemble._weight_boosting._samme_proba
+                np.clip(proba, np.finfo(proba.dtype).eps, None, out=proba)
+                log_proba = np.log(proba)
+                values = (n_classes - 1) * (
+                    log_proba - (1.0 / n_classes) * log_proba.sum(axis=1)[:, np.newaxis])
+            else:
+                # SAMME: the weighted vote of the predicted class
+                predicted = estimator.classes_.take(np.argmax(proba, axis=1), axis=0)
+                values = (predicted[:, np.newaxis] == model.classes_[np.newaxis, :]) * weight
+            leaf_values[e, :count] = values
+
+        return cls(feature, threshold, left, right, leaf_values, model.estimator_weights_.sum(),
+                   max(estimator.tree_.max_depth for estimator in estimators), np.asarray(model.classes_))
+
+    def save(self, path):
+        save_arrays(path, feature=self.feature, threshold=self.threshold, left=self.left, right=self.right,
+                 leaf_values=self.leaf_values, weight_sum=np.array(self.weight_sum),
+                 max_depth=np.array(self.max_depth), classes=self.classes_)
+
+    @classmethod
+    def load(cls, path, mmap=None):
+        """Load an export, mapped read-only and shared between processes by default (see pfas_score/store.py)."""
+        arrays = load_arrays(path, mmap)
+        return cls(arrays["feature"], arrays["threshold"], arrays["left"], arrays["right"],
+                   arrays["leaf_values"], arrays["weight_sum"], arrays["max_depth"], arrays["classes"])
+
+    def row_chunks(self, X):
+        """Yield ``(start, chunk)`` slices of the rows of ``X``, small enough for one ``walk``."""
+        size = max(1, _CHUNK_NODES // len(self.feature))
+        for start in range(0, len(X), size):
+            yield start, X[start:start + size]
+
+    def walk(self, X, step=None):
+        """The node every row of ``X`` ends in, in every estimator, as ``(estimators, rows)`` indices.
+
+        All trees are walked at once, one level per step; ``step(node, child)``
+        is called with the nodes before and after every step.
+        """
+        rows = np.arange(len(X))[np.newaxis, :]
+        estimators = np.arange(len(self.feature))[:, np.newaxis]
+        node = np.zeros((len(self.feature), len(X)), dtype=np.intp)
+        for _ in range(self.max_depth):
+            goes_left = X[rows, self.feature[estimators, node]] <= self.threshold[estimators, node]
+            child = np.where(goes_left, self.left[estimators, node], self.right[estimators, node])
+            if step is not None:
+                step(node, child)
+            node = child
+        return node
+
+    def decision_function(self, X):
+        """Same as ``AdaBoostClassifier.decision_function``."""
+        # decision trees compare the float32 value of every feature
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] < self.n_features:
+            raise ValueError("Expected a 2-D array with at least {0} features".format(self.n_features))
+        # scikit-learn refuses missing and infinite values; walked, they would be scored
+        if not np.isfinite(X).all():
+            if np.isnan(X).any():
+                raise ValueError("Input X contains NaN.")
+            raise ValueError("Input X contains infinity or a value too large for dtype('float32').")
+
+        estimators = np.arange(len(self.feature))[:, np.newaxis]
+        pred = np.empty((len(X), self.leaf_values.shape[2]))
+        for start, chunk in self.row_chunks(X):
+            # (estimators, rows, classes) summed over the estimators one after another,
+            # like the sum() over estimators in AdaBoostClassifier.decision_function
+            pred[start:start + len(chunk)] = self.leaf_values[estimators, self.walk(chunk)].sum(axis=0)
+        pred /= self.weight_sum
+        if len(self.classes_) == 2:
+            pred[:, 0] *= -1
+            return pred.sum(axis=1)
+        return pred
+
+    def predict_proba(self, X):
+        """Same as ``AdaBoostClassifier.predict_proba``."""
+        decision = self.decision_function(X)
+        if len(self.classes_) == 2:
+            decision = np.vstack([-decision, decision]).T / 2
+        else:
+            decision /= len(self.classes_) - 1
+        # sklearn.utils.extmath.softmax
+        decision -= np.max(decision, axis=1).reshape((-1, 1))
+        np.exp(decision, decision)
+        decision /= np.sum(decision, axis=1).reshape((-1, 1))
+        return decision
+
+    def predict(self, X):
+        """Same as ``AdaBoostClassifier.predict``."""
+        pred = self.decision_function(X)
+        if len(self.classes_) == 2:
+            return self.classes_.take(pred > 0, axis=0)
+        return self.classes_.take(np.argmax(pred, axis=1), axis=0)
+
+
+def _save(model, path):
+    BoostedTreesModel.from_sklearn(model).save(path)
+
+
+FORMAT = ExportFormat("AdaBoostClassifier", ".npz", "adaboost.json", _save, BoostedTreesModel.load)
+
+verified_export = FORMAT.verified_export
+
+
+def benchmark(model_id, sizes=(1, 1000, 1000000)):
+    """Rows per second of the NumPy and the scikit-learn model for every batch size."""
+    from .corpus import rows_per_second, synthetic_corpus
+
+    arrays = BoostedTreesModel.load(verified_export(model_id) or FORMAT.path(model_id))
+    pickled = load_pickle(model_path(model_id))
+    X = synthetic_corpus(model_id, max(sizes))
+    return [(size, rows_per_second(arrays.predict_proba, X[:size]),
+             rows_per_second(pickled.predict_proba, X[:size])) for size in sizes]
+
+
+def _benchmark(model_id, path):
+    return ["{0:<15} {1:>8} rows   numpy {2:>12,.0f} rows/s   sklearn {3:>12,.0f} rows/s".format(
+        model_id, size, numpy_rate, sklearn_rate) for size, numpy_rate, sklearn_rate in benchmark(model_id)]
+
+
+def main(argv=None):
+    return FORMAT.main(argv, "python -m pfas_score.adaboost",
+                       "Compile the AdaBoost models to stacked NumPy arrays.", _benchmark)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,214 @@
+"""Validate and score whole tables of samples in one vectorized call."""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from .features import DEFAULTS, FEATURES, INTEGER_FEATURES, RANGES
+from .registry import get_model
+
+PREDICTION_COLUMN = "Prediction"
+PROBABILITY_COLUMN = "Probability of High Risk"
+
+# row numbers listed per invalid column before the message is truncated
+_MAX_LISTED_ROWS = 5
+
+
+def _normalize(name):
+    return " ".join(str(name).split()).lower()
+
+
+def read_table(file, name=None):
+    """Read an uploaded CSV or Excel file into a DataFrame.
+
+    ``file`` can be a path or a file-like object; ``name`` is used to pick the
+    format when ``file`` has no usable file name of its own.
+    """
+    name = name or getattr(file, "name", None) or str(file)
+    extension = os.path.splitext(name)[1].lower()
+    if extension in (".xlsx", ".xls"):
+        try:
+            return pd.read_excel(file)
+        except ImportError:
+            raise ValueError("Reading Excel files requires openpyxl, please upload a CSV file instead.") from None
+    return pd.read_csv(file)
+
+
+def match_columns(frame, model_id):
+    """Map each feature of ``model_id`` to the column of ``frame`` holding it.
+
+    Column names are matched ignoring case and repeated whitespace. Returns the
+    mapping and the list of features that have no column.
+    """
+    available = {_normalize(column): column for column in frame.columns}
+    mapping = {}
+    missing = []
+    for feature in FEATURES[model_id]:
+        column = available.get(_normalize(feature))
+        if column is None:
+            missing.append(feature)
+        else:
+            mapping[feature] = column
+    return mapping, missing
+
+
+def row_list(index, mask):
+    """The rows of ``index`` selected by ``mask`` for a message, numbered as in the spreadsheet."""
+    # below the header row, so the first data row is row 2
+    rows = (np.asarray(index)[mask] + 2).tolist()
+    listed = ", ".join(str(row) for row in rows[:_MAX_LISTED_ROWS])
+    if len(rows) > _MAX_LISTED_ROWS:
+        listed += " and {0} more".format(len(rows) - _MAX_LISTED_ROWS)
+    return listed
+
+
+def _invalid_values(values, feature):
+    """Return a ``(mask, reason)`` pair for every check ``values`` fails."""
+    failed = []
+    finite = np.isfinite(values)
+    if not finite.all():
+        failed.append((~finite, "not a valid number"))
+
+    if feature in INTEGER_FEATURES:
+        fractional = finite & (values != np.round(values))
+        if fractional.any():
+            failed.append((fractional, "not a whole number"))
+
+    if feature in RANGES:
+        low, high = RANGES[feature]
+        outside = finite & ((values < low) | (values > high))
+        if outside.any():
+            failed.append((outside, "must be between {0} and {1}".format(low, high)))
+
+    return failed
+
+
+def check_frame(frame, mapping, model_id):
+    """Check the columns of ``frame`` given by ``mapping`` (see ``match_columns``).
+
+    Returns ``(X, problems, invalid_rows)``: the float64 feature matrix with
+    NaN wherever a value is invalid, one message per failed check of a
+    column, and the boolean mask of the rows with an invalid value.
+    """
+    features = FEATURES[model_id]
+    X = np.empty((len(frame), len(features)), dtype=np.float64)
+    invalid_rows = np.zeros(len(frame), dtype=bool)
+    problems = []
+    for j, feature in enumerate(features):
+        values = pd.to_numeric(frame[mapping[feature]], errors="coerce").to_numpy(dtype=np.float64)
+        invalid = np.zeros(len(frame), dtype=bool)
+        for mask, reason in _invalid_values(values, feature):
+            problems.append("{0}: {1} in row(s) {2}".format(feature, reason, row_list(frame.index, mask)))
+            invalid |= mask
+        if invalid.any():
+            values = np.where(invalid, np.nan, values)
+            invalid_rows |= invalid
+        X[:, j] = values
+    return X, problems, invalid_rows
+
+
+def validate_frame(frame, model_id):
+    """Check every feature column of ``frame`` at once.
+
+    Returns ``(X, problems)`` where ``X`` is the float64 feature matrix in model
+    input order and ``problems`` lists one message per failed check of a column.
+    ``X`` is None whenever ``problems`` is not empty.
+    """
+    mapping, missing = match_columns(frame, model_id)
+    if missing:
+        return None, ["Missing columns: " + ", ".join(missing)]
+    if frame.empty:
+        return None, ["The file does not contain any rows."]
+
+    X, problems, _ = check_frame(frame, mapping, model_id)
+    if problems:
+        return None, problems
+    return X, problems
+
+
+def validate_row(values, model_id):
+    """Check a single sample given as ``{feature: value}`` or as values in model input order.
+
+    Returns ``(row, problems)`` like ``validate_frame``, with ``row`` a 1-D
+    float64 array.
+    """
+    features = FEATURES[model_id]
+    if isinstance(values, dict):
+        missing = [feature for feature in features if feature not in values]
+        if missing:
+            return None, ["Missing inputs: " + ", ".join(missing)]
+        values = [values[feature] for feature in features]
+    elif len(values) != len(features):
+        return None, ["Expected {0} inputs, got {1}".format(len(features), len(values))]
+
+    row = np.empty(len(features), dtype=np.float64)
+    problems = []
+    for j, (feature, value) in enumerate(zip(features, values)):
+        try:
+            row[j] = float(value)
+        except (TypeError, ValueError):
+            row[j] = np.nan
+        for _, reason in _invalid_values(row[j:j + 1], feature):
+            problems.append("{0}: {1}".format(feature, reason))
+
+    if problems:
+        return None, problems
+    return row, problems
+
+
+def predict_matrix(X, model_id, classifier=None):
+    """Score a feature matrix with a single ``predict_proba`` call.
+
+    Returns ``(predictions, probabilities)``: the 0/1 class of each row and the
+    probability of the high risk class.
+    """
+    if classifier is None:
+        classifier = get_model(model_id)
+    proba = classifier.predict_proba(X)
+    predictions = np.asarray(classifier.classes_).take(proba.argmax(axis=1)).astype(np.int64)
+    return predictions, proba[:, 1]
+
+
+def score_frame(frame, model_id, classifier=None, skip_invalid=False):
+    """Validate and score ``frame``; returns ``(result, problems)``.
+
+    ``result`` is a copy of ``frame`` with the prediction and the probability
+    of high risk appended, or None if the file did not validate. With
+    ``skip_invalid`` the valid rows are still scored and the invalid ones are
+    left without a prediction; ``problems`` then describes the skipped rows.
+    """
+    mapping, missing = match_columns(frame, model_id)
+    if missing:
+        return None, ["Missing columns: " + ", ".join(missing)]
+    if frame.empty:
+        return None, ["The file does not contain any rows."]
+
+    X, problems, invalid_rows = check_frame(frame, mapping, model_id)
+    if problems and not skip_invalid:
+        return None, problems
+
+    result = frame.copy()
+    if not problems:
+        predictions, probabilities = predict_matrix(X, model_id, classifier)
+        result[PREDICTION_COLUMN] = predictions
+        result[PROBABILITY_COLUMN] = probabilities
+        return result, problems
+
+    predictions = pd.array([pd.NA] * len(frame), dtype="Int64")
+    probabilities = np.full(len(frame), np.nan)
+    valid = ~invalid_rows
+    if valid.any():
+        predictions[valid], probabilities[valid] = predict_matrix(X[valid], model_id, classifier)
+    result[PREDICTION_COLUMN] = predictions
+    result[PROBABILITY_COLUMN] = probabilities
+    return result, problems
+
+
+def template_csv(model_id):
+    """A one-row CSV with every expected column, filled with the page defaults."""
+    return to_csv_bytes(pd.DataFrame([DEFAULTS[model_id]]))
+
+
+def to_csv_bytes(frame):
+    return frame.to_csv(index=False).encode("utf-8")
@@ -0,0 +1,288 @@
+"""Performance benchmarks of the app, compared against a stored baseline.
+
+    python -m pfas_score.benchmark                          # run, write benchmarks/latest.json, compare
+    python -m pfas_score.benchmark --update-baseline        # run and store the result as the new baseline
+    python -m pfas_score.benchmark --compare results.json   # compare an earlier run without measuring
+
+The pages are driven headlessly through Streamlit's app testing harness
+(``streamlit.testing.v1.AppTest``). Measured:
+
+- cold start: a fresh interpreter importing streamlit and running a page once
+- rerun latency: median wall time of a rerun of a warm page, and of a rerun
+  that submits the inputs and predicts
+- model load: seconds to unpickle each ``.pkl`` in a fresh interpreter (this
+  includes importing catboost/sklearn), and to load the form the app serves
+- predict throughput: rows/s of the served model for single rows and for
+  batches of ``BATCH_ROWS``
+
+Timings depend on the machine, so compare runs from the same machine only. A
+metric regresses when it is worse than the baseline by more than the tolerance.
+The baseline is recorded with the models served from their verified array
+exports (``models/native/``, not under version control), so build them before
+comparing; the load and predict metrics of a model served in another format
+than in the baseline are left out of the comparison.
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+from .registry import MODEL_FILES, ROOT_DIR, get_model_with_info
+
+BENCHMARKS_DIR = os.path.join(ROOT_DIR, "benchmarks")
+BASELINE_PATH = os.path.join(BENCHMARKS_DIR, "baseline.json")
+LATEST_PATH = os.path.join(BENCHMARKS_DIR, "latest.json")
+
+# page id -> script, relative to ROOT_DIR
+PAGES = {
+    "home": "Home.py",
+    "influent": "pages/1_*.py",
+    "effluent": "pages/2_*.py",
+    "biosolid": "pages/3_*.py",
+    "effluent_pfas": "pages/4_*.py",
+    "biosolid_pfas": "pages/5_*.py",
+    "plant": "pages/6_*.py",
+}
+
+RERUNS = 10
+BATCH_ROWS = 10000
+
+# a metric may be this much worse than the baseline (0.5 = 50%) before it is
+# reported; single runs of sub-second timings are noisy
+DEFAULT_TOLERANCE = 0.5
+
+
+def page_path(page_id):
+    return glob.glob(os.path.join(ROOT_DIR, PAGES[page_id]))[0]
+
+
+def _metric(value, unit, better="lower"):
+    return {"value": value, "unit": unit, "better": better}
+
+
+def _run_fresh(code):
+    output = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True,
+                            cwd=ROOT_DIR).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+_COLD_START = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+imported = time.perf_counter()
+at = AppTest.from_file({path!r}, default_timeout=120).run()
+print(json.dumps([imported - start, time.perf_counter() - imported]))
+"""
+
+
+def cold_start(page_id):
+    """Seconds to import streamlit and to run ``page_id`` once, in a fresh interpreter."""
+    return _run_fresh(_COLD_START.format(root=ROOT_DIR, path=page_path(page_id)))
+
+
+def _submit_button(at):
+    return next((button for button in at.button if button.label == "Make Prediction"), None)
+
+
+def rerun_latency(page_id, reruns=RERUNS):
+    """Median seconds of a plain rerun and of a predicting rerun (None for the home page)."""
+    from streamlit.testing.v1 import AppTest
+
+    def check():
+        # a rerun that raised must not be timed as a success
+        if at.exception:
+            raise RuntimeError("{0} failed: {1}".format(page_id, at.exception[0].message))
+
+    at = AppTest.from_file(page_path(page_id), default_timeout=120).run()
+    check()
+
+    def median_seconds(action):
+        times = []
+        for _ in range(reruns):
+            start = time.perf_counter()
+            action()
+            times.append(time.perf_counter() - start)
+            check()
+        return statistics.median(times)
+
+    plain = median_seconds(at.run)
+    predict = None
+    if _submit_button(at) is not None:
+        predict = median_seconds(lambda: _submit_button(at).click().run())
+    return plain, predict
+
+
+_MODEL_LOAD = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+from pfas_score import registry
+start = time.perf_counter()
+registry.load_pickle(registry.model_path({model_id!r}))
+print(json.dumps(time.perf_counter() - start))
+"""
+
+_SERVED_LOAD = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+from pfas_score import registry
+start = time.perf_counter()
+model, info = registry.get_model_with_info({model_id!r})
+print(json.dumps([time.perf_counter() - start, info.format]))
+"""
+
+
+def model_load(model_id):
+    """``(pickle seconds, served seconds, served format)`` of ``model_id``, each in a fresh interpreter."""
+    pickle_seconds = _run_fresh(_MODEL_LOAD.format(root=ROOT_DIR, model_id=model_id))
+    served_seconds, served_format = _run_fresh(_SERVED_LOAD.format(root=ROOT_DIR, model_id=model_id))
+    return pickle_seconds, served_seconds, served_format
+
+
+def predict_throughput(model_id, batch_rows=BATCH_ROWS):
+    """Rows/s of the served model, one row per call and ``batch_rows`` rows per call."""
+    from .corpus import rows_per_second, synthetic_corpus
+
+    classifier, _ = get_model_with_info(model_id)
+    X = synthetic_corpus(model_id, batch_rows)
+    return rows_per_second(classifier.predict_proba, X[:1]), rows_per_second(classifier.predict_proba, X)
+
+
+def run(log=print):
+    """Measure everything; returns the result document."""
+    import catboost
+    import numpy
+    import sklearn
+    import streamlit
+
+    metrics = {}
+    for page_id in PAGES:
+        log("page  {0}".format(page_id))
+        import_seconds, first_run = cold_start(page_id)
+        metrics["cold_start.import_streamlit." + page_id] = _metric(import_seconds, "s")
+        metrics["cold_start.first_run." + page_id] = _metric(first_run, "s")
+        plain, predict = rerun_latency(page_id)
+        metrics["rerun." + page_id] = _metric(plain, "s")
+        if predict is not None:
+            metrics["rerun_predict." + page_id] = _metric(predict, "s")
+
+    for model_id in MODEL_FILES:
+        log("model {0}".format(model_id))
+        pickle_seconds, served_seconds, _ = model_load(model_id)
+        metrics["model_load.pickle." + model_id] = _metric(pickle_seconds, "s")
+        metrics["model_load.served." + model_id] = _metric(served_seconds, "s")
+        single, batch = predict_throughput(model_id)
+        metrics["predict.single." + model_id] = _metric(single, "rows/s", "higher")
+        metrics["predict.batch_{0}.{1}".format(BATCH_ROWS, model_id)] = _metric(batch, "rows/s", "higher")
+
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "streamlit": streamlit.__version__,
+            "numpy": numpy.__version__,
+            "catboost": catboost.__version__,
+            "sklearn": sklearn.__version__,
+            "served_formats": {model_id: get_model_with_info(model_id)[1].format for model_id in MODEL_FILES},
+        },
+        "metrics": metrics,
+    }
+
+
+def _served_model(name):
+    # the model whose served format a metric depends on, or None
+    if name.startswith(("model_load.served.", "predict.")):
+        return name.rsplit(".", 1)[1]
+    return None
+
+
+def compare(result, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Compare the metrics in both documents.
+
+    Returns ``(rows, skipped)``: rows of ``(metric, baseline, current, change,
+    regressed)``, and the ``(model id, baseline format, current format)`` of
+    the models served in another format than in the baseline, whose load and
+    predict metrics are left out.
+    """
+    formats = result["environment"].get("served_formats", {})
+    baseline_formats = baseline["environment"].get("served_formats", {})
+    skipped = sorted((model_id, baseline_formats[model_id], served) for model_id, served in formats.items()
+                     if model_id in baseline_formats and baseline_formats[model_id] != served)
+    different = {model_id for model_id, _, _ in skipped}
+    rows = []
+    for name, metric in result["metrics"].items():
+        before = baseline["metrics"].get(name)
+        if before is None or not before["value"] or _served_model(name) in different:
+            continue
+        change = metric["value"] / before["value"] - 1
+        worse = change if metric["better"] == "lower" else -change
+        rows.append((name, before["value"], metric["value"], change, worse > tolerance))
+    return rows, skipped
+
+
+def _read(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+def _write(path, result):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as file:
+        json.dump(result, file, indent=2, sort_keys=True)
+        file.write("\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m pfas_score.benchmark",
+                                     description="Benchmark the app and compare with the stored baseline.")
+    parser.add_argument("--compare", metavar="RESULTS", help="compare this results file instead of measuring")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline file (default: %(default)s)")
+    parser.add_argument("--output", "-o", default=LATEST_PATH, help="results file (default: %(default)s)")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed relative regression (default: %(default)s)")
+    parser.add_argument("--update-baseline", action="store_true", help="store the results as the new baseline")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        result = _read(args.compare)
+    else:
+        try:
+            result = run(log=lambda message: print(message, file=sys.stderr))
+        except RuntimeError as error:
+            print("error: {0}".format(error), file=sys.stderr)
+            return 1
+        _write(args.output, result)
+    if args.update_baseline:
+        _write(args.baseline, result)
+        print("Baseline written to {0}".format(os.path.relpath(args.baseline)))
+        return 0
+    if not os.path.exists(args.baseline):
+        print("No baseline at {0}, run with --update-baseline".format(os.path.relpath(args.baseline)))
+        return 1
+
+    rows, skipped = compare(result, _read(args.baseline), args.tolerance)
+    for model_id, before, served in skipped:
+        print("{0}: served as {1}, but as {2} in the baseline; its load and predict metrics are not compared".format(
+            model_id, served, before))
+    if skipped:
+        print("Build the exports first (python -m pfas_score.oblivious export, python -m pfas_score.adaboost export)\n")
+    print("{0:<42} {1:>12} {2:>12} {3:>8}".format("metric", "baseline", "current", "change"))
+    for name, before, after, change, regressed in rows:
+        print("{0:<42} {1:>12.4g} {2:>12.4g} {3:>+7.0%}{4}".format(
+            name, before, after, change, "  REGRESSION" if regressed else ""))
+    regressions = sum(regressed for *_, regressed in rows)
+    print("{0} of {1} metrics regressed by more than {2:.0%}".format(regressions, len(rows), args.tolerance))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+"""Prediction cache shared by every session of the app.
+
+Most users submit the defaults of a page unchanged (the training medians on
+pages 1-3, all zeros on pages 4-5), and each click would otherwise call the
+model again. Single-row predictions are cached per process, keyed by the model
+id, the SHA-256 of the model file and the feature values. The registry reloads a
+model whose file changed, which changes the hash, so stale predictions are never
+served; they are dropped as soon as the new model is seen.
+
+Concurrent requests for a key that is being computed wait for that computation
+instead of calling the model again.
+"""
+
+import collections
+import math
+import threading
+from concurrent.futures import Future
+
+from .metrics import span
+from .registry import get_model_with_info
+
+DEFAULT_MAX_ENTRIES = 4096
+
+
+def canonical_row(values):
+    """Hashable form of a feature row: floats, with -0.0 and NaN normalized."""
+    row = []
+    for value in values:
+        value = float(value)
+        row.append(None if math.isnan(value) else value + 0.0)
+    return tuple(row)
+
+
+class PredictionCache:
+    """Bounded LRU cache of ``(prediction, probability)`` per feature row.
+
+    Subclasses cache other per-row results by overriding ``_compute``.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self._in_flight = {}
+        # model id -> SHA-256 of the model the cached entries were computed with
+        self._hashes = {}
+        self.hits = 0
+        self.misses = 0
+        # requests that waited for an identical in-flight request
+        self.shared = 0
+        self.evictions = 0
+
+    def _drop_model(self, model_id):
+        for key in [key for key in self._entries if key[0] == model_id]:
+            del self._entries[key]
+
+    def predict(self, model_id, values):
+        """``(prediction, probability of high risk)`` of one row of ``values``."""
+        return self.get(model_id, values)
+
+    def _compute(self, model_id, classifier, values):
+        with span("model_predict", model=model_id):
+            proba = classifier.predict_proba([list(values)])[0]
+        return int(classifier.classes_[int(proba.argmax())]), float(proba[1])
+
+    def get(self, model_id, values):
+        """The result of ``_compute`` for one row of ``values``, computed once per model file."""
+        classifier, info = get_model_with_info(model_id)
+        key = (model_id, info.sha256, canonical_row(values))
+
+        leader = False
+        with self._lock:
+            if self._hashes.get(model_id) != info.sha256:
+                self._drop_model(model_id)
+                self._hashes[model_id] = info.sha256
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.shared += 1
+            else:
+                future = self._in_flight[key] = Future()
+                self.misses += 1
+                leader = True
+        if not leader:
+            return future.result()
+
+        try:
+            result = self._compute(model_id, classifier, values)
+        except BaseException as error:
+            with self._lock:
+                del self._in_flight[key]
+            future.set_exception(error)
+            raise
+
+        with self._lock:
+            del self._in_flight[key]
+            if self._hashes.get(model_id) == info.sha256:
+                self._entries[key] = result
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        future.set_result(result)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "shared": self.shared,
+                "evictions": self.evictions,
+            }
+
+
+_cache = PredictionCache()
+
+
+def predict_cached(model_id, values):
+    """Predict one row of ``values`` through the process-wide cache."""
+    return _cache.predict(model_id, values)
+
+
+def cache_stats():
+    return _cache.stats()
@@ -0,0 +1,135 @@
+"""Score large input files without the web app.
+
+    python -m pfas_score plants.csv --model effluent --output scored.csv
+
+The input is read in chunks, the chunks are scored in parallel worker processes
+that each load the model once, and the results are appended to the output file
+in input order as soon as they are ready, so memory stays bounded by the number
+of chunks in flight rather than the size of the file.
+"""
+
+import argparse
+import collections
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# model selector -> registry model id
+MODEL_CHOICES = {
+    "influent": "influent",
+    "effluent": "effluent",
+    "biosolid": "biosolid",
+    "effluent-from-influent-pfas": "effluent_pfas",
+    "biosolid-from-influent-pfas": "biosolid_pfas",
+}
+
+DEFAULT_CHUNK_SIZE = 50000
+
+
+def read_chunks(path, chunk_size):
+    """Yield the input file as DataFrames of at most ``chunk_size`` rows.
+
+    CSV files are streamed; Excel files cannot be read incrementally and are
+    loaded whole, then split.
+    """
+    import pandas as pd
+
+    from .batch import read_table
+
+    if os.path.splitext(path)[1].lower() in (".xlsx", ".xls"):
+        frame = read_table(path)
+        for start in range(0, len(frame), chunk_size):
+            yield frame.iloc[start:start + chunk_size]
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size)
+
+
+def _init_worker(model_id):
+    # runs once in every worker process so each loads the model a single time
+    from .registry import get_model
+
+    get_model(model_id)
+
+
+def _score_chunk(frame, model_id, skip_invalid):
+    from .batch import score_frame
+
+    return score_frame(frame, model_id, skip_invalid=skip_invalid)
+
+
+def score_file(path, model_id, output, chunk_size=DEFAULT_CHUNK_SIZE, workers=None,
+               skip_invalid=False, log=sys.stderr):
+    """Score ``path`` into the CSV file ``output``; returns the number of rows written.
+
+    Raises ``ValueError`` if a chunk does not validate and ``skip_invalid`` is
+    false. Rows written before the failure are kept in ``output``.
+    """
+    workers = workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    rows = 0
+    header = True
+
+    def write(result, problems):
+        nonlocal rows, header
+        if result is None:
+            raise ValueError("\n".join(problems))
+        for problem in problems:
+            print("skipped: " + problem, file=log)
+        result.to_csv(output, mode="w" if header else "a", header=header, index=False)
+        header = False
+        rows += len(result)
+        elapsed = time.perf_counter() - start
+        print("{0} rows scored ({1:.0f} rows/s)".format(rows, rows / elapsed), file=log)
+
+    chunks = read_chunks(path, chunk_size)
+    if workers == 1:
+        _init_worker(model_id)
+        for frame in chunks:
+            write(*_score_chunk(frame, model_id, skip_invalid))
+        return rows
+
+    # keep a bounded window of chunks in flight and write them back in order
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(model_id,)) as pool:
+        pending = collections.deque()
+        for frame in chunks:
+            pending.append(pool.submit(_score_chunk, frame, model_id, skip_invalid))
+            if len(pending) >= 2 * workers:
+                write(*pending.popleft().result())
+        while pending:
+            write(*pending.popleft().result())
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m pfas_score",
+        description="Score a CSV or Excel file of WWTP samples with one of the PFAS risk models.")
+    parser.add_argument("input", help="CSV or Excel file, one sample per row, one column per model input")
+    parser.add_argument("--model", required=True, choices=sorted(MODEL_CHOICES),
+                        help="which model to score the samples with")
+    parser.add_argument("--output", "-o", required=True,
+                        help="CSV file to write, the input columns plus the prediction and probability")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="rows per chunk (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes (default: number of CPUs)")
+    parser.add_argument("--skip-invalid", action="store_true",
+                        help="leave invalid rows unscored instead of stopping at the first invalid chunk")
+    args = parser.parse_args(argv)
+
+    if args.chunk_size < 1 or (args.workers is not None and args.workers < 1):
+        parser.error("--chunk-size and --workers must be positive")
+
+    try:
+        score_file(args.input, MODEL_CHOICES[args.model], args.output, chunk_size=args.chunk_size,
+                   workers=args.workers, skip_invalid=args.skip_invalid)
+    except (OSError, UnicodeDecodeError) as error:
+        # before ValueError, which UnicodeDecodeError is a subclass of
+        print("error: {0}".format(error), file=sys.stderr)
+        return 1
+    except ValueError as error:
+        print("error: invalid input\n{0}".format(error), file=sys.stderr)
+        return 1
+    return 0
@@ -0,0 +1,299 @@
+"""Compare a candidate model with the model a page serves, on the same rows.
+
+    python -m pfas_score.compare                                   # effluent_alt against effluent (page 2)
+    python -m pfas_score.compare candidate.pkl --against influent --rows 50000
+    python -m pfas_score.compare effluent_alt --corpus samples.csv --disagreements differ.csv -o compare.json
+
+The candidate is a model id of the registry (``registry.MODEL_FILES``) or the
+path of a pickled classifier or a native CatBoost ``.cbm`` file. It must take
+the inputs of the page model it is compared with (``--against``), in the same
+order. Model ids are loaded as the app serves them (see ``registry``), or from
+their pickles with ``--pickle``.
+
+Both models score the same corpus: ``--rows`` synthetic rows around the page
+defaults (see ``corpus``), or the rows of a CSV or Excel file with the page's
+columns. The report gives, for each model:
+
+- load time and resident memory, in a fresh interpreter with catboost and
+  sklearn already imported, so only the model itself is measured
+- the latency of single-row calls (median, 95th and 99th percentile)
+- batch throughput over the whole corpus
+- the share of rows predicted high risk
+
+It then gives how often the two models agree, with the counts of every
+combination and Cohen's kappa, and the distribution of the difference
+between their probabilities of high risk.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from .benchmark import _run_fresh
+from .registry import MODEL_FILES, PAGE_MODELS, ROOT_DIR
+
+DEFAULT_CANDIDATE = "effluent_alt"
+DEFAULT_AGAINST = "effluent"
+DEFAULT_ROWS = 10000
+
+# single-row calls timed per model
+LATENCY_ROWS = 500
+
+_LOAD = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+# imported first, so that only the model itself is measured
+import catboost, sklearn.ensemble
+from pfas_score import native, registry
+before = registry._rss_bytes()
+start = time.perf_counter()
+{load}
+seconds = time.perf_counter() - start
+print(json.dumps([seconds, registry._rss_bytes() - before]))
+"""
+
+
+class Model:
+    """A classifier under comparison: a model id of the registry or a model file."""
+
+    def __init__(self, name, pickled=False):
+        from .native import load_native
+        from .registry import get_model_with_info, load_pickle, model_path
+
+        self.name = name
+        self.pickled = pickled
+        if name in MODEL_FILES:
+            self.path = model_path(name)
+            if pickled:
+                self.classifier, self.format = load_pickle(self.path), "pickle"
+            else:
+                self.classifier, info = get_model_with_info(name)
+                self.format = info.format
+        elif os.path.isfile(name):
+            self.path = name
+            self.format = "cbm" if name.lower().endswith(".cbm") else "pickle"
+            self.classifier = load_native(name) if self.format == "cbm" else load_pickle(name)
+        else:
+            raise ValueError("{0} is neither a model id ({1}) nor a model file".format(name, ", ".join(MODEL_FILES)))
+
+    def measure_load(self):
+        """``(seconds, resident bytes)`` of loading the model in a fresh interpreter."""
+        if self.name in MODEL_FILES and not self.pickled:
+            load = "model = registry.get_model_with_info({0!r})[0]".format(self.name)
+        elif self.format == "cbm":
+            load = "model = native.load_native({0!r})".format(os.path.abspath(self.path))
+        else:
+            load = "model = registry.load_pickle({0!r})".format(os.path.abspath(self.path))
+        return _run_fresh(_LOAD.format(root=ROOT_DIR, load=load))
+
+
+def _input_count(classifier):
+    """Number of inputs the classifier was fitted on, or None if it does not record it."""
+    estimator = getattr(classifier, "best_estimator_", classifier)
+    # scikit-learn sets n_features_in_, CatBoost names its inputs
+    return getattr(estimator, "n_features_in_", None) or len(getattr(estimator, "feature_names_", None) or ()) or None
+
+
+def load_corpus(model_id, rows=DEFAULT_ROWS, path=None):
+    """The rows both models score: ``rows`` synthetic rows, or the rows of the file at ``path``."""
+    from .batch import read_table, validate_frame
+    from .corpus import synthetic_corpus
+
+    if path is None:
+        return synthetic_corpus(model_id, rows)
+    X, problems = validate_frame(read_table(path), model_id)
+    if problems:
+        raise ValueError("{0} has invalid inputs:\n{1}".format(path, "\n".join(problems)))
+    return X
+
+
+def row_latencies(classifier, X, rows=LATENCY_ROWS):
+    """Seconds of ``predict_proba`` on each of the first ``rows`` rows of ``X``, one call per row."""
+    rows = min(rows, len(X))
+    classifier.predict_proba(X[:1])
+    seconds = np.empty(rows)
+    for i in range(rows):
+        start = time.perf_counter()
+        classifier.predict_proba(X[i:i + 1])
+        seconds[i] = time.perf_counter() - start
+    return seconds
+
+
+def agreement(baseline, candidate):
+    """Agreement of two 0/1 prediction arrays, with Cohen's kappa."""
+    both_high = int(np.sum((baseline == 1) & (candidate == 1)))
+    both_low = int(np.sum((baseline == 0) & (candidate == 0)))
+    rows = len(baseline)
+    observed = (both_high + both_low) / rows
+    # agreement expected by chance from the share of high risk of each model
+    expected = baseline.mean() * candidate.mean() + (1 - baseline.mean()) * (1 - candidate.mean())
+    return {
+        "rate": observed,
+        "kappa": 1.0 if expected == 1 else (observed - expected) / (1 - expected),
+        "both_high": both_high,
+        "both_low": both_low,
+        "only_baseline_high": int(np.sum((baseline == 1) & (candidate == 0))),
+        "only_candidate_high": int(np.sum((baseline == 0) & (candidate == 1))),
+    }
+
+
+def compare(candidate, against=DEFAULT_AGAINST, X=None, pickled=False, measure_load=True, log=print):
+    """Score ``X`` with both models; returns ``(result document, predictions, probabilities)``.
+
+    ``predictions`` and ``probabilities`` hold the baseline's and the
+    candidate's outputs as ``(baseline, candidate)`` pairs of arrays.
+    """
+    from .batch import predict_matrix
+    from .corpus import rows_per_second
+    from .features import FEATURES
+
+    if against not in PAGE_MODELS:
+        raise ValueError("--against must be one of the page models: " + ", ".join(PAGE_MODELS))
+    if X is None:
+        X = load_corpus(against)
+    models = [Model(against, pickled), Model(candidate, pickled)]
+    expected = len(FEATURES[against])
+    for model in models:
+        # a model fitted on fewer inputs would silently score the leading columns only
+        count = _input_count(model.classifier)
+        if count and count < expected:
+            raise ValueError("{0} takes {1} inputs, {2} takes {3}".format(model.name, count, against, expected))
+
+    result = {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "rows": len(X), "models": []}
+    predictions, probabilities = [], []
+    for model in models:
+        log("{0}: scoring".format(model.name))
+        try:
+            predicted, probability = predict_matrix(X, against, model.classifier)
+        except Exception as error:
+            raise ValueError("{0} could not score the inputs of {1}: {2}".format(model.name, against, error)) from None
+        predictions.append(predicted)
+        probabilities.append(probability)
+        latencies = row_latencies(model.classifier, X)
+        entry = {
+            "model": model.name,
+            "file": os.path.basename(model.path),
+            "format": model.format,
+            "file_size": os.path.getsize(model.path),
+            "row_latency_p50": float(np.percentile(latencies, 50)),
+            "row_latency_p95": float(np.percentile(latencies, 95)),
+            "row_latency_p99": float(np.percentile(latencies, 99)),
+            "batch_rows_per_second": rows_per_second(model.classifier.predict_proba, X),
+            "high_risk_share": float(predicted.mean()),
+            "load_seconds": None,
+            "load_resident_bytes": None,
+        }
+        if measure_load:
+            log("{0}: loading in a fresh interpreter".format(model.name))
+            entry["load_seconds"], entry["load_resident_bytes"] = model.measure_load()
+        result["models"].append(entry)
+
+    result["agreement"] = agreement(*predictions)
+    delta = probabilities[1] - probabilities[0]
+    result["probability_delta"] = {
+        "mean": float(delta.mean()),
+        "mean_abs": float(np.abs(delta).mean()),
+        "p95_abs": float(np.percentile(np.abs(delta), 95)),
+        "max_abs": float(np.abs(delta).max()),
+    }
+    return result, predictions, probabilities
+
+
+def disagreements(X, against, predictions, probabilities):
+    """The rows the two models predict differently, largest probability difference first, as a DataFrame."""
+    import pandas as pd
+
+    from .features import FEATURES
+
+    differ = predictions[0] != predictions[1]
+    frame = pd.DataFrame(X[differ], columns=FEATURES[against])
+    frame["Baseline Prediction"], frame["Candidate Prediction"] = predictions[0][differ], predictions[1][differ]
+    frame["Baseline Probability"], frame["Candidate Probability"] = probabilities[0][differ], probabilities[1][differ]
+    delta = np.abs(probabilities[1][differ] - probabilities[0][differ])
+    order = np.argsort(-delta, kind="stable")
+    return frame.iloc[order].reset_index(drop=True)
+
+
+def _format(value, pattern, scale=1):
+    return "n/a" if value is None else pattern.format(value * scale)
+
+
+def report(result):
+    """The result document as text."""
+    baseline, candidate = result["models"]
+    rows = [
+        ("file", "file", "{0}", 1),
+        ("served as", "format", "{0}", 1),
+        ("file size", "file_size", "{0:.1f} MB", 1e-6),
+        ("load (fresh process)", "load_seconds", "{0:.0f} ms", 1000),
+        ("resident after load", "load_resident_bytes", "{0:.1f} MB", 1e-6),
+        ("row latency p50", "row_latency_p50", "{0:.3f} ms", 1000),
+        ("row latency p95", "row_latency_p95", "{0:.3f} ms", 1000),
+        ("row latency p99", "row_latency_p99", "{0:.3f} ms", 1000),
+        ("batch throughput", "batch_rows_per_second", "{0:,.0f} rows/s", 1),
+        ("predicted high risk", "high_risk_share", "{0:.1%}", 1),
+    ]
+    lines = ["{0} rows scored by both models".format(result["rows"]),
+             "{0:<22} {1:>26} {2:>26}".format("", baseline["model"][-26:], candidate["model"][-26:])]
+    for label, key, pattern, scale in rows:
+        lines.append("{0:<22} {1:>26} {2:>26}".format(
+            label, _format(baseline[key], pattern, scale), _format(candidate[key], pattern, scale)))
+    agreed, delta = result["agreement"], result["probability_delta"]
+    lines.append("")
+    lines.append("Agreement {0:.2%}, Cohen's kappa {1:.3f}: both high {2}, both low {3}, only {4} high {5}, "
+                 "only {6} high {7}.".format(agreed["rate"], agreed["kappa"], agreed["both_high"], agreed["both_low"],
+                                             baseline["model"], agreed["only_baseline_high"], candidate["model"],
+                                             agreed["only_candidate_high"]))
+    lines.append("Probability of high risk, {0} minus {1}: mean {2:+.4f}, mean absolute {3:.4f}, 95th percentile "
+                 "absolute {4:.4f}, largest absolute {5:.4f}.".format(candidate["model"], baseline["model"],
+                                                                       delta["mean"], delta["mean_abs"],
+                                                                       delta["p95_abs"], delta["max_abs"]))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m pfas_score.compare",
+                                     description="Compare a candidate model with the model a page serves.")
+    parser.add_argument("candidate", nargs="?", default=DEFAULT_CANDIDATE,
+                        help="model id or model file (.pkl or .cbm) (default: %(default)s)")
+    parser.add_argument("--against", default=DEFAULT_AGAINST, choices=PAGE_MODELS,
+                        help="page model to compare with (default: %(default)s)")
+    parser.add_argument("--rows", type=int, default=DEFAULT_ROWS, help="synthetic rows (default: %(default)s)")
+    parser.add_argument("--corpus", help="CSV or Excel file with the page's columns to score instead")
+    parser.add_argument("--pickle", action="store_true", help="load model ids from their pickles, not as served")
+    parser.add_argument("--no-load", action="store_true", help="skip measuring load time and memory")
+    parser.add_argument("--disagreements", metavar="CSV", help="write the rows the models predict differently")
+    parser.add_argument("--output", "-o", help="JSON file to write the results to")
+    args = parser.parse_args(argv)
+
+    def log(message):
+        print(message, file=sys.stderr)
+
+    try:
+        X = load_corpus(args.against, args.rows, args.corpus)
+        result, predictions, probabilities = compare(args.candidate, args.against, X, args.pickle,
+                                                     not args.no_load, log)
+    except (OSError, ValueError, UnicodeDecodeError) as error:
+        print("error: {0}".format(error), file=sys.stderr)
+        return 1
+    result["corpus"] = args.corpus or "synthetic"
+
+    print(report(result))
+    if args.disagreements:
+        from .batch import to_csv_bytes
+
+        with open(args.disagreements, "wb") as file:
+            file.write(to_csv_bytes(disagreements(X, args.against, predictions, probabilities)))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(result, file, indent=2)
+            file.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,51 @@
+"""Deterministic synthetic inputs for verifying and benchmarking the models.
+
+There is no training data in the repository, so checks that need many rows
+(equivalence of exported models, throughput) draw them around the page
+defaults: every value is the default scaled by log-normal noise, a share of
+the values are zero, and the bounded inputs (Year, Month, pH) are drawn from
+their allowed range.
+"""
+
+import time
+
+import numpy as np
+
+from .features import DEFAULTS, FEATURES, INTEGER_FEATURES, RANGES
+
+DEFAULT_SEED = 20240101
+
+
+def synthetic_corpus(model_id, rows, seed=DEFAULT_SEED):
+    """Return a ``(rows, n_features)`` float64 matrix in model input order."""
+    rng = np.random.default_rng(seed)
+    columns = []
+    for feature in FEATURES[model_id]:
+        default = float(DEFAULTS[model_id][feature])
+        if feature in RANGES:
+            low, high = RANGES[feature]
+            if feature == "Year":
+                low, high = 2019, 2025
+            if feature in INTEGER_FEATURES:
+                values = rng.integers(low, high + 1, rows).astype(np.float64)
+            else:
+                values = rng.uniform(low, high, rows)
+        else:
+            # the PFAS inputs default to 0, so give them a typical ng/L scale
+            scale = default if default > 0 else 10.0
+            values = scale * rng.lognormal(0.0, 1.0, rows)
+            values[rng.random(rows) < 0.2] = 0.0
+        columns.append(values)
+    return np.column_stack(columns)
+
+
+def rows_per_second(predict, X, min_seconds=0.5):
+    """Throughput of ``predict`` on ``X``, calling it repeatedly for at least ``min_seconds``."""
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        predict(X)
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            return calls * len(X) / elapsed
@@ -0,0 +1,266 @@
+"""Feature attributions of single predictions and global importance of the models.
+
+    python -m pfas_score.explain summarize            # write every model's global importance next to its .pkl
+    python -m pfas_score.explain show influent        # print a model's stored global importance
+
+Attributions are in log-odds of high risk: a model's expected value plus the
+attributions of a row add up to the row's raw score, whose logistic function is
+the probability of high risk.
+
+- CatBoost models: CatBoost's own SHAP values (``ShapValues``), computed from
+  the verified ``.cbm`` export when there is one, otherwise from the pickle.
+- The AdaBoost biosolid model: tree-path (Saabas) attributions. Every tree
+  hands the change of its node score along the row's decision path to the
+  feature split on, with the score of an inner node being the mean of its
+  leaves weighted by training samples. The trees are stumps, so this is
+  exactly their SHAP value.
+
+Single rows are memoized like predictions (see pfas_score/cache.py); uploaded
+files are explained with one call per file. The global importance (mean
+absolute attribution over the synthetic corpus of pfas_score/corpus.py) is
+computed offline by ``summarize`` and stored as ``<model>.importance.json``
+beside each pickle, together with the pickle's SHA-256, so a stale summary is
+never shown.
+"""
+
+import argparse
+import functools
+import json
+import os
+import sys
+import threading
+
+import numpy as np
+
+from .cache import PredictionCache
+from .features import FEATURES
+from .metrics import span
+from .registry import MODEL_FILES, file_sha256, get_model_with_info, load_pickle, model_path
+
+SUMMARY_ROWS = 10000
+
+CONTRIBUTION_COLUMN = "{0} (contribution)"
+
+
+class CatBoostExplainer:
+    """SHAP values of a CatBoostClassifier."""
+
+    method = "CatBoost ShapValues"
+
+    def __init__(self, model):
+        self.model = getattr(model, "best_estimator_", model)
+
+    def shap_values(self, X):
+        """``(contributions, expected value)``; ``contributions`` has one column per feature."""
+        from catboost import Pool
+
+        values = self.model.get_feature_importance(Pool(np.asarray(X, dtype=np.float64)), type="ShapValues")
+        return values[:, :-1], float(values[0, -1])
+
+
+class TreePathExplainer:
+    """Tree-path (Saabas) attributions of an AdaBoostClassifier of decision trees.
+
+    ``score[e, i]`` is what estimator ``e`` adds to the log-odds of high risk
+    when a row ends in node ``i``; for inner nodes, the cover-weighted mean of
+    their leaves.
+    """
+
+    method = "tree path (Saabas)"
+
+    def __init__(self, trees, score):
+        self.trees = trees
+        self.score = score
+        self.expected_value = float(score[:, 0].sum())
+
+    @classmethod
+    def from_sklearn(cls, model):
+        from .adaboost import BoostedTreesModel
+
+        trees = BoostedTreesModel.from_sklearn(model)
+        if len(trees.classes_) != 2:
+            raise ValueError("Only binary AdaBoost models are supported")
+        # binary decision function: (class 1 - class 0) / sum of the weights
+        score = (trees.leaf_values[:, :, 1] - trees.leaf_values[:, :, 0]) / trees.weight_sum
+        for e, estimator in enumerate(getattr(model, "best_estimator_", model).estimators_):
+            tree = estimator.tree_
+            cover = tree.weighted_n_node_samples
+            # children are numbered after their parent
+            for i in reversed(range(tree.node_count)):
+                left, right = tree.children_left[i], tree.children_right[i]
+                if left != -1:
+                    score[e, i] = (cover[left] * score[e, left] + cover[right] * score[e, right]) / (
+                        cover[left] + cover[right])
+        return cls(trees, score)
+
+    def _chunk(self, X, n_features):
+        rows = np.arange(len(X))[np.newaxis, :]
+        estimators = np.arange(len(self.trees.feature))[:, np.newaxis]
+        contributions = np.zeros(len(X) * n_features)
+
+        def step(node, child):
+            # leaves point to themselves, so finished paths add nothing
+            feature = self.trees.feature[estimators, node]
+            delta = self.score[estimators, child] - self.score[estimators, node]
+            contributions[:] += np.bincount((rows * n_features + feature).ravel(), weights=delta.ravel(),
+                                            minlength=len(contributions))
+
+        self.trees.walk(X, step)
+        return contributions.reshape(len(X), n_features)
+
+    def shap_values(self, X):
+        """``(contributions, expected value)``; ``contributions`` has one column per feature."""
+        # decision trees compare the float32 value of every feature
+        X = np.asarray(X, dtype=np.float32)
+        contributions = np.empty(X.shape)
+        for start, chunk in self.trees.row_chunks(X):
+            contributions[start:start + len(chunk)] = self._chunk(chunk, X.shape[1])
+        return contributions, self.expected_value
+
+
+def load_explainer(model_id, sha256=None):
+    """Build the explainer of ``model_id`` from its verified ``.cbm`` export or its pickle."""
+    from . import native
+
+    export = native.verified_export(model_id, sha256)
+    if export is not None:
+        return CatBoostExplainer(native.load_native(export))
+    pickled = load_pickle(model_path(model_id))
+    kind = type(getattr(pickled, "best_estimator_", pickled)).__name__
+    if kind == "CatBoostClassifier":
+        return CatBoostExplainer(pickled)
+    if kind == "AdaBoostClassifier":
+        return TreePathExplainer.from_sklearn(pickled)
+    raise ValueError("Cannot explain a {0}".format(kind))
+
+
+# model id -> (SHA-256 of the model file, explainer)
+_explainers = {}
+_explainers_lock = threading.Lock()
+
+
+def get_explainer(model_id):
+    """The explainer of ``model_id``, rebuilt when the registry sees a new model file."""
+    sha256 = get_model_with_info(model_id)[1].sha256
+    loaded = _explainers.get(model_id)
+    if loaded is not None and loaded[0] == sha256:
+        return loaded[1]
+    with _explainers_lock:
+        loaded = _explainers.get(model_id)
+        if loaded is None or loaded[0] != sha256:
+            loaded = _explainers[model_id] = (sha256, load_explainer(model_id, sha256))
+        return loaded[1]
+
+
+def explain_matrix(model_id, X):
+    """Attributions of every row of ``X`` (model input order): ``(contributions, expected value)``."""
+    explainer = get_explainer(model_id)
+    with span("explain", model=model_id):
+        return explainer.shap_values(X)
+
+
+class ExplanationCache(PredictionCache):
+    """``(contributions, expected value)`` per feature row, keyed like predictions."""
+
+    def _compute(self, model_id, classifier, values):
+        contributions, expected_value = explain_matrix(model_id, [list(values)])
+        return tuple(float(value) for value in contributions[0]), expected_value
+
+
+_cache = ExplanationCache(max_entries=1024)
+
+
+def explain_cached(model_id, values):
+    """Attributions of one row of ``values`` through the process-wide cache."""
+    return _cache.get(model_id, values)
+
+
+def contribution_frame(frame, model_id):
+    """One contribution column per input for every row of a validated ``frame``."""
+    import pandas as pd
+
+    from .batch import validate_frame
+
+    X, problems = validate_frame(frame, model_id)
+    if problems:
+        raise ValueError("\n".join(problems))
+    contributions, _ = explain_matrix(model_id, X)
+    columns = [CONTRIBUTION_COLUMN.format(feature) for feature in FEATURES[model_id]]
+    return pd.DataFrame(contributions, columns=columns, index=frame.index)
+
+
+def importance_path(model_id):
+    return os.path.splitext(model_path(model_id))[0] + ".importance.json"
+
+
+def summarize(model_id, rows=SUMMARY_ROWS):
+    """Compute and store the global importance of ``model_id``; returns the summary."""
+    from .corpus import synthetic_corpus
+
+    explainer = load_explainer(model_id)
+    contributions, expected_value = explainer.shap_values(synthetic_corpus(model_id, rows))
+    importance = np.abs(contributions).mean(axis=0)
+    order = np.argsort(-importance, kind="stable")
+    summary = {
+        "model_id": model_id,
+        "source_sha256": file_sha256(model_path(model_id)),
+        "method": explainer.method,
+        "data": "synthetic corpus, {0} rows (pfas_score/corpus.py)".format(rows),
+        "expected_value": expected_value,
+        "mean_abs_contribution": {FEATURES[model_id][j]: float(importance[j]) for j in order},
+    }
+    with open(importance_path(model_id), "w") as file:
+        json.dump(summary, file, indent=2)
+        file.write("\n")
+    return summary
+
+
+@functools.lru_cache(maxsize=None)
+def _read_summary(path, sha256):
+    try:
+        with open(path) as file:
+            summary = json.load(file)
+    except (OSError, ValueError):
+        return None
+    return summary if summary.get("source_sha256") == sha256 else None
+
+
+def global_importance(model_id):
+    """The stored summary of ``model_id``, or None if missing or made from another model file."""
+    return _read_summary(importance_path(model_id), get_model_with_info(model_id)[1].sha256)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m pfas_score.explain",
+                                     description="Global importance summaries of the models.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    summarize_parser = subcommands.add_parser("summarize", help="compute and store the summaries")
+    summarize_parser.add_argument("models", nargs="*", metavar="MODEL",
+                                  help="models to summarize (default: all of {0})".format(", ".join(MODEL_FILES)))
+    show_parser = subcommands.add_parser("show", help="print a stored summary")
+    show_parser.add_argument("model", choices=sorted(MODEL_FILES))
+    args = parser.parse_args(argv)
+
+    if args.command == "summarize":
+        unknown = [model_id for model_id in args.models if model_id not in MODEL_FILES]
+        if unknown:
+            parser.error("unknown model(s): " + ", ".join(unknown))
+        for model_id in args.models or MODEL_FILES:
+            summary = summarize(model_id)
+            top = list(summary["mean_abs_contribution"].items())[:3]
+            print("{0:<15} {1:<22} top: {2}".format(model_id, summary["method"], ", ".join(
+                "{0} {1:.3f}".format(feature, value) for feature, value in top)))
+        return 0
+
+    summary = global_importance(args.model)
+    if summary is None:
+        print("No up-to-date summary for {0}, run: python -m pfas_score.explain summarize {0}".format(args.model))
+        return 1
+    print("{0} ({1}, {2})".format(args.model, summary["method"], summary["data"]))
+    for feature, value in summary["mean_abs_contribution"].items():
+        print("{0:<50} {1:.4f}".format(feature, value))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,162 @@
+"""Verified exports of the pickled models, shared by the export formats.
+
+An export (see pfas_score/native.py, pfas_score/oblivious.py and
+pfas_score/adaboost.py) is only used once it has been verified: on a fixed
+synthetic corpus its predictions must be identical to the pickle's, and its
+probabilities within the format's tolerance. Each format keeps a manifest
+under ``models/native/`` with the SHA-256 of the pickle each export was made
+from and of the export itself, so a changed pickle is never served through a
+stale export.
+"""
+
+import argparse
+import json
+import os
+
+from .registry import MODEL_FILES, MODELS_DIR, ROOT_DIR, file_sha256, load_pickle, model_path
+
+EXPORT_DIR = os.path.join(MODELS_DIR, "native")
+
+VERIFY_ROWS = 10000
+
+
+def read_manifest(path):
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_manifest(path, manifest):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = path + ".tmp"
+    with open(temporary, "w") as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    os.replace(temporary, path)
+
+
+class ExportFormat:
+    """One way of exporting the pickled models of one estimator class.
+
+    ``write(model, path)`` exports the fitted estimator (the pickle with any
+    GridSearchCV unwrapped) and ``load(path)`` loads an export as a model with
+    ``predict`` and ``predict_proba``. ``key`` names the export's fields in the
+    manifest.
+    """
+
+    def __init__(self, estimator, extension, manifest, write, load, tolerance=0.0, key="export"):
+        self.estimator = estimator
+        self.extension = extension
+        self.manifest_path = os.path.join(EXPORT_DIR, manifest)
+        self.write = write
+        self.load = load
+        self.tolerance = tolerance
+        self.key = key
+
+    def path(self, model_id):
+        return os.path.join(EXPORT_DIR, os.path.splitext(MODEL_FILES[model_id])[0] + self.extension)
+
+    def source_model(self, pickled):
+        """The fitted estimator inside ``pickled``, or None if it is not one this format exports."""
+        model = getattr(pickled, "best_estimator_", pickled)
+        return model if type(model).__name__ == self.estimator else None
+
+    def verified_export(self, model_id, source_sha256=None):
+        """Return the export path for ``model_id`` if a verified, up-to-date export exists."""
+        entry = read_manifest(self.manifest_path).get(model_id)
+        path = self.path(model_id)
+        if not entry or not entry.get("verified") or not os.path.exists(path):
+            return None
+        if source_sha256 is None:
+            source_sha256 = file_sha256(model_path(model_id))
+        if entry.get("source_sha256") != source_sha256 or entry.get(self.key + "_sha256") != file_sha256(path):
+            return None
+        return path
+
+    def compare(self, model_id, exported, pickled=None, rows=VERIFY_ROWS):
+        """Compare an exported model with the pickle on the fixed corpus.
+
+        Returns ``(identical_predictions, max_probability_difference)``.
+        """
+        import numpy as np
+
+        from .corpus import synthetic_corpus
+
+        if pickled is None:
+            pickled = load_pickle(model_path(model_id))
+        X = synthetic_corpus(model_id, rows)
+        same = np.array_equal(exported.predict(X), pickled.predict(X))
+        difference = float(np.abs(exported.predict_proba(X) - pickled.predict_proba(X)).max())
+        return same, difference
+
+    def verified(self, same, difference):
+        return same and difference <= self.tolerance
+
+    def export(self, model_id, pickled=None):
+        """Export ``model_id``, verify it and record it in the manifest.
+
+        Returns None if the model is not one this format exports, otherwise
+        whether the export verified.
+        """
+        if pickled is None:
+            pickled = load_pickle(model_path(model_id))
+        model = self.source_model(pickled)
+        if model is None:
+            return None
+
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+        path = self.path(model_id)
+        self.write(model, path)
+        same, difference = self.compare(model_id, self.load(path), pickled)
+        verified = self.verified(same, difference)
+
+        manifest = read_manifest(self.manifest_path)
+        manifest[model_id] = {
+            "source": MODEL_FILES[model_id],
+            "source_sha256": file_sha256(model_path(model_id)),
+            self.key: os.path.basename(path),
+            self.key + "_sha256": file_sha256(path),
+            "verified": verified,
+            "verify_rows": VERIFY_ROWS,
+            "max_probability_difference": difference,
+        }
+        write_manifest(self.manifest_path, manifest)
+        return verified
+
+    def main(self, argv, prog, description, benchmark, export_command="export"):
+        """The ``export``, ``verify`` and ``benchmark`` commands of a format's module.
+
+        ``benchmark(model_id, path)`` returns the lines to print for one
+        verified export.
+        """
+        parser = argparse.ArgumentParser(prog=prog, description=description)
+        parser.add_argument("command", choices=[export_command, "verify", "benchmark"])
+        args = parser.parse_args(argv)
+
+        failed = False
+        if args.command == export_command:
+            for model_id in MODEL_FILES:
+                verified = self.export(model_id)
+                if verified is None:
+                    continue
+                print("{0:<15} -> {1} ({2})".format(model_id, os.path.relpath(self.path(model_id), ROOT_DIR),
+                                                   "verified" if verified else "MISMATCH, not used"))
+                failed |= not verified
+            return 1 if failed else 0
+
+        for model_id in read_manifest(self.manifest_path):
+            path = self.verified_export(model_id)
+            if path is None:
+                print("{0:<15} export is missing, outdated or failed verification, run {1}".format(
+                    model_id, export_command))
+                failed = True
+            elif args.command == "verify":
+                same, difference = self.compare(model_id, self.load(path))
+                print("{0:<15} predictions {1}, max probability difference {2:.2e}".format(
+                    model_id, "identical" if same else "DIFFER", difference))
+                failed |= not self.verified(same, difference)
+            else:
+                for line in benchmark(model_id, path):
+                    print(line)
+        return 1 if failed else 0
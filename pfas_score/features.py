@@ -0,0 +1,106 @@
+"""Feature order and default values of every model, as built by the pages.
+
+The column names are the input names the pages use, in the order the pages
+pass them to ``predict``. The defaults are the values the pages show on load
+(training-set medians for pages 1-3, zeros for pages 4-5).
+"""
+
+MONTHS = [
+    "January", "February", "March", "April", "May", "June",
+    "July", "August", "September", "October", "November", "December"
+]
+
+CHEMICALS = [
+    "PFBA (ng/L)", "PFPeA (ng/L)", "PFHxA (ng/L)", "PFHpA (ng/L)", "PFOA (ng/L)",
+    "PFNA (ng/L)", "PFDA (ng/L)", "PFUnA (ng/L)", "PFDoA (ng/L)", "PFTrDA (ng/L)",
+    "PFTA (ng/L)", "PFHxDA (ng/L)", "PFODA (ng/L)", "3:3 FTCA (ng/L)", "5:3 FTCA (ng/L)",
+    "7:3 FTCA (ng/L)", "4:2 FTS (ng/L)", "6:2 FTS (ng/L)", "8:2 FTS (ng/L)", "10:2 FTS (ng/L)",
+    "PFBS (ng/L)", "PFPeS (ng/L)", "PFHxS (ng/L)", "PFHpS (ng/L)", "PFOS (ng/L)",
+    "PFNS (ng/L)", "PFDS (ng/L)", "PFDoS (ng/L)", "FOSA (ng/L)", "MeFOSA (ng/L)",
+    "EtFOSA (ng/L)", "MeFOSE (ng/L)", "EtFOSE (ng/L)", "NMeFOSAA (ng/L)", "NEtFOSAA (ng/L)",
+    "ADONA (ng/L)", "HFPO_DA (GenX) (ng/L)", "11ClPF3OUDS (ng/L)", "9ClPF3ONS (ng/L)"
+]
+
+INFLUENT_DEFAULTS = {
+    "Year": 2024,
+    "Month": 1,
+    "Flow": 3.1334,
+    "Influent Volume": 387,
+    "Discharge Volume": 169.25,
+    "Industrial Total": 0.625,
+    "Total Ammonia": 22300000,
+    "Biochemical Oxygen Demand": 255668102.2,
+    "Carbonaceous Biochemical Oxygen Demand": 645000000,
+    "Total Dissolved Solids": 507170067,
+    "Total Organic Carbon": 16043614,
+    "Total Suspended Solids": 240900372.8,
+    "pH": 7.0,
+}
+
+EFFLUENT_DEFAULTS = {
+    "Year": 2024,
+    "Month": 1,
+    "Flow (Influent)": 3.1334,
+    "Influent Volume": 387,
+    "Discharge Volume": 169.25,
+    "Industrial Total": 0.625,
+    "Total Ammonia (Influent)": 22300000,
+    "Biochemical Oxygen Demand (Influent)": 255668102.2,
+    "Carbonaceous Biochemical Oxygen Demand (Influent)": 645000000,
+    "Total Dissolved Solids (Influent)": 507170067,
+    "Total Organic Carbon (Influent)": 16043614,
+    "Total Suspended Solids (Influent)": 240900372.8,
+    "pH (Influent)": 7.0,
+    "Total Ammonia (Effluent)": 176526.7692,
+    "Biochemical Oxygen Demand, Percent Removal (Effluent)": 0,
+    "Biochemical Oxygen Demand (Effluent)": 2873391.258,
+    "Carbonaceous Biochemical Oxygen Demand (Effluent)": 2372284.641,
+    "Total Nitrate": 0,
+    "Total Nitrite": 0,
+    "Total Nitrogen": 0,
+    "Total Dissolved Solids (Effluent)": 507170067.4,
+    "Total Organic Carbon (Effluent)": 16000000,
+    "Total Suspended Solids (Effluent)": 2336653.964,
+    "Total Suspended Solids, Percent Removal (Effluent)": 0,
+    "pH (Effluent)": 7.0,
+}
+
+# page 3 asks for the same inputs as page 2 except the influent flow
+BIOSOLID_DEFAULTS = {
+    name: value for name, value in EFFLUENT_DEFAULTS.items() if name != "Flow (Influent)"
+}
+
+PFAS_DEFAULTS = {chemical: 0 for chemical in CHEMICALS}
+
+# the whole plant page asks for the inputs of page 2 once, which cover the
+# influent and biosolid models too; influent model input -> plant input
+PLANT_DEFAULTS = EFFLUENT_DEFAULTS
+INFLUENT_TO_PLANT = {
+    name: name if name in PLANT_DEFAULTS else "{0} (Influent)".format(name) for name in INFLUENT_DEFAULTS
+}
+
+# model id -> {feature name: default value}, in model input order
+DEFAULTS = {
+    "influent": INFLUENT_DEFAULTS,
+    "effluent": EFFLUENT_DEFAULTS,
+    "biosolid": BIOSOLID_DEFAULTS,
+    "effluent_pfas": PFAS_DEFAULTS,
+    "biosolid_pfas": PFAS_DEFAULTS,
+    "effluent_alt": EFFLUENT_DEFAULTS,
+    # not a model: the inputs of the whole plant page
+    "plant": PLANT_DEFAULTS,
+}
+
+FEATURES = {model_id: list(defaults) for model_id, defaults in DEFAULTS.items()}
+
+# inclusive (min, max) bounds the pages enforce on top of "is a number"
+RANGES = {
+    "Year": (1900, 2100),
+    "Month": (1, 12),
+    "pH": (0, 14),
+    "pH (Influent)": (0, 14),
+    "pH (Effluent)": (0, 14),
+}
+
+# features the pages only accept as whole numbers
+INTEGER_FEATURES = {"Year", "Month"}
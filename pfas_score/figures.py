@@ -0,0 +1,178 @@
+"""Web-sized variants of the figures shown on the home page.
+
+    python -m pfas_score.figures build    # write static/figures/ from figures/
+    python -m pfas_score.figures check    # exit 1 if the variants are missing or stale
+
+The originals in ``figures/`` are ~3000 px wide JPEGs. Handed to ``st.image``
+they are read, downscaled to the content width and re-encoded on every run of
+Home.py, and the browser downloads all three before anything below them. The
+build step writes WebP variants at a few widths, a JPEG for browsers without
+WebP and a full-resolution WebP behind the click-to-expand link, to
+``static/figures/``, which Streamlit serves as static files
+(``server.enableStaticServing`` in ``.streamlit/config.toml``). Home.py then
+emits a lazily loaded ``<picture>`` and the browser picks the size it needs.
+
+The manifest records the SHA-256 of each original, so a changed figure is not
+served through stale variants until the build is re-run.
+"""
+
+import argparse
+import functools
+import html
+import io
+import os
+import sys
+
+from .exports import read_manifest, write_manifest
+from .registry import ROOT_DIR, file_sha256
+
+FIGURES_DIR = os.path.join(ROOT_DIR, "figures")
+STATIC_DIR = os.path.join(ROOT_DIR, "static", "figures")
+MANIFEST_PATH = os.path.join(STATIC_DIR, "manifest.json")
+
+# URL prefix under which Streamlit serves ROOT_DIR/static
+STATIC_URL = "app/static/figures/"
+
+FIGURES = ["Figure1.jpg", "Figure2.jpg", "Figure3.jpg"]
+
+# WebP widths offered in the srcset; the smallest doubles as the phone-sized thumbnail
+WIDTHS = [480, 960, 1440]
+JPEG_WIDTH = 960
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+
+# width of the main column in Streamlit's centered layout
+_SIZES = "(max-width: 736px) 100vw, 704px"
+
+
+def _resized(image, width):
+    from PIL import Image
+
+    if width >= image.width:
+        return image
+    return image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+
+
+def _encode(image, image_format):
+    output = io.BytesIO()
+    if image_format == "WEBP":
+        image.save(output, "WEBP", quality=WEBP_QUALITY, method=6)
+    else:
+        image.save(output, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return output.getvalue()
+
+
+def _variant_name(figure, width, extension):
+    return "{0}-{1}.{2}".format(os.path.splitext(figure)[0], width, extension)
+
+
+def build():
+    """Write every variant and the manifest; returns the manifest."""
+    from PIL import Image
+
+    os.makedirs(STATIC_DIR, exist_ok=True)
+    manifest = {}
+    for figure in FIGURES:
+        source = os.path.join(FIGURES_DIR, figure)
+        with Image.open(source) as image:
+            image = image.convert("RGB")
+        variants = [(width, "webp", "WEBP") for width in WIDTHS + [image.width]]
+        variants.append((JPEG_WIDTH, "jpg", "JPEG"))
+
+        files = {}
+        for width, extension, image_format in variants:
+            name = _variant_name(figure, width, extension)
+            with open(os.path.join(STATIC_DIR, name), "wb") as file:
+                file.write(_encode(_resized(image, width), image_format))
+            files[name] = width
+
+        manifest[figure] = {
+            "source_sha256": file_sha256(source),
+            "width": image.width,
+            "height": image.height,
+            "webp": [_variant_name(figure, width, "webp") for width in WIDTHS],
+            "full": _variant_name(figure, image.width, "webp"),
+            "jpeg": _variant_name(figure, JPEG_WIDTH, "jpg"),
+            "files": files,
+        }
+    write_manifest(MANIFEST_PATH, manifest)
+    return manifest
+
+
+@functools.lru_cache(maxsize=None)
+def variants(figure):
+    """The manifest entry of ``figure`` if its variants are built and current, else None."""
+    entry = read_manifest(MANIFEST_PATH).get(figure)
+    if not entry:
+        return None
+    if any(not os.path.exists(os.path.join(STATIC_DIR, name)) for name in entry["files"]):
+        return None
+    if entry["source_sha256"] != file_sha256(os.path.join(FIGURES_DIR, figure)):
+        return None
+    return entry
+
+
+def picture_html(figure, caption):
+    """A lazily loaded, responsive ``<picture>`` linking to the full-resolution image.
+
+    Returns None if the variants of ``figure`` are not built or stale.
+    """
+    entry = variants(figure)
+    if entry is None:
+        return None
+    srcset = ", ".join("{0}{1} {2}w".format(STATIC_URL, name, entry["files"][name]) for name in entry["webp"])
+    return (
+        '<figure style="margin: 0 0 1rem 0">'
+        '<a href="{url}{full}" target="_blank" title="Open full resolution">'
+        '<picture>'
+        '<source type="image/webp" srcset="{srcset}" sizes="{sizes}">'
+        '<img src="{url}{jpeg}" alt="{alt}" width="{width}" height="{height}" loading="lazy" decoding="async" '
+        'style="width: 100%; height: auto">'
+        '</picture></a>'
+        '<figcaption style="font-size: 0.875rem; opacity: 0.6">{caption}</figcaption>'
+        '</figure>'
+    ).format(url=STATIC_URL, full=entry["full"], srcset=srcset, sizes=_SIZES, jpeg=entry["jpeg"],
+             alt=html.escape(os.path.splitext(figure)[0]), width=entry["width"], height=entry["height"],
+             caption=html.escape(" ".join(caption.split())))
+
+
+@functools.lru_cache(maxsize=None)
+def figure_bytes(figure):
+    """JPEG bytes of ``figure`` sized for the page, kept for the life of the process.
+
+    Used when the static variants cannot be served. The bytes are already
+    narrower than Streamlit's content width, so ``st.image`` passes them
+    through without re-encoding.
+    """
+    entry = variants(figure)
+    if entry is not None:
+        with open(os.path.join(STATIC_DIR, entry["jpeg"]), "rb") as file:
+            return file.read()
+
+    from PIL import Image
+
+    with Image.open(os.path.join(FIGURES_DIR, figure)) as image:
+        return _encode(_resized(image.convert("RGB"), JPEG_WIDTH), "JPEG")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m pfas_score.figures",
+                                     description="Build web-sized variants of the home page figures.")
+    parser.add_argument("command", choices=["build", "check"])
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        for figure, entry in build().items():
+            size = sum(os.path.getsize(os.path.join(STATIC_DIR, name)) for name in entry["files"])
+            print("{0:<12} {1:>9,} bytes -> {2} variants, {3:>9,} bytes".format(
+                figure, os.path.getsize(os.path.join(FIGURES_DIR, figure)), len(entry["files"]), size))
+        return 0
+
+    stale = [figure for figure in FIGURES if variants(figure) is None]
+    for figure in stale:
+        print("{0:<12} variants are missing or stale, run build".format(figure))
+    return 1 if stale else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
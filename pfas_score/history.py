@@ -0,0 +1,370 @@
+"""Log of the predictions made on pages 1-5, for auditing and usage analysis.
+
+    python -m pfas_score.history stats                 # rows per model in the log
+    python -m pfas_score.history bench --rows 2000000  # time the history page queries on a synthetic log
+
+Every prediction is appended to a SQLite database, ``history/predictions.sqlite3``
+(``PFAS_HISTORY_DB``), with the time, the model id, the SHA-256 of the model
+file it was scored with, the plant it was entered for, its inputs and its
+outputs. Single entries, uploaded files and lab exports, background jobs and
+the newly scored months of time series are logged alike. ``PFAS_HISTORY=0``
+turns the log off.
+
+Nothing is written on the request path: ``log_prediction`` and ``log_matrix``
+only append to an in-memory buffer, and a daemon thread writes everything
+buffered in one transaction every ``FLUSH_SECONDS`` seconds, or as soon as
+``FLUSH_ROWS`` rows are waiting. Past ``MAX_BUFFERED_ROWS`` new rows are
+dropped and counted rather than growing the buffer without bound, and what is
+left is written when the process exits.
+
+Inputs are stored as float64 bytes in model input order, eight bytes per
+input. The log is indexed by model, plant and UTC day. The same transaction
+that appends predictions adds them to per day, model and plant totals
+(``daily``), so the counts of the history page never scan the log, however
+long it gets.
+"""
+
+import argparse
+import atexit
+import contextlib
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+from .registry import PAGE_MODELS, ROOT_DIR
+
+ENABLED = os.environ.get("PFAS_HISTORY", "1").lower() not in ("0", "false", "no")
+
+DATABASE = os.environ.get("PFAS_HISTORY_DB") or os.path.join(ROOT_DIR, "history", "predictions.sqlite3")
+
+FLUSH_SECONDS = 2.0
+FLUSH_ROWS = 10000
+MAX_BUFFERED_ROWS = 1000000
+
+# columns of an uploaded file that name the plant of each row (compared ignoring case)
+PLANT_COLUMNS = ["plant", "plant name", "plant id", "facility", "wwtp"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS predictions (
+    id INTEGER PRIMARY KEY,
+    -- unix seconds, and the UTC date as YYYY-MM-DD
+    time REAL NOT NULL,
+    day TEXT NOT NULL,
+    model_id TEXT NOT NULL,
+    model_sha256 TEXT NOT NULL,
+    plant TEXT,
+    -- "page", "upload", "job", "timeseries" or "labreport"
+    source TEXT NOT NULL,
+    -- float64 values in model input order
+    inputs BLOB NOT NULL,
+    prediction INTEGER NOT NULL,
+    probability REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS predictions_model ON predictions (model_id, day);
+CREATE INDEX IF NOT EXISTS predictions_plant ON predictions (plant, day);
+CREATE INDEX IF NOT EXISTS predictions_day ON predictions (day);
+CREATE TABLE IF NOT EXISTS daily (
+    day TEXT NOT NULL,
+    model_id TEXT NOT NULL,
+    -- '' for predictions without a plant
+    plant TEXT NOT NULL,
+    predictions INTEGER NOT NULL,
+    high_risk INTEGER NOT NULL,
+    PRIMARY KEY (day, model_id, plant)
+) WITHOUT ROWID;
+"""
+
+_INSERT = ("INSERT INTO predictions (time, day, model_id, model_sha256, plant, source, inputs, prediction, probability) "
+           "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)")
+
+_ADD_DAILY = ("INSERT INTO daily (day, model_id, plant, predictions, high_risk) VALUES (?, ?, ?, ?, ?) "
+              "ON CONFLICT (day, model_id, plant) DO UPDATE SET predictions = predictions + excluded.predictions, "
+              "high_risk = high_risk + excluded.high_risk")
+
+logger = logging.getLogger(__name__)
+
+
+@contextlib.contextmanager
+def _connect(path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+    try:
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(_SCHEMA)
+        yield connection
+    finally:
+        connection.close()
+
+
+def _write(connection, rows):
+    # append rows in the column order of _INSERT, and add them to the daily totals, in one transaction
+    totals = {}
+    for row in rows:
+        key = (row[1], row[2], row[4] or "")
+        total = totals.setdefault(key, [0, 0])
+        total[0] += 1
+        total[1] += row[7]
+    connection.execute("BEGIN")
+    try:
+        connection.executemany(_INSERT, rows)
+        connection.executemany(_ADD_DAILY, [key + tuple(total) for key, total in totals.items()])
+        connection.execute("COMMIT")
+    except BaseException:
+        connection.execute("ROLLBACK")
+        raise
+
+
+class PredictionLog:
+    """Buffer of predictions, written to the database at ``path`` in bulk by a daemon thread."""
+
+    def __init__(self, path, flush_seconds=FLUSH_SECONDS, flush_rows=FLUSH_ROWS, max_rows=MAX_BUFFERED_ROWS):
+        self.path = path
+        self.flush_seconds = flush_seconds
+        self.flush_rows = flush_rows
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        # serializes the writes of the thread, explicit flushes and the exit handler
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._batches = []
+        self._buffered = 0
+        self.written = 0
+        self.dropped = 0
+
+    def record(self, model_id, sha256, source, X, predictions, probabilities, plants=None):
+        """Buffer the predictions of the rows of ``X``; ``plants`` is one value or one per row.
+
+        Returns False if the buffer was full and the rows were dropped.
+        """
+        rows = len(predictions)
+        with self._lock:
+            if self._buffered + rows > self.max_rows:
+                self.dropped += rows
+                return False
+            self._batches.append((time.time(), model_id, sha256, source, X, predictions, probabilities, plants))
+            self._buffered += rows
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="prediction-log", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+            if self._buffered >= self.flush_rows:
+                self._wake.set()
+        return True
+
+    def flush(self):
+        """Write everything buffered in one transaction; returns the number of rows written."""
+        import numpy as np
+
+        with self._flush_lock:
+            with self._lock:
+                batches, self._batches, self._buffered = self._batches, [], 0
+            if not batches:
+                return 0
+            rows = []
+            for logged, model_id, sha256, source, X, predictions, probabilities, plants in batches:
+                day = time.strftime("%Y-%m-%d", time.gmtime(logged))
+                X = np.ascontiguousarray(X, dtype="<f8").reshape(len(predictions), -1)
+                if plants is None or isinstance(plants, str):
+                    plants = [plants or None] * len(X)
+                rows.extend(zip([logged] * len(X), [day] * len(X), [model_id] * len(X), [sha256] * len(X),
+                                [plant if plant else None for plant in plants], [source] * len(X),
+                                [row.tobytes() for row in X], np.asarray(predictions).tolist(),
+                                np.asarray(probabilities, dtype=np.float64).tolist()))
+            with _connect(self.path) as connection:
+                _write(connection, rows)
+            self.written += len(rows)
+            return len(rows)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            try:
+                self.flush()
+            except sqlite3.Error:
+                logger.exception("Could not write the prediction log %s", self.path)
+
+
+_log = PredictionLog(DATABASE)
+
+
+def log_matrix(model_id, X, predictions, probabilities, plants=None, source="upload"):
+    """Log the predictions of every row of ``X`` (model input order), off the request path."""
+    if not ENABLED or not len(predictions):
+        return
+    from .registry import get_model_with_info
+
+    _log.record(model_id, get_model_with_info(model_id)[1].sha256, source, X, predictions, probabilities, plants)
+
+
+def log_prediction(model_id, values, prediction, probability, plant=None):
+    """Log one prediction of a page; ``values`` are its inputs in model input order."""
+    log_matrix(model_id, [[float(value) for value in values]], [int(prediction)], [float(probability)],
+               (plant or "").strip() or None, source="page")
+
+
+def log_frame(result, model_id, source="upload"):
+    """Log the scored rows of a ``batch.score_frame`` result, with the plant column if it has one."""
+    import numpy as np
+    import pandas as pd
+
+    from .batch import PREDICTION_COLUMN, PROBABILITY_COLUMN, match_columns
+
+    scored = result[result[PREDICTION_COLUMN].notna()]
+    mapping, _ = match_columns(scored, model_id)
+    X = np.column_stack([pd.to_numeric(scored[column]).to_numpy(dtype=np.float64) for column in mapping.values()])
+    plant_column = next((column for column in scored.columns if str(column).strip().lower() in PLANT_COLUMNS), None)
+    plants = scored[plant_column].astype(str).tolist() if plant_column is not None else None
+    log_matrix(model_id, X, scored[PREDICTION_COLUMN].astype(np.int64).to_numpy(),
+               scored[PROBABILITY_COLUMN].to_numpy(), plants, source)
+
+
+def flush():
+    """Write the buffered predictions now."""
+    return _log.flush()
+
+
+def _where(model_ids=None, plant=None, start=None, end=None):
+    # SQL condition and parameters of the history filters; start and end are inclusive YYYY-MM-DD days
+    conditions, parameters = [], []
+    if model_ids:
+        conditions.append("model_id IN ({0})".format(", ".join("?" * len(model_ids))))
+        parameters.extend(model_ids)
+    if plant:
+        conditions.append("plant = ?")
+        parameters.append(plant)
+    if start:
+        conditions.append("day >= ?")
+        parameters.append(str(start))
+    if end:
+        conditions.append("day <= ?")
+        parameters.append(str(end))
+    return " WHERE " + " AND ".join(conditions) if conditions else "", parameters
+
+
+def daily_counts(model_ids=None, plant=None, start=None, end=None, path=None):
+    """Predictions and high risk predictions per day and model, as a DataFrame."""
+    import pandas as pd
+
+    where, parameters = _where(model_ids, plant, start, end)
+    with _connect(path or DATABASE) as connection:
+        rows = connection.execute("SELECT day, model_id, SUM(predictions), SUM(high_risk) FROM daily" + where +
+                                  " GROUP BY day, model_id ORDER BY day", parameters).fetchall()
+    return pd.DataFrame(rows, columns=["day", "model_id", "predictions", "high_risk"])
+
+
+def recent(model_ids=None, plant=None, start=None, end=None, limit=1000, path=None):
+    """The latest ``limit`` logged predictions, newest first, with their inputs if a single model is selected."""
+    import numpy as np
+    import pandas as pd
+
+    from .features import FEATURES
+
+    where, parameters = _where(model_ids, plant, start, end)
+    with _connect(path or DATABASE) as connection:
+        rows = connection.execute("SELECT time, model_id, plant, source, prediction, probability, model_sha256, "
+                                  "inputs FROM predictions" + where + " ORDER BY day DESC, id DESC LIMIT ?",
+                                  parameters + [limit]).fetchall()
+    frame = pd.DataFrame([row[:7] for row in rows], columns=["time", "model_id", "plant", "source", "prediction",
+                                                              "probability", "model_sha256"])
+    frame["time"] = pd.to_datetime(frame["time"], unit="s", utc=True)
+    frame["model_sha256"] = frame["model_sha256"].str[:12]
+    if model_ids and len(model_ids) == 1 and rows:
+        inputs = np.frombuffer(b"".join(row[7] for row in rows), dtype="<f8").reshape(len(rows), -1)
+        frame = frame.join(pd.DataFrame(inputs, columns=FEATURES[model_ids[0]]))
+    return frame
+
+
+def plants(path=None):
+    """Every plant in the log, sorted; one index lookup per plant rather than a scan of all rows."""
+    with _connect(path or DATABASE) as connection:
+        rows = connection.execute(
+            "WITH RECURSIVE found(plant) AS ("
+            " SELECT MIN(plant) FROM predictions"
+            " UNION ALL SELECT (SELECT MIN(plant) FROM predictions WHERE plant > found.plant)"
+            " FROM found WHERE found.plant IS NOT NULL)"
+            " SELECT plant FROM found WHERE plant IS NOT NULL").fetchall()
+    return [row[0] for row in rows]
+
+
+def _fill(path, rows, days=365, plant_count=200, seed=0):
+    # a synthetic log of ``rows`` predictions spread evenly over the last ``days`` days
+    import numpy as np
+
+    from .corpus import synthetic_corpus
+
+    rng = np.random.default_rng(seed)
+    end = time.time()
+    times = np.sort(rng.uniform(end - days * 86400, end, rows))
+    models = rng.integers(0, len(PAGE_MODELS), rows)
+    corpora = {model_id: synthetic_corpus(model_id, 1000, seed=seed) for model_id in PAGE_MODELS}
+    with _connect(path) as connection:
+        for start in range(0, rows, FLUSH_ROWS):
+            batch = []
+            for logged, model in zip(times[start:start + FLUSH_ROWS].tolist(), models[start:start + FLUSH_ROWS]):
+                model_id = PAGE_MODELS[model]
+                batch.append((logged, time.strftime("%Y-%m-%d", time.gmtime(logged)), model_id, "0" * 64,
+                              "Plant {0:03d}".format(rng.integers(plant_count)), "page",
+                              corpora[model_id][rng.integers(1000)].tobytes(), int(rng.integers(2)), rng.random()))
+            _write(connection, batch)
+        connection.execute("ANALYZE")
+
+
+def bench(rows, path):
+    """Seconds taken by each history page query on a synthetic log of ``rows`` rows at ``path``."""
+    if not os.path.exists(path):
+        _fill(path, rows)
+    start = time.strftime("%Y-%m-%d", time.gmtime(time.time() - 30 * 86400))
+    queries = {
+        "daily counts, all": lambda: daily_counts(path=path),
+        "daily counts, one model": lambda: daily_counts(["influent"], path=path),
+        "daily counts, one plant": lambda: daily_counts(plant="Plant 007", path=path),
+        "daily counts, one model, last 30 days": lambda: daily_counts(["influent"], start=start, path=path),
+        "latest 1000, one model": lambda: recent(["influent"], path=path),
+        "latest 1000, one plant": lambda: recent(plant="Plant 007", path=path),
+        "plants": lambda: plants(path=path),
+    }
+    timings = {}
+    for name, query in queries.items():
+        query()
+        begin = time.perf_counter()
+        query()
+        timings[name] = time.perf_counter() - begin
+    return timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m pfas_score.history",
+                                     description="The log of the predictions made on the pages.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    stats_parser = subcommands.add_parser("stats", help="rows per model in the log")
+    stats_parser.add_argument("--db", default=DATABASE)
+    bench_parser = subcommands.add_parser("bench", help="time the history page queries on a synthetic log")
+    bench_parser.add_argument("--rows", type=int, default=2000000)
+    bench_parser.add_argument("--db", default=None,
+                              help="synthetic log to create or reuse (default: a file in the temporary directory)")
+    args = parser.parse_args(argv)
+
+    if args.command == "stats":
+        counts = daily_counts(path=args.db).groupby("model_id")[["predictions", "high_risk"]].sum()
+        print("{0}: {1} predictions".format(args.db, int(counts["predictions"].sum())))
+        for model_id, row in counts.iterrows():
+            print("{0:<15} {1:>10} predictions {2:>10} high risk".format(model_id, row["predictions"], row["high_risk"]))
+        return 0
+
+    import tempfile
+
+    path = args.db or os.path.join(tempfile.gettempdir(), "pfas_history_bench_{0}.sqlite3".format(args.rows))
+    timings = bench(args.rows, path)
+    print("{0} ({1:.0f} MB)".format(path, os.path.getsize(path) / 1e6))
+    for name, seconds in timings.items():
+        print("{0:<40} {1:>8.1f} ms".format(name, seconds * 1000))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,495 @@
+"""Background scoring of large uploads: a local job queue in SQLite.
+
+    python -m pfas_score.jobs worker                   # run jobs until stopped
+    python -m pfas_score.jobs submit plants.csv --model effluent --wait
+    python -m pfas_score.jobs status                   # the latest jobs
+    python -m pfas_score.jobs cancel JOB
+
+Scoring a large file inside a page script blocks the session until it is done
+and is lost when the browser disconnects. A batch upload can instead be queued
+as a job: the file is saved under ``jobs/<job id>/`` and a row is added to
+``jobs/jobs.sqlite3``, which is all the broker there is. Worker processes,
+started by the app when a job is queued and detached from it, claim jobs one
+at a time and score them in chunks of ``CHUNK_SIZE`` rows like the
+command-line scorer (pfas_score/cli.py).
+
+Every scored chunk is written to its own file and then checkpointed in the
+database, together with the progress the page shows. A job whose worker died
+(its process is gone, or it has not reported for ``STALE_SECONDS``) is
+claimed again and resumes after its last checkpointed chunk, unless its
+workers died ``MAX_ATTEMPTS`` times already. When all chunks are done they
+are joined into ``result.csv``, which the page offers for download for
+``KEEP_DAYS`` days.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from .registry import PAGE_MODELS, ROOT_DIR
+
+JOBS_DIR = os.environ.get("PFAS_JOBS_DIR") or os.path.join(ROOT_DIR, "jobs")
+
+# the five page models, and "plant" for the whole plant page
+JOB_MODELS = PAGE_MODELS + ["plant"]
+
+CHUNK_SIZE = 20000
+
+# worker processes the app keeps running while there are jobs
+DEFAULT_WORKERS = int(os.environ.get("PFAS_JOB_WORKERS", "2"))
+
+# seconds between two looks at the queue of an idle worker
+POLL_SECONDS = 1.0
+# seconds between two heartbeats of a worker and of the job it runs
+HEARTBEAT_SECONDS = 5.0
+# a running job whose worker has not reported for this long is claimed again
+STALE_SECONDS = 30.0
+# workers started by the app exit after this long without a job
+IDLE_SECONDS = 60.0
+# a job whose worker died this many times is failed rather than claimed again
+MAX_ATTEMPTS = 3
+
+# finished jobs and their files are removed after this many days
+KEEP_DAYS = 7
+
+ACTIVE_STATES = ("queued", "running")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    model_id TEXT NOT NULL,
+    file_name TEXT NOT NULL,
+    skip_invalid INTEGER NOT NULL,
+    -- queued, running, done, failed or cancelled
+    state TEXT NOT NULL,
+    -- counted by the worker before scoring
+    total_rows INTEGER,
+    done_chunks INTEGER NOT NULL DEFAULT 0,
+    done_rows INTEGER NOT NULL DEFAULT 0,
+    -- JSON: {model id: rows predicted high risk}
+    high_risk TEXT NOT NULL DEFAULT '{}',
+    -- JSON: skipped rows, or why the job failed
+    problems TEXT NOT NULL DEFAULT '[]',
+    worker_pid INTEGER,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    started REAL,
+    heartbeat REAL,
+    finished REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, created);
+CREATE TABLE IF NOT EXISTS workers (
+    pid INTEGER PRIMARY KEY,
+    heartbeat REAL NOT NULL
+);
+"""
+
+
+@dataclass(frozen=True)
+class Job:
+    id: str
+    model_id: str
+    file_name: str
+    skip_invalid: bool
+    state: str
+    total_rows: Optional[int]
+    done_chunks: int
+    done_rows: int
+    # model id -> rows predicted high risk so far
+    high_risk: dict
+    problems: Tuple[str, ...]
+    attempts: int
+    created: float
+    started: Optional[float]
+    finished: Optional[float]
+
+    @property
+    def active(self):
+        return self.state in ACTIVE_STATES
+
+    @property
+    def progress(self):
+        """Share of the rows scored, 0 until the rows are counted."""
+        if self.state == "done":
+            return 1.0
+        return min(1.0, self.done_rows / self.total_rows) if self.total_rows else 0.0
+
+    @property
+    def result_path(self):
+        return os.path.join(job_dir(self.id), "result.csv")
+
+
+def job_dir(job_id):
+    return os.path.join(JOBS_DIR, job_id)
+
+
+def _input_path(job_id, file_name):
+    return os.path.join(job_dir(job_id), "input" + os.path.splitext(file_name)[1].lower())
+
+
+def _chunk_path(job_id, index):
+    return os.path.join(job_dir(job_id), "chunk-{0:05d}.csv".format(index))
+
+
+@contextlib.contextmanager
+def _connect():
+    # one short-lived connection per call, so threads and processes never share one
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    connection = sqlite3.connect(os.path.join(JOBS_DIR, "jobs.sqlite3"), timeout=30, isolation_level=None)
+    try:
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(_SCHEMA)
+        yield connection
+    finally:
+        connection.close()
+
+
+def _job(row):
+    return Job(id=row["id"], model_id=row["model_id"], file_name=row["file_name"],
+               skip_invalid=bool(row["skip_invalid"]), state=row["state"], total_rows=row["total_rows"],
+               done_chunks=row["done_chunks"], done_rows=row["done_rows"], high_risk=json.loads(row["high_risk"]),
+               problems=tuple(json.loads(row["problems"])), attempts=row["attempts"], created=row["created"],
+               started=row["started"], finished=row["finished"])
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def enqueue(data, file_name, model_id, skip_invalid=False, start_workers=True):
+    """Queue the upload ``data`` (the bytes of a CSV or Excel file) for scoring; returns the job id."""
+    if model_id not in JOB_MODELS:
+        raise ValueError("Unknown model id {0!r}, expected one of: {1}".format(model_id, ", ".join(JOB_MODELS)))
+    job_id = uuid.uuid4().hex
+    os.makedirs(job_dir(job_id))
+    with open(_input_path(job_id, file_name), "wb") as file:
+        file.write(data)
+    with _connect() as connection:
+        connection.execute("INSERT INTO jobs (id, model_id, file_name, skip_invalid, state, created) "
+                           "VALUES (?, ?, ?, ?, 'queued', ?)",
+                           (job_id, model_id, file_name, int(skip_invalid), time.time()))
+    if start_workers:
+        ensure_workers()
+    return job_id
+
+
+def get_job(job_id):
+    """The ``Job`` with id ``job_id``, or None."""
+    with _connect() as connection:
+        row = connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return _job(row) if row is not None else None
+
+
+def list_jobs(limit=20):
+    """The latest ``limit`` jobs, newest first."""
+    with _connect() as connection:
+        rows = connection.execute("SELECT * FROM jobs ORDER BY created DESC LIMIT ?", (limit,)).fetchall()
+    return [_job(row) for row in rows]
+
+
+def cancel(job_id):
+    """Stop a queued or running job; its worker stops after the current chunk. True if it was active."""
+    with _connect() as connection:
+        cursor = connection.execute("UPDATE jobs SET state = 'cancelled', finished = ? "
+                                    "WHERE id = ? AND state IN ('queued', 'running')", (time.time(), job_id))
+    return cursor.rowcount > 0
+
+
+def ensure_workers(count=DEFAULT_WORKERS):
+    """Start detached worker processes until ``count`` are alive, or one per active job if fewer.
+
+    The workers outlive the Streamlit session and server that started them and
+    exit after ``IDLE_SECONDS`` without a job. Returns the number started.
+    """
+    now = time.time()
+    with _connect() as connection:
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            live = 0
+            for row in connection.execute("SELECT pid, heartbeat FROM workers").fetchall():
+                if row["heartbeat"] > now - STALE_SECONDS and _alive(row["pid"]):
+                    live += 1
+                else:
+                    connection.execute("DELETE FROM workers WHERE pid = ?", (row["pid"],))
+            active = connection.execute("SELECT COUNT(*) FROM jobs WHERE state IN ('queued', 'running')").fetchone()[0]
+            started = max(0, min(count, active) - live)
+            with open(os.path.join(JOBS_DIR, "workers.log"), "ab") as log:
+                for _ in range(started):
+                    process = subprocess.Popen(
+                        [sys.executable, "-m", "pfas_score.jobs", "worker", "--idle-exit", str(IDLE_SECONDS)],
+                        cwd=ROOT_DIR, stdin=subprocess.DEVNULL, stdout=log, stderr=log, start_new_session=True)
+                    # registered right away, so concurrent callers do not start more
+                    connection.execute("INSERT OR REPLACE INTO workers (pid, heartbeat) VALUES (?, ?)",
+                                       (process.pid, now))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+    return started
+
+
+def _claim(pid):
+    # the oldest queued job, or a running one whose worker is gone
+    now = time.time()
+    with _connect() as connection:
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            claimed = None
+            for row in connection.execute("SELECT id, state, worker_pid, heartbeat, attempts FROM jobs "
+                                          "WHERE state IN ('queued', 'running') ORDER BY created").fetchall():
+                if row["state"] == "running" and row["heartbeat"] > now - STALE_SECONDS and _alive(row["worker_pid"]):
+                    continue
+                if row["attempts"] >= MAX_ATTEMPTS:
+                    # the job took its worker down every time, so it would take the next one too
+                    problem = "The worker running this job stopped {0} times, giving up.".format(row["attempts"])
+                    connection.execute("UPDATE jobs SET state = 'failed', problems = ?, finished = ? WHERE id = ?",
+                                       (json.dumps([problem]), now, row["id"]))
+                    continue
+                connection.execute("UPDATE jobs SET state = 'running', worker_pid = ?, heartbeat = ?, "
+                                   "started = COALESCE(started, ?), attempts = attempts + 1 WHERE id = ?",
+                                   (pid, now, now, row["id"]))
+                claimed = _job(connection.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone())
+                break
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+    return claimed
+
+
+def _update(job, **values):
+    # write ``values`` if ``job`` is still running in this process; False if it was cancelled or taken over
+    assignments = ", ".join("{0} = ?".format(name) for name in values)
+    with _connect() as connection:
+        cursor = connection.execute(
+            "UPDATE jobs SET {0} WHERE id = ? AND state = 'running' AND worker_pid = ?".format(assignments),
+            tuple(values.values()) + (job.id, os.getpid()))
+    return cursor.rowcount > 0
+
+
+def _count_rows(path, chunk_size):
+    import pandas as pd
+
+    from .batch import read_table
+
+    if os.path.splitext(path)[1] in (".xlsx", ".xls"):
+        return len(read_table(path))
+    return sum(len(frame) for frame in pd.read_csv(path, usecols=[0], chunksize=chunk_size))
+
+
+def _score(frame, model_id, skip_invalid):
+    # (result, problems, {model id: rows predicted high risk}) of one chunk
+    from . import batch, plant
+
+    if model_id == plant.PLANT_ID:
+        result, problems = plant.score_frame(frame, skip_invalid=skip_invalid)
+        columns = {name: prediction for name, (prediction, _) in plant.RESULT_COLUMNS.items()}
+    else:
+        result, problems = batch.score_frame(frame, model_id, skip_invalid=skip_invalid)
+        columns = {model_id: batch.PREDICTION_COLUMN}
+    if result is None:
+        return None, problems, {}
+    return result, problems, {name: int(result[column].sum()) for name, column in columns.items()}
+
+
+def _join_chunks(job, chunks):
+    # the chunks' rows under the header of the first, written next to result.csv and renamed over it
+    temporary = job.result_path + ".tmp"
+    with open(temporary, "wb") as output:
+        for index in range(chunks):
+            with open(_chunk_path(job.id, index), "rb") as chunk:
+                if index:
+                    chunk.readline()
+                shutil.copyfileobj(chunk, output)
+    os.replace(temporary, job.result_path)
+
+
+def run_job(job, chunk_size=CHUNK_SIZE):
+    """Score the claimed ``job`` from its last checkpoint to the end; returns its final state."""
+    from .cli import read_chunks
+    from .history import log_frame
+    from .metrics import span
+
+    path = _input_path(job.id, job.file_name)
+    try:
+        if job.total_rows is None:
+            if not _update(job, total_rows=_count_rows(path, chunk_size)):
+                return "cancelled"
+        high_risk = dict(job.high_risk)
+        problems = list(job.problems)
+        done_rows = job.done_rows
+        index = -1
+        for index, frame in enumerate(read_chunks(path, chunk_size)):
+            if index < job.done_chunks:
+                continue
+            with span("job_chunk", model=job.model_id):
+                result, chunk_problems, chunk_high_risk = _score(frame, job.model_id, job.skip_invalid)
+            if result is None:
+                _update(job, state="failed", problems=json.dumps(chunk_problems), finished=time.time())
+                return "failed"
+            chunk = _chunk_path(job.id, index)
+            result.to_csv(chunk + ".tmp", index=False)
+            os.replace(chunk + ".tmp", chunk)
+            done_rows += len(result)
+            problems += chunk_problems
+            for name, count in chunk_high_risk.items():
+                high_risk[name] = high_risk.get(name, 0) + count
+            # the checkpoint: the chunk file exists before the database counts it
+            if not _update(job, done_chunks=index + 1, done_rows=done_rows, high_risk=json.dumps(high_risk),
+                           problems=json.dumps(problems), heartbeat=time.time()):
+                return "cancelled"
+            if job.model_id in PAGE_MODELS:
+                log_frame(result, job.model_id, source="job")
+        if index < 0:
+            _update(job, state="failed", problems=json.dumps(["The file does not contain any rows."]),
+                    finished=time.time())
+            return "failed"
+        _join_chunks(job, index + 1)
+    except (ValueError, UnicodeDecodeError) as error:
+        _update(job, state="failed", problems=json.dumps(["Could not read {0}: {1}".format(job.file_name, error)]),
+                finished=time.time())
+        return "failed"
+    except Exception as error:
+        # a missing input, a full disk or a failing model must not take the worker down
+        _update(job, state="failed", problems=json.dumps(["Scoring {0} failed: {1}: {2}".format(
+            job.file_name, type(error).__name__, error)]), finished=time.time())
+        return "failed"
+    if not _update(job, state="done", total_rows=done_rows, finished=time.time()):
+        return "cancelled"
+    for index in range(index + 1):
+        os.remove(_chunk_path(job.id, index))
+    return "done"
+
+
+def purge(days=KEEP_DAYS):
+    """Remove the jobs that finished more than ``days`` days ago, with their files; returns how many."""
+    with _connect() as connection:
+        rows = connection.execute("SELECT id FROM jobs WHERE state NOT IN ('queued', 'running') AND finished < ?",
+                                  (time.time() - days * 86400,)).fetchall()
+        for row in rows:
+            shutil.rmtree(job_dir(row["id"]), ignore_errors=True)
+            connection.execute("DELETE FROM jobs WHERE id = ?", (row["id"],))
+    return len(rows)
+
+
+def _heartbeat(pid, stop):
+    # keeps the worker and its running job fresh while a chunk is scored
+    while not stop.wait(HEARTBEAT_SECONDS):
+        now = time.time()
+        with _connect() as connection:
+            connection.execute("INSERT OR REPLACE INTO workers (pid, heartbeat) VALUES (?, ?)", (pid, now))
+            connection.execute("UPDATE jobs SET heartbeat = ? WHERE state = 'running' AND worker_pid = ?", (now, pid))
+
+
+def run_worker(idle_exit=None, chunk_size=CHUNK_SIZE, log=sys.stderr):
+    """Claim and run jobs until stopped, or until ``idle_exit`` seconds pass without one."""
+    pid = os.getpid()
+    with _connect() as connection:
+        connection.execute("INSERT OR REPLACE INTO workers (pid, heartbeat) VALUES (?, ?)", (pid, time.time()))
+    stop = threading.Event()
+    threading.Thread(target=_heartbeat, args=(pid, stop), daemon=True).start()
+    purge()
+    idle_since = time.monotonic()
+    try:
+        while idle_exit is None or time.monotonic() - idle_since < idle_exit:
+            job = _claim(pid)
+            if job is None:
+                time.sleep(POLL_SECONDS)
+                continue
+            print("worker {0}: job {1} ({2}, {3}), from chunk {4}".format(
+                pid, job.id, job.model_id, job.file_name, job.done_chunks), file=log, flush=True)
+            state = run_job(job, chunk_size)
+            print("worker {0}: job {1} {2}".format(pid, job.id, state), file=log, flush=True)
+            idle_since = time.monotonic()
+    finally:
+        stop.set()
+        with _connect() as connection:
+            connection.execute("DELETE FROM workers WHERE pid = ?", (pid,))
+
+
+def _describe(job):
+    if job.state == "running":
+        rows = "{0}/{1} rows".format(job.done_rows, job.total_rows if job.total_rows is not None else "?")
+    else:
+        rows = "{0} rows".format(job.done_rows)
+    return "{0}  {1:<9} {2:<14} {3:<24} {4}".format(job.id, job.state, job.model_id, rows, job.file_name)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m pfas_score.jobs",
+                                     description="Local job queue for scoring large files in the background.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    worker_parser = subcommands.add_parser("worker", help="run queued jobs")
+    worker_parser.add_argument("--idle-exit", type=float, default=None, metavar="SECONDS",
+                               help="exit after this long without a job (default: never)")
+    worker_parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE,
+                               help="rows per checkpointed chunk (default: %(default)s)")
+    submit_parser = subcommands.add_parser("submit", help="queue a CSV or Excel file")
+    submit_parser.add_argument("input")
+    submit_parser.add_argument("--model", required=True, choices=JOB_MODELS)
+    submit_parser.add_argument("--skip-invalid", action="store_true",
+                               help="leave invalid rows unscored instead of failing the job")
+    submit_parser.add_argument("--wait", action="store_true", help="print the progress until the job finishes")
+    status_parser = subcommands.add_parser("status", help="show one job or the latest jobs")
+    status_parser.add_argument("job", nargs="?")
+    cancel_parser = subcommands.add_parser("cancel", help="cancel a queued or running job")
+    cancel_parser.add_argument("job")
+    purge_parser = subcommands.add_parser("purge", help="remove old finished jobs")
+    purge_parser.add_argument("--days", type=float, default=KEEP_DAYS)
+    args = parser.parse_args(argv)
+
+    if args.command == "worker":
+        run_worker(args.idle_exit, args.chunk_size)
+        return 0
+    if args.command == "submit":
+        with open(args.input, "rb") as file:
+            job_id = enqueue(file.read(), os.path.basename(args.input), args.model, args.skip_invalid)
+        print(job_id)
+        job = get_job(job_id)
+        while args.wait and job.active:
+            time.sleep(POLL_SECONDS)
+            job = get_job(job_id)
+            print(_describe(job), file=sys.stderr)
+        if args.wait:
+            for problem in job.problems:
+                print(problem, file=sys.stderr)
+            if job.state == "done":
+                print(job.result_path)
+            return 0 if job.state == "done" else 1
+        return 0
+    if args.command == "status":
+        jobs = [get_job(args.job)] if args.job else list_jobs()
+        if jobs == [None]:
+            print("No job {0}".format(args.job), file=sys.stderr)
+            return 1
+        for job in jobs:
+            print(_describe(job))
+        return 0
+    if args.command == "cancel":
+        if not cancel(args.job):
+            print("Job {0} is not queued or running".format(args.job), file=sys.stderr)
+            return 1
+        return 0
+    print("removed {0} job(s)".format(purge(args.days)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,625 @@
+"""Long-format lab exports of influent PFAS results, pivoted to the 39 inputs of pages 4 and 5.
+
+    python -m pfas_score.labreport score export.csv --model effluent_pfas --output scored.csv
+    python -m pfas_score.labreport score export.csv --model biosolid_pfas --non-detects half
+    python -m pfas_score.labreport bench --samples 200000
+
+Labs deliver PFAS results one analyte per row: a sample, an analyte, a result
+and usually a qualifier, a unit and a detection limit. ``read_export`` reads
+such a file row by row and recognises its columns by their usual names (see
+``COLUMNS``). It maps every analyte name, synonym or CAS number to one of the
+39 ``features.CHEMICALS`` (see ``ANALYTES``) and ignores any other analyte,
+such as labelled standards or sums. Results are converted to ng/L (see
+``UNITS``).
+
+A non-detect is a result qualified U or ND, written as ``<2.0``, ``ND`` and
+the like, or flagged as not detected. It counts as 0 by default, or as half
+or all of its detection limit. The limit is the number after ``<`` or the
+detection limit column. An analyte a sample has no result for is 0, like the
+default of the forms. When a sample has more than one result for an analyte,
+the highest is kept.
+
+Memory stays bounded for exports of any size. At most ``MAX_OPEN_SAMPLES``
+pivoted samples are held in memory; beyond that they are spilled to a
+temporary SQLite file and merged back in order of first appearance while the
+samples are scored in chunks of ``CHUNK_SAMPLES``. Excel files cannot be read
+incrementally and are loaded whole.
+"""
+
+import argparse
+import collections
+import contextlib
+import csv
+import io
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from .features import CHEMICALS
+from .history import PLANT_COLUMNS
+
+# the models of pages 4 and 5, which take the 39 chemicals as inputs
+LABREPORT_MODELS = ["effluent_pfas", "biosolid_pfas"]
+
+SAMPLE_COLUMN = "Sample"
+PLANT_COLUMN = "Plant"
+
+# pivoted samples held in memory before they are spilled to disk
+MAX_OPEN_SAMPLES = 20000
+CHUNK_SAMPLES = 20000
+
+# how a non-detect is counted
+NON_DETECTS = {
+    "zero": 0.0,
+    "half": 0.5,
+    "limit": 1.0,
+}
+DEFAULT_NON_DETECTS = "zero"
+
+# analyte names other than listed here are counted, up to this many distinct ones
+_MAX_UNKNOWN = 100
+
+# distinct analyte names and units remembered per export, so the rows of an export
+# do not normalize the same few names over and over again
+_MAX_REMEMBERED = 10000
+
+# the columns of an export, by their usual names (compared ignoring case, "_" and repeated spaces)
+COLUMNS = {
+    "sample": ["sample", "sample id", "sample name", "sample code", "client sample id", "field sample id",
+               "lab sample id", "sys sample code", "sampleid"],
+    "analyte": ["analyte", "analyte name", "parameter", "parameter name", "compound", "chemical", "chemical name",
+                "chem name", "component"],
+    "cas": ["cas", "cas number", "cas no", "cas rn", "casrn", "cas #"],
+    "result": ["result", "result value", "value", "concentration", "conc", "result numeric", "measured value",
+               "final result", "amount"],
+    "qualifier": ["qualifier", "qualifiers", "lab qualifier", "lab qualifiers", "result qualifier",
+                  "validation qualifier", "interpreted qualifiers", "flag", "flags"],
+    "detected": ["detect flag", "detected", "detect"],
+    "unit": ["unit", "units", "result unit", "result units", "uom", "unit of measure"],
+    "limit": ["detection limit", "reporting limit", "method detection limit", "quantitation limit", "report limit",
+              "reporting detection limit", "mdl", "rl", "mrl", "dl", "lod", "loq"],
+    "plant": PLANT_COLUMNS,
+}
+REQUIRED_COLUMNS = ["sample", "analyte", "result"]
+
+# chemical -> other names and CAS numbers labs report it under (its own name, without
+# the unit, is recognised too)
+SYNONYMS = {
+    "PFBA (ng/L)": ["perfluorobutanoic acid", "perfluorobutyric acid", "375-22-4"],
+    "PFPeA (ng/L)": ["perfluoropentanoic acid", "2706-90-3"],
+    "PFHxA (ng/L)": ["perfluorohexanoic acid", "307-24-4"],
+    "PFHpA (ng/L)": ["perfluoroheptanoic acid", "375-85-9"],
+    "PFOA (ng/L)": ["perfluorooctanoic acid", "335-67-1"],
+    "PFNA (ng/L)": ["perfluorononanoic acid", "375-95-1"],
+    "PFDA (ng/L)": ["perfluorodecanoic acid", "335-76-2"],
+    "PFUnA (ng/L)": ["PFUnDA", "perfluoroundecanoic acid", "2058-94-8"],
+    "PFDoA (ng/L)": ["PFDoDA", "perfluorododecanoic acid", "307-55-1"],
+    "PFTrDA (ng/L)": ["PFTrA", "perfluorotridecanoic acid", "72629-94-8"],
+    "PFTA (ng/L)": ["PFTeDA", "PFTeA", "perfluorotetradecanoic acid", "376-06-7"],
+    "PFHxDA (ng/L)": ["perfluorohexadecanoic acid", "67905-19-5"],
+    "PFODA (ng/L)": ["perfluorooctadecanoic acid", "16517-11-6"],
+    "3:3 FTCA (ng/L)": ["FPrPA", "3:3 fluorotelomer carboxylic acid", "356-02-5"],
+    "5:3 FTCA (ng/L)": ["FPePA", "5:3 fluorotelomer carboxylic acid", "914637-49-3"],
+    "7:3 FTCA (ng/L)": ["FHpPA", "7:3 fluorotelomer carboxylic acid", "812-70-4"],
+    "4:2 FTS (ng/L)": ["4:2 FTSA", "4:2 fluorotelomer sulfonic acid", "757124-72-4"],
+    "6:2 FTS (ng/L)": ["6:2 FTSA", "6:2 fluorotelomer sulfonic acid", "27619-97-2"],
+    "8:2 FTS (ng/L)": ["8:2 FTSA", "8:2 fluorotelomer sulfonic acid", "39108-34-4"],
+    "10:2 FTS (ng/L)": ["10:2 FTSA", "10:2 fluorotelomer sulfonic acid", "120226-60-0"],
+    "PFBS (ng/L)": ["perfluorobutanesulfonic acid", "375-73-5"],
+    "PFPeS (ng/L)": ["perfluoropentanesulfonic acid", "2706-91-4"],
+    "PFHxS (ng/L)": ["perfluorohexanesulfonic acid", "355-46-4"],
+    "PFHpS (ng/L)": ["perfluoroheptanesulfonic acid", "375-92-8"],
+    "PFOS (ng/L)": ["perfluorooctanesulfonic acid", "1763-23-1"],
+    "PFNS (ng/L)": ["perfluorononanesulfonic acid", "68259-12-1"],
+    "PFDS (ng/L)": ["perfluorodecanesulfonic acid", "335-77-3"],
+    "PFDoS (ng/L)": ["PFDoDS", "perfluorododecanesulfonic acid", "79780-39-5"],
+    "FOSA (ng/L)": ["PFOSA", "perfluorooctanesulfonamide", "754-91-6"],
+    "MeFOSA (ng/L)": ["NMeFOSA", "N-methyl perfluorooctanesulfonamide", "31506-32-8"],
+    "EtFOSA (ng/L)": ["NEtFOSA", "N-ethyl perfluorooctanesulfonamide", "4151-50-2"],
+    "MeFOSE (ng/L)": ["NMeFOSE", "N-methyl perfluorooctanesulfonamidoethanol", "24448-09-7"],
+    "EtFOSE (ng/L)": ["NEtFOSE", "N-ethyl perfluorooctanesulfonamidoethanol", "1691-99-2"],
+    "NMeFOSAA (ng/L)": ["MeFOSAA", "N-methyl perfluorooctanesulfonamidoacetic acid", "2355-31-9"],
+    "NEtFOSAA (ng/L)": ["EtFOSAA", "N-ethyl perfluorooctanesulfonamidoacetic acid", "2991-50-6"],
+    "ADONA (ng/L)": ["4,8-dioxa-3H-perfluorononanoic acid", "919005-14-4"],
+    "HFPO_DA (GenX) (ng/L)": ["HFPO-DA", "GenX", "hexafluoropropylene oxide dimer acid", "13252-13-6"],
+    "11ClPF3OUDS (ng/L)": ["11-chloroeicosafluoro-3-oxaundecane-1-sulfonic acid", "763051-92-9"],
+    "9ClPF3ONS (ng/L)": ["9-chlorohexadecafluoro-3-oxanonane-1-sulfonic acid", "756426-58-1"],
+}
+
+# unit -> factor to ng/L (compared ignoring case and spaces, with µ written as u)
+UNITS = {
+    "ng/l": 1.0,
+    "ppt": 1.0,
+    "pg/ml": 1.0,
+    "pg/l": 1e-3,
+    "ug/l": 1e3,
+    "ppb": 1e3,
+    "ng/ml": 1e3,
+    "mg/l": 1e6,
+    "ppm": 1e6,
+    "ug/ml": 1e6,
+}
+
+# results that mean "not detected"
+_NON_DETECT_RESULTS = {"nd", "n.d.", "non-detect", "nondetect", "not detected", "bdl", "<mdl", "<rl", "<dl", "<lod",
+                       "<loq", "<mrl", "u"}
+
+
+def _column_key(name):
+    return " ".join(str(name).replace("_", " ").split()).lower()
+
+
+def _analyte_key(name):
+    # "PFOS (ng/L)", "pfos", "Perfluorooctane sulfonate" and "perfluorooctanesulfonic acid"
+    # all compare equal to their chemical's name or synonyms
+    key = re.sub(r"\((ng/l|ng/ l)\)", "", str(name).lower().replace("µ", "u").replace("μ", "u"))
+    key = re.sub(r"[^a-z0-9]", "", key)
+    return re.sub(r"(icacid|ate)$", "ic", key)
+
+
+# analyte key -> index of the chemical in CHEMICALS
+ANALYTES = {}
+for _index, _chemical in enumerate(CHEMICALS):
+    for _name in [_chemical] + SYNONYMS[_chemical]:
+        ANALYTES[_analyte_key(_name)] = _index
+
+
+def _chemical_index(name):
+    # index in CHEMICALS of the analyte ``name``, or None; "Hexafluoropropylene oxide
+    # dimer acid (HFPO-DA)" is also looked up by the names in and out of the parentheses
+    index = ANALYTES.get(_analyte_key(name))
+    if index is None and "(" in str(name):
+        parts = [re.sub(r"\(.*?\)", " ", str(name))] + re.findall(r"\((.*?)\)", str(name))
+        index = next((ANALYTES[_analyte_key(part)] for part in parts if _analyte_key(part) in ANALYTES), None)
+    return index
+
+
+def _unit_key(unit):
+    return re.sub(r"\s", "", str(unit).lower().replace("µ", "u").replace("μ", "u"))
+
+
+def _number(text):
+    # the float in ``text`` ("12.5", "<2.0", "< 2"), or None
+    try:
+        value = float(str(text).strip().lstrip("<").strip())
+    except ValueError:
+        return None
+    return value if np.isfinite(value) else None
+
+
+_SPILL_SCHEMA = """
+CREATE TABLE samples (
+    sample TEXT PRIMARY KEY,
+    -- order of first appearance in the export
+    seen INTEGER NOT NULL,
+    plant TEXT
+);
+CREATE TABLE partial (
+    sample TEXT NOT NULL,
+    -- float64 values in CHEMICALS order, NaN where no result was read
+    inputs BLOB NOT NULL
+);
+"""
+
+
+class Export:
+    """The samples of a long-format export, one row of the 39 chemicals per sample.
+
+    Rows are added with ``add``; ``chunks`` then yields the samples in order of
+    first appearance. ``problems`` lists the rows that could not be read (the
+    export should not be scored when there are any), ``notes`` what was
+    assumed or ignored.
+    """
+
+    def __init__(self, non_detects=DEFAULT_NON_DETECTS, max_open_samples=MAX_OPEN_SAMPLES):
+        if non_detects not in NON_DETECTS:
+            raise ValueError("non_detects must be one of " + ", ".join(NON_DETECTS))
+        self.non_detects = non_detects
+        self.max_open_samples = max_open_samples
+        self.rows = 0
+        self.results = 0
+        self.non_detect_results = 0
+        self.converted_results = 0
+        self.rejected_results = 0
+        self.assumed_unit_results = 0
+        self.duplicate_results = 0
+        self.incomplete_samples = 0
+        self.unknown_analytes = collections.Counter()
+        self.missing_columns = []
+        # reason -> [rows, first line numbers]
+        self._invalid = {}
+        # (analyte, cas) -> index in CHEMICALS or None; unit -> factor to ng/L or None
+        self._indexes = {}
+        self._factors = {}
+        # sample -> [order of first appearance, plant, values in CHEMICALS order, None where
+        # no result was read]; dicts keep insertion order
+        self._open = {}
+        self._seen = 0
+        self._spill = None
+        self._spill_path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Delete the spill file, if any."""
+        if self._spill is not None:
+            self._spill.close()
+            os.remove(self._spill_path)
+            self._spill = None
+
+    def _reject(self, reason, line):
+        invalid = self._invalid.setdefault(reason, [0, []])
+        invalid[0] += 1
+        if len(invalid[1]) < 5:
+            invalid[1].append(line)
+
+    @property
+    def problems(self):
+        """One message per reason rows were rejected for, like ``batch.validate_frame``."""
+        problems = ["Missing columns: " + ", ".join(self.missing_columns)] if self.missing_columns else []
+        for reason, (count, lines) in self._invalid.items():
+            listed = ", ".join(str(line) for line in lines)
+            if count > len(lines):
+                listed += " and {0} more".format(count - len(lines))
+            problems.append("{0} in row(s) {1}".format(reason, listed))
+        return problems
+
+    @property
+    def notes(self):
+        """What was assumed or left out, complete once ``chunks`` has been consumed."""
+        notes = []
+        if self.non_detect_results:
+            notes.append("{0} non-detects counted as {1}.".format(self.non_detect_results, {
+                "zero": "0", "half": "half their detection limit", "limit": "their detection limit"}[self.non_detects]))
+        if self.converted_results:
+            notes.append("{0} results converted to ng/L.".format(self.converted_results))
+        if self.assumed_unit_results:
+            notes.append("{0} results without a unit read as ng/L.".format(self.assumed_unit_results))
+        if self.rejected_results:
+            notes.append("{0} results qualified R (rejected) left out.".format(self.rejected_results))
+        if self.duplicate_results:
+            notes.append("{0} repeated results of an analyte in the same sample; the highest was kept.".format(
+                self.duplicate_results))
+        if self.incomplete_samples:
+            notes.append("{0} samples without a result for some of the 39 analytes; those are 0, like the default "
+                         "of the form.".format(self.incomplete_samples))
+        if self.unknown_analytes:
+            names = [name for name, _ in self.unknown_analytes.most_common(10)]
+            notes.append("{0} rows of other analytes ignored: {1}{2}.".format(
+                sum(self.unknown_analytes.values()), ", ".join(names),
+                " and more" if len(self.unknown_analytes) > len(names) else ""))
+        return notes
+
+    def _value(self, result, qualifier, detected, unit, limit, line):
+        # the result in ng/L, or None if the row was rejected or left out
+        qualifier = str(qualifier).strip().upper()
+        text = str(result).strip()
+        if qualifier == "R":
+            self.rejected_results += 1
+            return None
+        non_detect = (text.startswith("<") or text.lower() in _NON_DETECT_RESULTS or "U" in qualifier
+                      or "ND" in qualifier or qualifier.startswith("<") or qualifier.lower() in _NON_DETECT_RESULTS
+                      or str(detected).strip().lower() in ("n", "no", "false", "0"))
+        if non_detect and self.non_detects == "zero":
+            self.non_detect_results += 1
+            return 0.0
+        value = _number(text)
+        if non_detect and value is None:
+            value = _number(limit)
+            if value is None:
+                self._reject("Non-detect without a detection limit", line)
+                return None
+        elif value is None:
+            self._reject("Result is not a valid number", line)
+            return None
+        if value < 0:
+            self._reject("Negative result", line)
+            return None
+
+        unit = str(unit).strip()
+        factor = self._factors.get(unit, 0.0) if unit else 1.0
+        if factor == 0.0:
+            factor = UNITS.get(_unit_key(unit))
+            if len(self._factors) < _MAX_REMEMBERED:
+                self._factors[unit] = factor
+        if not unit:
+            self.assumed_unit_results += 1
+        elif factor is None:
+            self._reject("Unit {0} is not a concentration in water".format(unit), line)
+            return None
+        elif factor != 1.0:
+            self.converted_results += 1
+            value *= factor
+        if non_detect:
+            self.non_detect_results += 1
+            value *= NON_DETECTS[self.non_detects]
+        return value
+
+    def add(self, sample, analyte, result, qualifier="", detected="", unit="", limit="", cas="", plant="",
+            line=0):
+        """Read one row of the export; ``line`` is its row number, for the messages."""
+        self.rows += 1
+        sample = str(sample).strip()
+        if not sample or sample.lower() == "nan":
+            self._reject("Missing sample", line)
+            return
+        index = self._indexes.get((analyte, cas), -1)
+        if index == -1:
+            index = _chemical_index(analyte)
+            if index is None and cas:
+                index = _chemical_index(cas)
+            if len(self._indexes) < _MAX_REMEMBERED:
+                self._indexes[analyte, cas] = index
+        if index is None:
+            name = str(analyte).strip()
+            if name in self.unknown_analytes or len(self.unknown_analytes) < _MAX_UNKNOWN:
+                self.unknown_analytes[name] += 1
+            return
+        value = self._value(result, qualifier, detected, unit, limit, line)
+        if value is None:
+            return
+
+        self.results += 1
+        entry = self._open.get(sample)
+        if entry is None:
+            if len(self._open) >= self.max_open_samples:
+                self._spill_open()
+            self._seen += 1
+            entry = self._open[sample] = [self._seen, str(plant).strip(), [None] * len(CHEMICALS)]
+        values = entry[2]
+        if values[index] is None:
+            values[index] = value
+        else:
+            self.duplicate_results += 1
+            values[index] = max(values[index], value)
+
+    def _spill_open(self):
+        # move the samples held in memory to the spill file
+        if self._spill is None:
+            descriptor, self._spill_path = tempfile.mkstemp(prefix="pfas_labreport_", suffix=".sqlite3")
+            os.close(descriptor)
+            self._spill = sqlite3.connect(self._spill_path, isolation_level=None)
+            self._spill.execute("PRAGMA journal_mode=OFF")
+            self._spill.execute("PRAGMA synchronous=OFF")
+            self._spill.executescript(_SPILL_SCHEMA)
+        self._spill.execute("BEGIN")
+        self._spill.executemany("INSERT OR IGNORE INTO samples (sample, seen, plant) VALUES (?, ?, ?)",
+                                [(sample, seen, plant) for sample, (seen, plant, _) in self._open.items()])
+        self._spill.executemany("INSERT INTO partial (sample, inputs) VALUES (?, ?)",
+                                [(sample, np.array(values, dtype=np.float64).tobytes())
+                                 for sample, (_, _, values) in self._open.items()])
+        self._spill.execute("COMMIT")
+        self._open.clear()
+
+    def _samples(self):
+        # (sample, plant, values) in order of first appearance, partial rows merged
+        if self._spill is None:
+            for sample, (_, plant, values) in self._open.items():
+                yield sample, plant, values
+            return
+        if self._open:
+            self._spill_open()
+        rows = self._spill.execute("SELECT s.sample, s.plant, p.inputs FROM samples AS s JOIN partial AS p "
+                                   "USING (sample) ORDER BY s.seen, p.rowid")
+        current = None
+        for sample, plant, inputs in rows:
+            values = np.frombuffer(inputs, dtype=np.float64)
+            if current is not None and current[0] == sample:
+                self.duplicate_results += int((~np.isnan(current[2]) & ~np.isnan(values)).sum())
+                current[2] = np.fmax(current[2], values)
+                continue
+            if current is not None:
+                yield current
+            current = [sample, plant, values]
+        if current is not None:
+            yield current
+
+    def chunks(self, size=CHUNK_SAMPLES):
+        """Yield ``(samples, plants, X)`` of at most ``size`` samples, X in ``CHEMICALS`` order.
+
+        ``plants`` is None when the export has no plant column.
+        """
+        samples, plants, rows = [], [], []
+        for sample, plant, values in self._samples():
+            samples.append(sample)
+            plants.append(plant)
+            rows.append(values)
+            if len(rows) == size:
+                yield self._chunk(samples, plants, rows)
+                samples, plants, rows = [], [], []
+        if rows:
+            yield self._chunk(samples, plants, rows)
+
+    def _chunk(self, samples, plants, rows):
+        X = np.array(rows, dtype=np.float64)
+        missing = np.isnan(X)
+        self.incomplete_samples += int(missing.any(axis=1).sum())
+        X[missing] = 0.0
+        return samples, plants if any(plants) else None, X
+
+
+def _find_columns(header):
+    # column kind -> position in the header row
+    positions = {}
+    keys = [_column_key(name) for name in header]
+    for kind, names in COLUMNS.items():
+        position = next((keys.index(name) for name in names if name in keys), None)
+        if position is not None:
+            positions[kind] = position
+    return positions
+
+
+def _rows(file, name):
+    # the rows of a CSV (streamed) or Excel file, header first, as lists of strings
+    if os.path.splitext(name)[1].lower() in (".xlsx", ".xls"):
+        import pandas as pd
+
+        try:
+            frame = pd.read_excel(file, dtype=str, keep_default_na=False)
+        except ImportError:
+            raise ValueError("Reading Excel files requires openpyxl, please upload a CSV file instead.") from None
+        yield [str(column) for column in frame.columns]
+        yield from frame.itertuples(index=False, name=None)
+        return
+    with contextlib.ExitStack() as stack:
+        if isinstance(file, (str, os.PathLike)):
+            text = stack.enter_context(open(file, newline="", encoding="utf-8-sig"))
+        else:
+            text = stack.enter_context(io.TextIOWrapper(file, encoding="utf-8-sig", newline=""))
+        yield from csv.reader(text)
+
+
+def read_export(file, name=None, non_detects=DEFAULT_NON_DETECTS, max_open_samples=MAX_OPEN_SAMPLES):
+    """Read a long-format export into an ``Export``.
+
+    ``file`` can be a path or a binary file-like object; ``name`` is used to
+    pick the format when ``file`` has no usable file name of its own.
+    """
+    name = name or getattr(file, "name", None) or str(file)
+    export = Export(non_detects, max_open_samples)
+    rows = _rows(file, name)
+    header = next(rows, None)
+    if header is None:
+        export.missing_columns = [COLUMNS[kind][0] for kind in REQUIRED_COLUMNS]
+        return export
+    positions = _find_columns(header)
+    export.missing_columns = [COLUMNS[kind][0] for kind in REQUIRED_COLUMNS if kind not in positions]
+    if export.missing_columns:
+        return export
+    width = max(positions.values()) + 1
+    for line, row in enumerate(rows, start=2):
+        if not any(row):
+            continue
+        if len(row) < width:
+            row = list(row) + [""] * (width - len(row))
+        export.add(line=line, **{kind: row[position] for kind, position in positions.items()})
+    return export
+
+
+def score_export(export, model_id, chunk_size=CHUNK_SAMPLES, classifier=None):
+    """Yield the scored samples of ``export`` as DataFrames of at most ``chunk_size`` samples.
+
+    Each has a sample column, the plant column if the export has one, the 39
+    chemicals in ng/L and the prediction and probability of high risk.
+    """
+    import pandas as pd
+
+    from .batch import PREDICTION_COLUMN, PROBABILITY_COLUMN, predict_matrix
+    from .registry import get_model
+
+    if model_id not in LABREPORT_MODELS:
+        raise ValueError("{0} does not take the 39 chemicals as inputs".format(model_id))
+    if classifier is None:
+        classifier = get_model(model_id)
+    for samples, plants, X in export.chunks(chunk_size):
+        predictions, probabilities = predict_matrix(X, model_id, classifier)
+        frame = pd.DataFrame(X, columns=CHEMICALS)
+        if plants is not None:
+            frame.insert(0, PLANT_COLUMN, plants)
+        frame.insert(0, SAMPLE_COLUMN, samples)
+        frame[PREDICTION_COLUMN] = predictions
+        frame[PROBABILITY_COLUMN] = probabilities
+        yield frame
+
+
+def template_csv():
+    """A short example export: two samples, with a non-detect, a conversion and an ignored standard."""
+    rows = [
+        ["Sample ID", "Analyte", "CAS Number", "Result", "Units", "Qualifier", "Reporting Limit"],
+        ["INF-2024-01", "PFOA", "335-67-1", "12.5", "ng/L", "", "2.0"],
+        ["INF-2024-01", "PFOS", "1763-23-1", "<2.0", "ng/L", "U", "2.0"],
+        ["INF-2024-01", "Perfluorohexanoic acid", "307-24-4", "0.031", "ug/L", "J", "0.002"],
+        ["INF-2024-01", "13C4-PFOA", "", "95", "%", "", ""],
+        ["INF-2024-02", "PFBA", "375-22-4", "8.1", "ng/L", "", "4.0"],
+        ["INF-2024-02", "HFPO-DA", "13252-13-6", "ND", "ng/L", "", "2.0"],
+    ]
+    text = io.StringIO()
+    csv.writer(text, lineterminator="\n").writerows(rows)
+    return text.getvalue().encode("utf-8")
+
+
+def synthetic_export(path, samples, seed=0):
+    """Write a long export of ``samples`` samples with every chemical to ``path``, a row at a time."""
+    rng = np.random.default_rng(seed)
+    names = [re.sub(r" \(ng/L\)$", "", chemical) for chemical in CHEMICALS]
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["Sample ID", "Analyte", "Result", "Units", "Qualifier", "MDL"])
+        for sample in range(samples):
+            values = rng.lognormal(1.0, 1.5, len(names))
+            detected = rng.random(len(names)) < 0.6
+            for name, value, hit in zip(names, values, detected):
+                writer.writerow(["S{0:07d}".format(sample), name, "{0:.3f}".format(value) if hit else "<1.0",
+                                 "ng/L", "" if hit else "U", "1.0"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m pfas_score.labreport",
+                                     description="Score long-format lab exports with the models of pages 4 and 5.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    score_parser = subcommands.add_parser("score", help="score a CSV or Excel lab export")
+    score_parser.add_argument("input")
+    score_parser.add_argument("--model", required=True, choices=LABREPORT_MODELS)
+    score_parser.add_argument("--output", "-o", help="CSV file to write one scored row per sample to")
+    score_parser.add_argument("--non-detects", choices=list(NON_DETECTS), default=DEFAULT_NON_DETECTS,
+                              help="how non-detects are counted (default: %(default)s)")
+    bench_parser = subcommands.add_parser("bench", help="read and score a synthetic export, reporting peak memory")
+    bench_parser.add_argument("--model", default="effluent_pfas", choices=LABREPORT_MODELS)
+    bench_parser.add_argument("--samples", type=int, default=100000)
+    args = parser.parse_args(argv)
+
+    from .batch import PREDICTION_COLUMN
+
+    if args.command == "bench":
+        import resource
+
+        path = os.path.join(tempfile.gettempdir(), "pfas_labreport_bench.csv")
+        synthetic_export(path, args.samples)
+        print("{0}: {1} samples, {2} rows, {3:.0f} MB".format(args.model, args.samples, args.samples * len(CHEMICALS),
+                                                             os.path.getsize(path) / 2 ** 20))
+        start = time.perf_counter()
+        with read_export(path) as export:
+            read = time.perf_counter()
+            high_risk = sum(int(frame[PREDICTION_COLUMN].sum()) for frame in score_export(export, args.model))
+        os.remove(path)
+        print("read {0:.2f} s, scored {1:.2f} s, {2} high risk".format(read - start, time.perf_counter() - read,
+                                                                      high_risk))
+        # kilobytes on Linux
+        print("peak memory {0:.0f} MB".format(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+        return 0
+
+    try:
+        export = read_export(args.input, non_detects=args.non_detects)
+    except (OSError, ValueError, UnicodeDecodeError) as error:
+        print("error: {0}".format(error), file=sys.stderr)
+        return 1
+    with export:
+        if export.problems:
+            print("error: invalid input\n" + "\n".join(export.problems), file=sys.stderr)
+            return 1
+        samples = high_risk = 0
+        with contextlib.ExitStack() as stack:
+            output = stack.enter_context(open(args.output, "w", newline="")) if args.output else None
+            for frame in score_export(export, args.model):
+                samples += len(frame)
+                high_risk += int(frame[PREDICTION_COLUMN].sum())
+                if output is not None:
+                    frame.to_csv(output, index=False, header=output.tell() == 0)
+        print("{0} samples from {1} rows: {2} high risk, {3} low risk".format(samples, export.rows, high_risk,
+                                                                           samples - high_risk))
+        for note in export.notes:
+            print(note)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,446 @@
+"""Load test of a running app: concurrent sessions making predictions on pages 1-5.
+
+    python -m pfas_score.loadtest                                 # start a server, ramp up to 32 sessions
+    python -m pfas_score.loadtest --sessions 1,8,64 --predictions 20 --output load.json
+    python -m pfas_score.loadtest --url http://localhost:8501 --pid 12345
+
+Every simulated session talks to the server the way a browser tab does, over
+Streamlit's websocket (``/_stcore/stream``) and its protobuf messages. It
+opens the app and then one of pages 1-5, taking turns with the other
+sessions. It fills in the page's form with the default inputs varied by up
+to ``JITTER``, so that not every prediction comes from the prediction cache,
+and clicks Make Prediction. It repeats this ``--predictions`` times,
+pausing ``--think`` seconds between clicks.
+
+The number of concurrent sessions is raised level by level. The predictions of
+a level start together once all of its sessions have opened their page. For
+every level the test reports:
+
+- the predictions per second
+- the latency of the predicting reruns (median, 95th and 99th percentile)
+- the failed predictions
+- the CPU the server used, in cores and per prediction
+- its resident memory while all sessions of the level are still connected
+
+Memory per session is the growth of the resident memory over the warmed-up
+server, divided by the number of sessions. The saturation point is the first
+level at which the 95th percentile exceeds ``--p95-target``, or at which the
+additional sessions raise the throughput by less than ``SATURATION_GAIN``.
+
+Without ``--url`` a server is started on a free port for the test. Its
+predictions are recorded in a temporary prediction history. CPU and memory
+are read from ``/proc`` (Linux only), for that server or for ``--pid``. The
+simulated sessions run in this process and compete with a local server for
+the CPU. They are light, but on a small machine point ``--url`` at a server
+running elsewhere.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from .benchmark import page_path
+from .registry import ROOT_DIR
+
+# the pages with a Make Prediction form, by their id in benchmark.PAGES
+LOAD_PAGES = ["influent", "effluent", "biosolid", "effluent_pfas", "biosolid_pfas"]
+
+DEFAULT_SESSIONS = [1, 2, 4, 8, 16, 32]
+DEFAULT_PREDICTIONS = 10
+DEFAULT_P95_TARGET = 1.0
+
+# numeric inputs are the page default times a factor in [1 - JITTER, 1 + JITTER]
+JITTER = 0.2
+
+# a level saturates the server when it adds less than this much throughput (0.1 = 10%)
+SATURATION_GAIN = 0.1
+
+# seconds to wait for the server to start and for a rerun to finish
+START_TIMEOUT = 60
+RUN_TIMEOUT = 120
+
+SUBMIT_LABEL = "Make Prediction"
+
+# the start of the result text of pages 1-3 and of pages 4-5
+RESULT_TEXTS = ("Total PFAS risk is", "Total PFAS is at")
+
+
+def page_name(page_id):
+    """The name Streamlit gives the page ``page_id``: its file name without the number and extension."""
+    return re.sub(r"^\d+_", "", os.path.splitext(os.path.basename(page_path(page_id)))[0])
+
+
+class Session:
+    """One simulated browser session."""
+
+    def __init__(self, url, seed=0):
+        import random
+
+        self.url = url
+        self.random = random.Random(seed)
+        self.connection = None
+        # page name -> page script hash, from the server
+        self.pages = {}
+        # (element type, widget proto) of the widgets of the last run
+        self.widgets = []
+        # error messages and texts written by the last run
+        self.errors = []
+        self.texts = []
+        # hash -> ForwardMsg already received, which the server may send again as a reference
+        self._received = {}
+
+    async def connect(self):
+        from tornado.websocket import websocket_connect
+
+        self.connection = await asyncio.wait_for(
+            websocket_connect(re.sub("^http", "ws", self.url.rstrip("/")) + "/_stcore/stream"), RUN_TIMEOUT)
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    async def run(self, page_script_hash="", widget_states=()):
+        """Rerun the script of a page with ``widget_states``; returns the seconds until it finished."""
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        message = BackMsg()
+        message.rerun_script.page_script_hash = page_script_hash
+        message.rerun_script.widget_states.widgets.extend(widget_states)
+        self.widgets, self.errors, self.texts = [], [], []
+        start = time.perf_counter()
+        await self.connection.write_message(message.SerializeToString(), binary=True)
+        while True:
+            data = await asyncio.wait_for(self.connection.read_message(), RUN_TIMEOUT)
+            if data is None:
+                raise ConnectionError("the server closed the connection")
+            received = ForwardMsg()
+            received.ParseFromString(data)
+            if received.WhichOneof("type") == "ref_hash":
+                received = self._received[received.ref_hash]
+            elif received.hash:
+                self._received[received.hash] = received
+            kind = received.WhichOneof("type")
+            if kind == "new_session":
+                self.pages = {page.page_name: page.page_script_hash for page in received.new_session.app_pages}
+            elif kind == "delta" and received.delta.WhichOneof("type") == "new_element":
+                self._element(received.delta.new_element)
+            elif kind == "script_finished":
+                if received.script_finished == ForwardMsg.FINISHED_WITH_COMPILE_ERROR:
+                    self.errors.append("the page failed to compile")
+                return time.perf_counter() - start
+
+    def _element(self, element):
+        from streamlit.proto.Alert_pb2 import Alert
+
+        kind = element.WhichOneof("type")
+        if kind in ("button", "number_input", "selectbox", "text_input"):
+            self.widgets.append((kind, getattr(element, kind)))
+        elif kind == "markdown":
+            self.texts.append(element.markdown.body)
+        elif kind == "exception":
+            self.errors.append(element.exception.message)
+        elif kind == "alert" and element.alert.format == Alert.ERROR:
+            self.errors.append(element.alert.body)
+
+    @property
+    def predicted(self):
+        """Whether the last run showed a prediction."""
+        return any(text.startswith(RESULT_TEXTS) for text in self.texts)
+
+    def submit_form(self):
+        """Widget states filling in the form of the last run and clicking Make Prediction (None without one)."""
+        from streamlit.proto.NumberInput_pb2 import NumberInput
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        states, submit = [], None
+        for kind, widget in self.widgets:
+            if not widget.form_id:
+                continue
+            state = WidgetState(id=widget.id)
+            if kind == "button":
+                if widget.label != SUBMIT_LABEL:
+                    continue
+                state.trigger_value = True
+                submit = state
+            elif kind == "text_input":
+                state.string_value = self._vary(widget.default)
+            elif kind == "number_input":
+                if widget.data_type == NumberInput.INT:
+                    state.int_value = int(widget.default)
+                else:
+                    state.double_value = widget.default
+            else:
+                state.int_value = self.random.randrange(len(widget.options))
+            states.append(state)
+        return states if submit is not None else None
+
+    def _vary(self, text):
+        try:
+            value = float(text)
+        except ValueError:
+            return text
+        return repr(value * self.random.uniform(1 - JITTER, 1 + JITTER))
+
+
+async def _simulate(url, page_id, predictions, think, seed, ready, start, result):
+    # one session: open the app and a page, wait for the other sessions of the
+    # level, then predict; latencies and failures are appended to ``result``
+    session = Session(url, seed)
+    try:
+        try:
+            await session.connect()
+            await session.run()
+            page_script_hash = session.pages[page_name(page_id)]
+            await session.run(page_script_hash)
+            if session.submit_form() is None:
+                raise RuntimeError("no {0} button on {1}".format(SUBMIT_LABEL, page_id))
+        finally:
+            ready()
+        await start.wait()
+        for i in range(predictions):
+            if i and think:
+                await asyncio.sleep(think)
+            seconds = await session.run(page_script_hash, session.submit_form())
+            if session.errors or not session.predicted:
+                result["failures"].append("{0}: {1}".format(page_id, "; ".join(session.errors) or "no prediction"))
+            else:
+                result["latencies"].append(seconds)
+    except Exception as error:
+        result["failures"].append("{0}: {1}: {2}".format(page_id, type(error).__name__, error))
+    return session
+
+
+def _cpu_seconds(pid):
+    # user + system CPU seconds of the process, or None
+    try:
+        with open("/proc/{0}/stat".format(pid)) as file:
+            fields = file.read().rsplit(")", 1)[1].split()
+    except (OSError, TypeError):
+        return None
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def _rss_bytes(pid):
+    # resident memory of the process, or None
+    try:
+        with open("/proc/{0}/status".format(pid)) as file:
+            for line in file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, TypeError):
+        return None
+    return None
+
+
+def _percentile(values, q):
+    # nearest-rank percentile, None for no values
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, int(round(q / 100 * len(values))) - 1))]
+
+
+async def run_level(url, sessions, predictions, think=0.0, pid=None, pages=LOAD_PAGES):
+    """Run ``sessions`` concurrent sessions making ``predictions`` predictions each; returns their measurements."""
+    result = {"latencies": [], "failures": []}
+    start = asyncio.Event()
+    waiting = [sessions]
+
+    def ready():
+        waiting[0] -= 1
+        if not waiting[0]:
+            start.set()
+
+    tasks = [asyncio.ensure_future(_simulate(url, pages[i % len(pages)], predictions, think, i, ready, start, result))
+             for i in range(sessions)]
+    await start.wait()
+    cpu_before, started = _cpu_seconds(pid), time.perf_counter()
+    opened = await asyncio.gather(*tasks)
+    seconds = time.perf_counter() - started
+    cpu_after, rss = _cpu_seconds(pid), _rss_bytes(pid)
+    for session in opened:
+        session.close()
+
+    latencies = result["latencies"]
+    cpu = None if cpu_before is None or cpu_after is None else cpu_after - cpu_before
+    return {
+        "sessions": sessions,
+        "predictions": len(latencies),
+        "failures": len(result["failures"]),
+        "failure_examples": sorted(set(result["failures"]))[:5],
+        "seconds": seconds,
+        "throughput": len(latencies) / seconds,
+        "p50": _percentile(latencies, 50),
+        "p95": _percentile(latencies, 95),
+        "p99": _percentile(latencies, 99),
+        "max": max(latencies, default=None),
+        "cpu_cores": None if cpu is None else cpu / seconds,
+        "cpu_per_prediction": None if cpu is None or not latencies else cpu / len(latencies),
+        "rss": rss,
+    }
+
+
+def saturation(levels, p95_target=DEFAULT_P95_TARGET):
+    """``(sessions, reason)`` of the first saturated level of ``levels``, or None."""
+    previous = None
+    for level in levels:
+        if level["p95"] is not None and level["p95"] > p95_target:
+            return level["sessions"], "95th percentile latency {0:.3f} s above {1:g} s".format(level["p95"], p95_target)
+        if previous is not None and level["throughput"] < previous["throughput"] * (1 + SATURATION_GAIN):
+            return level["sessions"], "throughput {0:.1f}/s, {1:+.0%} over {2} sessions".format(
+                level["throughput"], level["throughput"] / previous["throughput"] - 1, previous["sessions"])
+        previous = level
+    return None
+
+
+async def load_test(url, levels=DEFAULT_SESSIONS, predictions=DEFAULT_PREDICTIONS, think=0.0, pid=None,
+                    pages=LOAD_PAGES, log=print):
+    """Warm up every page with one session, then run ``levels``; returns the result document."""
+    log("warm-up")
+    warm_up = await run_level(url, len(pages), 1, pid=pid, pages=pages)
+    if warm_up["failures"]:
+        raise RuntimeError("warm-up failed: " + "; ".join(warm_up["failure_examples"]))
+    baseline = _rss_bytes(pid)
+    results = []
+    for sessions in levels:
+        log("{0} sessions".format(sessions))
+        level = await run_level(url, sessions, predictions, think, pid, pages)
+        level["rss_per_session"] = None if baseline is None else (level["rss"] - baseline) / sessions
+        results.append(level)
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "url": url,
+        "cpus": os.cpu_count(),
+        "predictions_per_session": predictions,
+        "think": think,
+        "pages": list(pages),
+        "baseline_rss": baseline,
+        "levels": results,
+    }
+
+
+def _free_port():
+    with socket.socket() as listener:
+        listener.bind(("127.0.0.1", 0))
+        return listener.getsockname()[1]
+
+
+def start_server(history_dir, port=None):
+    """Start ``streamlit run Home.py`` on ``port``; returns ``(process, url)`` once it is healthy."""
+    port = port or _free_port()
+    environment = dict(os.environ, PFAS_HISTORY_DB=os.path.join(history_dir, "predictions.sqlite3"))
+    process = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", "Home.py", "--server.headless", "true",
+         "--server.port", str(port), "--server.address", "127.0.0.1", "--server.fileWatcherType", "none",
+         "--browser.gatherUsageStats", "false"],
+        cwd=ROOT_DIR, env=environment, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = "http://127.0.0.1:{0}".format(port)
+    deadline = time.monotonic() + START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("the server exited with status {0}".format(process.returncode))
+        try:
+            with urllib.request.urlopen(url + "/_stcore/health", timeout=1) as response:
+                if response.status == 200:
+                    return process, url
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("the server did not start within {0} s".format(START_TIMEOUT))
+
+
+def _format(value, pattern, scale=1):
+    return "-" if value is None else pattern.format(value * scale)
+
+
+def report(result, p95_target=DEFAULT_P95_TARGET):
+    """The result document as a text table followed by the saturation point."""
+    lines = ["{0} predictions per session, {1} CPUs, warmed-up server {2} MB".format(
+        result["predictions_per_session"], result["cpus"], _format(result["baseline_rss"], "{0:.0f}", 2 ** -20)),
+        "{0:>8} {1:>8} {2:>9} {3:>8} {4:>8} {5:>8} {6:>8} {7:>6} {8:>7} {9:>8} {10:>7} {11:>9}".format(
+            "sessions", "predicts", "per sec", "p50 ms", "p95 ms", "p99 ms", "max ms", "failed", "cores",
+            "cpu ms", "rss MB", "MB/session")]
+    for level in result["levels"]:
+        lines.append("{0:>8} {1:>8} {2:>9.1f} {3:>8} {4:>8} {5:>8} {6:>8} {7:>6} {8:>7} {9:>8} {10:>7} {11:>9}".format(
+            level["sessions"], level["predictions"], level["throughput"], _format(level["p50"], "{0:.0f}", 1000),
+            _format(level["p95"], "{0:.0f}", 1000), _format(level["p99"], "{0:.0f}", 1000),
+            _format(level["max"], "{0:.0f}", 1000), level["failures"], _format(level["cpu_cores"], "{0:.2f}"),
+            _format(level["cpu_per_prediction"], "{0:.1f}", 1000), _format(level["rss"], "{0:.0f}", 2 ** -20),
+            _format(level["rss_per_session"], "{0:.2f}", 2 ** -20)))
+        lines.extend("    " + example for example in level["failure_examples"])
+    best = max(result["levels"], key=lambda level: level["throughput"])
+    saturated = saturation(result["levels"], p95_target)
+    if saturated is None:
+        lines.append("Not saturated up to {0} sessions; add levels.".format(result["levels"][-1]["sessions"]))
+    else:
+        lines.append("Saturated at {0} sessions: {1}.".format(*saturated))
+    lines.append("Highest throughput {0:.1f} predictions/s with {1} sessions.".format(best["throughput"],
+                                                                                   best["sessions"]))
+    largest = result["levels"][-1]
+    if largest["rss_per_session"] is not None:
+        # the smaller levels are dominated by allocator noise
+        lines.append("Memory per session {0:.2f} MB, from {1} sessions.".format(
+            largest["rss_per_session"] / 2 ** 20, largest["sessions"]))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m pfas_score.loadtest",
+                                     description="Load test the app with concurrent sessions predicting on pages 1-5.")
+    parser.add_argument("--url", help="app to test (default: start a server for the test)")
+    parser.add_argument("--pid", type=int, help="process id of the --url server, for its CPU and memory")
+    parser.add_argument("--sessions", default=",".join(map(str, DEFAULT_SESSIONS)),
+                        help="comma-separated numbers of concurrent sessions (default: %(default)s)")
+    parser.add_argument("--predictions", type=int, default=DEFAULT_PREDICTIONS,
+                        help="predictions per session and level (default: %(default)s)")
+    parser.add_argument("--think", type=float, default=0.0, help="seconds between the predictions of a session")
+    parser.add_argument("--pages", default=",".join(LOAD_PAGES), help="pages to use (default: %(default)s)")
+    parser.add_argument("--p95-target", type=float, default=DEFAULT_P95_TARGET,
+                        help="highest acceptable 95th percentile latency in seconds (default: %(default)s)")
+    parser.add_argument("--output", "-o", help="JSON file to write the results to")
+    args = parser.parse_args(argv)
+
+    levels = sorted({int(sessions) for sessions in args.sessions.split(",")})
+    pages = args.pages.split(",")
+    unknown = [page_id for page_id in pages if page_id not in LOAD_PAGES]
+    if unknown or not levels or min(levels) < 1:
+        parser.error("invalid --pages or --sessions")
+
+    def log(message):
+        print(message, file=sys.stderr)
+
+    with tempfile.TemporaryDirectory() as history_dir:
+        process, url, pid = None, args.url, args.pid
+        if url is None:
+            process, url = start_server(history_dir)
+            pid = process.pid
+        try:
+            result = asyncio.run(load_test(url, levels, args.predictions, args.think, pid, pages, log))
+        except (OSError, RuntimeError) as error:
+            print("error: {0}".format(error), file=sys.stderr)
+            return 1
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+    print(report(result, args.p95_target))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(result, file, indent=2)
+            file.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+"""Span timings of the hot paths, aggregated into Prometheus histograms.
+
+Off by default. Enable with environment variables when starting the app or the
+HTTP API:
+
+    PFAS_METRICS=1 streamlit run Home.py
+    PFAS_METRICS=1 PFAS_METRICS_FILE=/tmp/pfas.prom streamlit run Home.py
+    PFAS_METRICS=1 python -m pfas_score.server          # also served at GET /metrics
+
+Spans are recorded around model loads and predictions (labelled by model), and
+around input rendering, input validation and predictions of every page
+(labelled by page). Spans nest: a page's "render" span includes the
+"validate" calls made while its widgets are built. The Streamlit app has no
+endpoint of its own, so with ``PFAS_METRICS_FILE`` set the text exposition is
+rewritten to that file every ``WRITE_INTERVAL`` seconds, for node_exporter's
+textfile collector or a plain ``cat``.
+
+When disabled, ``span`` returns a shared no-op context manager and ``timed``
+returns the function unchanged, so instrumented code pays one function call
+or nothing at all.
+"""
+
+import contextlib
+import functools
+import os
+import threading
+import time
+
+# upper bounds of the histogram buckets, in seconds
+BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+WRITE_INTERVAL = 10.0
+
+METRIC_NAME = "pfas_span_seconds"
+
+ENABLED = os.environ.get("PFAS_METRICS", "").lower() not in ("", "0", "false", "no")
+
+_NULL_SPAN = contextlib.nullcontext()
+
+_lock = threading.Lock()
+# (span name, sorted label items) -> [count per bucket (not cumulative) + overflow, sum]
+_histograms = {}
+_writer = {}
+
+
+def enable(enabled=True):
+    """Turn recording on or off for this process (``timed`` only affects functions decorated afterwards)."""
+    global ENABLED
+    ENABLED = enabled
+
+
+def observe(name, seconds, **labels):
+    """Record one duration of span ``name``."""
+    key = (name, tuple(sorted(labels.items())))
+    index = next((i for i, bound in enumerate(BUCKETS) if seconds <= bound), len(BUCKETS))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [[0] * (len(BUCKETS) + 1), 0.0]
+        histogram[0][index] += 1
+        histogram[1] += seconds
+    if _writer.get("path") is None and os.environ.get("PFAS_METRICS_FILE"):
+        _start_writer(os.environ["PFAS_METRICS_FILE"])
+
+
+class _Span:
+    __slots__ = ("name", "labels", "start")
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        observe(self.name, time.perf_counter() - self.start, **self.labels)
+
+
+def span(name, **labels):
+    """Context manager timing its body as span ``name``; a no-op unless enabled."""
+    if not ENABLED:
+        return _NULL_SPAN
+    return _Span(name, labels)
+
+
+def timed(name, **labels):
+    """Decorator timing every call as span ``name``; returns the function as is unless enabled."""
+    def decorate(function):
+        if not ENABLED:
+            return function
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with _Span(name, labels):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(items):
+    return ",".join('{0}="{1}"'.format(key, _escape(value)) for key, value in items)
+
+
+def render():
+    """All histograms in the Prometheus text exposition format."""
+    with _lock:
+        histograms = sorted((key, list(counts), total) for key, (counts, total) in _histograms.items())
+
+    lines = [
+        "# HELP {0} Duration of instrumented spans.".format(METRIC_NAME),
+        "# TYPE {0} histogram".format(METRIC_NAME),
+    ]
+    for (name, labels), counts, total in histograms:
+        base = _labels((("span", name),) + labels)
+        cumulative = 0
+        for bound, count in zip(BUCKETS + ["+Inf"], counts):
+            cumulative += count
+            lines.append('{0}_bucket{{{1},le="{2}"}} {3}'.format(METRIC_NAME, base, bound, cumulative))
+        lines.append("{0}_sum{{{1}}} {2!r}".format(METRIC_NAME, base, total))
+        lines.append("{0}_count{{{1}}} {2}".format(METRIC_NAME, base, cumulative))
+    return "\n".join(lines) + "\n"
+
+
+def write(path):
+    """Write ``render()`` to ``path``, replacing it atomically."""
+    temporary = path + ".tmp"
+    with open(temporary, "w") as file:
+        file.write(render())
+    os.replace(temporary, path)
+
+
+def _write_periodically(path):
+    while True:
+        time.sleep(WRITE_INTERVAL)
+        try:
+            write(path)
+        except OSError:
+            pass
+
+
+def _start_writer(path):
+    with _lock:
+        if _writer.get("path") is not None:
+            return
+        _writer["path"] = path
+    threading.Thread(target=_write_periodically, args=(path,), name="metrics-writer", daemon=True).start()
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
@@ -0,0 +1,83 @@
+"""Export the pickled CatBoost models to CatBoost's native ``.cbm`` format.
+
+    python -m pfas_score.native convert      # export, verify and record every CatBoost model
+    python -m pfas_score.native verify       # re-check existing exports against the pickles
+    python -m pfas_score.native benchmark    # cold load time and RSS, pickle vs native
+
+The pickles wrap each CatBoostClassifier in a scikit-learn GridSearchCV, so
+loading one imports scikit-learn and copies the whole serialized model through
+the Python heap before CatBoost deserializes it. A ``.cbm`` file is read by
+CatBoost's own C++ loader straight from disk instead. (CatBoost only accepts a
+path or a ``bytes`` object and always builds its own copy of the trees, so an
+``mmap`` of the file cannot be handed to it and shared between processes.)
+
+An export is only used once it has been verified (see pfas_score/exports.py):
+its predictions and probabilities on a fixed synthetic corpus must be
+bit-for-bit identical to the pickle's.
+"""
+
+import os
+import subprocess
+import sys
+
+from .exports import ExportFormat
+from .registry import ROOT_DIR, model_path
+
+
+def load_native(path):
+    from catboost import CatBoostClassifier
+
+    model = CatBoostClassifier()
+    model.load_model(path, format="cbm")
+    return model
+
+
+def _save(model, path):
+    model.save_model(path, format="cbm")
+
+
+FORMAT = ExportFormat("CatBoostClassifier", ".cbm", "manifest.json", _save, load_native, key="native")
+
+verified_export = FORMAT.verified_export
+
+
+# run in a fresh interpreter so import and load costs are measured cold
+_COLD_LOAD = """
+import sys, time
+start = time.perf_counter()
+statm = lambda: int(open("/proc/self/statm").read().split()[1]) * {page_size}
+before = statm()
+sys.path.insert(0, {root!r})
+if {native!r}:
+    from pfas_score.native import load_native
+    load_native({path!r})
+else:
+    import pickle
+    with open({path!r}, "rb") as file:
+        pickle.load(file)
+print(time.perf_counter() - start, statm() - before)
+"""
+
+
+def cold_load(path, native):
+    """Seconds and resident bytes to import the libraries and load ``path`` in a new process."""
+    code = _COLD_LOAD.format(page_size=os.sysconf("SC_PAGE_SIZE"), root=ROOT_DIR, native=native, path=path)
+    output = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True).stdout
+    seconds, resident = output.split()
+    return float(seconds), int(resident)
+
+
+def _benchmark(model_id, path):
+    pickle_seconds, pickle_resident = cold_load(model_path(model_id), False)
+    native_seconds, native_resident = cold_load(path, True)
+    return ["{0:<15} pickle {1:6.3f} s {2:7.1f} MB   native {3:6.3f} s {4:7.1f} MB".format(
+        model_id, pickle_seconds, pickle_resident / 1e6, native_seconds, native_resident / 1e6)]
+
+
+def main(argv=None):
+    return FORMAT.main(argv, "python -m pfas_score.native", "Export the CatBoost models to native .cbm files.",
+                       _benchmark, export_command="convert")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
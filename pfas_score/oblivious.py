@@ -0,0 +1,189 @@
+"""Pure NumPy evaluation of the CatBoost models, without importing catboost.
+
+    python -m pfas_score.oblivious export       # dump, verify and record every CatBoost model
+    python -m pfas_score.oblivious verify       # re-check the exports against the pickles
+    python -m pfas_score.oblivious benchmark    # rows/s for 1, 1k and 1M rows, NumPy vs CatBoost
+
+CatBoost grows oblivious trees: every node at the same depth of a tree tests the
+same (feature, border) split, so a tree of depth ``d`` is just ``d`` splits and
+``2**d`` leaf values, and the leaf a row falls into is the ``d``-bit number
+formed by the split outcomes. Scoring N rows is then a handful of array
+operations: binarize each distinct split once, combine the bits of every tree
+into leaf indices, gather the leaf values and sum them per row.
+"""
+
+import json
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+from .exports import ExportFormat
+from .registry import load_pickle, model_path
+from .store import load_arrays, save_arrays
+
+# predictions must agree exactly; probabilities may differ in the last bits
+# because NumPy's exp and CatBoost's are different implementations
+PROBABILITY_TOLERANCE = 1e-12
+
+# bound on the rows x trees x depth split bits materialized per chunk; small
+# chunks keep the working set in cache
+_CHUNK_BITS = 1 << 23
+
+
+class ObliviousTreeModel:
+    """A binary CatBoost classifier as flat NumPy arrays.
+
+    ``split_features``/``split_borders`` hold the distinct splits of the
+    model; ``tree_splits[t, k]`` is the split tested at depth ``k`` of tree
+    ``t`` (shallower trees are padded with a split that is never true) and
+    ``leaf_values[t]`` the tree's leaves, padded with zeros.
+    """
+
+    def __init__(self, split_features, split_borders, tree_splits, leaf_values, scale, bias, classes):
+        self.split_features = split_features
+        self.split_borders = split_borders
+        self.tree_splits = tree_splits
+        self.leaf_values = leaf_values
+        self.scale = float(scale)
+        self.bias = float(bias)
+        self.classes_ = classes
+        self.n_features = int(split_features.max()) + 1 if len(split_features) else 0
+
+        depth = tree_splits.shape[1]
+        self._depth_shifts = np.arange(depth, dtype=np.uint8)[:, None, None]
+        self._depths = np.arange(depth)[None, :]
+        self._leaf_dtype = np.uint8 if depth <= 8 else np.uint16
+        # offset of every tree in the flattened leaf values, to gather all leaves at once
+        self._leaf_offsets = (np.arange(len(leaf_values)) << depth)[:, None]
+        self._flat_leaves = np.ascontiguousarray(leaf_values).ravel()
+
+    @classmethod
+    def from_catboost(cls, model):
+        """Build the arrays from a fitted CatBoostClassifier (or a GridSearchCV around one)."""
+        model = getattr(model, "best_estimator_", model)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "model.json")
+            model.save_model(path, format="json")
+            with open(path) as file:
+                exported = json.load(file)
+
+        for feature in exported["features_info"]["float_features"]:
+            if feature.get("nan_value_treatment") == "AsTrue":
+                raise ValueError("NaN-as-true features are not supported")
+
+        trees = exported["oblivious_trees"]
+        splits = {}
+        for tree in trees:
+            for split in tree["splits"]:
+                if split["split_type"] != "FloatFeature":
+                    raise ValueError("Only float feature splits are supported, got " + split["split_type"])
+                splits.setdefault((split["float_feature_index"], split["border"]), len(splits))
+
+        depth = max(len(tree["splits"]) for tree in trees)
+        never = len(splits)
+        tree_splits = np.full((len(trees), depth), never, dtype=np.int32)
+        leaf_values = np.zeros((len(trees), 1 << depth), dtype=np.float64)
+        for t, tree in enumerate(trees):
+            for k, split in enumerate(tree["splits"]):
+                tree_splits[t, k] = splits[(split["float_feature_index"], split["border"])]
+            leaf_values[t, :len(tree["leaf_values"])] = tree["leaf_values"]
+
+        scale, bias = exported["scale_and_bias"]
+        return cls(
+            split_features=np.array([feature for feature, _ in splits], dtype=np.int32),
+            split_borders=np.array([border for _, border in splits], dtype=np.float32),
+            tree_splits=tree_splits,
+            leaf_values=leaf_values,
+            scale=scale,
+            bias=bias[0] if bias else 0.0,
+            classes=np.asarray(model.classes_),
+        )
+
+    def save(self, path):
+        save_arrays(path, split_features=self.split_features, split_borders=self.split_borders,
+                 tree_splits=self.tree_splits, leaf_values=self.leaf_values,
+                 scale_and_bias=np.array([self.scale, self.bias]), classes=self.classes_)
+
+    @classmethod
+    def load(cls, path, mmap=None):
+        """Load an export, mapped read-only and shared between processes by default (see pfas_score/store.py)."""
+        arrays = load_arrays(path, mmap)
+        scale, bias = arrays["scale_and_bias"]
+        return cls(arrays["split_features"], arrays["split_borders"], arrays["tree_splits"],
+                   arrays["leaf_values"], scale, bias, arrays["classes"])
+
+    def _raw_chunk(self, X):
+        # CatBoost compares the float32 value of each feature with the border;
+        # NaN compares false, like CatBoost's default "Min" NaN handling
+        bits = (X[:, self.split_features] > self.split_borders).T.view(np.uint8)
+        bits = np.concatenate([bits, np.zeros((1, len(X)), dtype=np.uint8)])
+        # the value every split adds to the leaf index at every depth, gathered
+        # for all trees at once into (trees, depth, rows) and summed over depth
+        weighted = bits.astype(self._leaf_dtype) << self._depth_shifts
+        leaves = weighted[self._depths, self.tree_splits].sum(axis=1, dtype=self._leaf_dtype)
+        # (trees, rows), so the sum over trees adds them one after another, in
+        # the same order as CatBoost
+        return self._flat_leaves[np.add(leaves, self._leaf_offsets, dtype=np.intp)].sum(axis=0)
+
+    def raw_predict(self, X):
+        """Raw formula value (log-odds of the high risk class) of every row of ``X``."""
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X[None, :]
+        if X.shape[1] < self.n_features:
+            raise ValueError("Expected at least {0} features, got {1}".format(self.n_features, X.shape[1]))
+
+        chunk = max(1, _CHUNK_BITS // self.tree_splits.size)
+        raw = np.empty(len(X), dtype=np.float64)
+        for start in range(0, len(X), chunk):
+            raw[start:start + chunk] = self._raw_chunk(X[start:start + chunk])
+        return raw * self.scale + self.bias
+
+    def predict_proba(self, X):
+        """Like CatBoostClassifier.predict_proba: ``(n, 2)``, or ``(2,)`` for a single 1-D row."""
+        raw = self.raw_predict(X)
+        positive = 1.0 / (1.0 + np.exp(-raw))
+        proba = np.column_stack([1.0 - positive, positive])
+        return proba[0] if np.ndim(X) == 1 else proba
+
+    def predict(self, X):
+        """Like CatBoostClassifier.predict: class labels, or a single label for a 1-D row."""
+        labels = self.classes_.take((self.raw_predict(X) > 0).astype(np.int64))
+        return labels[0] if np.ndim(X) == 1 else labels
+
+
+def _save(model, path):
+    ObliviousTreeModel.from_catboost(model).save(path)
+
+
+FORMAT = ExportFormat("CatBoostClassifier", ".npz", "oblivious.json", _save, ObliviousTreeModel.load,
+                      tolerance=PROBABILITY_TOLERANCE)
+
+verified_export = FORMAT.verified_export
+
+
+def benchmark(model_id, sizes=(1, 1000, 1000000)):
+    """Rows per second of the NumPy and the CatBoost model for every batch size."""
+    from .corpus import rows_per_second, synthetic_corpus
+
+    arrays = ObliviousTreeModel.load(verified_export(model_id) or FORMAT.path(model_id))
+    pickled = load_pickle(model_path(model_id))
+    X = synthetic_corpus(model_id, max(sizes))
+    return [(size, rows_per_second(arrays.predict_proba, X[:size]),
+             rows_per_second(pickled.predict_proba, X[:size])) for size in sizes]
+
+
+def _benchmark(model_id, path):
+    return ["{0:<15} {1:>8} rows   numpy {2:>12,.0f} rows/s   catboost {3:>12,.0f} rows/s".format(
+        model_id, size, numpy_rate, catboost_rate) for size, numpy_rate, catboost_rate in benchmark(model_id)]
+
+
+def main(argv=None):
+    return FORMAT.main(argv, "python -m pfas_score.oblivious",
+                       "Export the CatBoost models to NumPy oblivious tree arrays.", _benchmark)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""Score the influent, effluent and biosolid models on one set of plant inputs.
+
+Pages 1-3 ask for largely the same operational parameters. The whole plant
+page collects them once (the inputs of page 2, see ``PLANT_DEFAULTS``), picks
+each model's inputs out of them in that model's order, and scores the three
+models concurrently on a thread pool; CatBoost and NumPy release the GIL while
+they score.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .batch import check_frame, match_columns, predict_matrix, validate_row
+from .cache import predict_cached
+from .features import FEATURES, INFLUENT_TO_PLANT
+
+PLANT_ID = "plant"
+
+PLANT_MODELS = ["influent", "effluent", "biosolid"]
+
+# model id -> (prediction column, probability column) of the results
+RESULT_COLUMNS = {
+    "influent": ("Influent Prediction", "Influent Probability of High Risk"),
+    "effluent": ("Effluent Prediction", "Effluent Probability of High Risk"),
+    "biosolid": ("Biosolid Prediction", "Biosolid Probability of High Risk"),
+}
+
+_executor = ThreadPoolExecutor(max_workers=len(PLANT_MODELS), thread_name_prefix="plant")
+
+
+def model_columns(model_id):
+    """Positions of ``model_id``'s inputs among the plant inputs, in model input order."""
+    to_plant = INFLUENT_TO_PLANT if model_id == "influent" else {}
+    plant = FEATURES[PLANT_ID]
+    return [plant.index(to_plant.get(feature, feature)) for feature in FEATURES[model_id]]
+
+
+_COLUMNS = {model_id: model_columns(model_id) for model_id in PLANT_MODELS}
+
+
+def score_matrix(X):
+    """Score a plant input matrix with all three models at once.
+
+    Returns ``{model id: (predictions, probabilities)}``.
+    """
+    futures = {model_id: _executor.submit(predict_matrix, X[:, _COLUMNS[model_id]], model_id)
+               for model_id in PLANT_MODELS}
+    return {model_id: future.result() for model_id, future in futures.items()}
+
+
+def score_row(values):
+    """Score one sample given as ``{plant input: value}``.
+
+    Returns ``(results, problems)``; ``results`` maps each model id to
+    ``(prediction, probability)``, or is None if the inputs are invalid.
+    """
+    row, problems = validate_row(values, PLANT_ID)
+    if problems:
+        return None, problems
+    futures = {model_id: _executor.submit(predict_cached, model_id, row[_COLUMNS[model_id]])
+               for model_id in PLANT_MODELS}
+    return {model_id: future.result() for model_id, future in futures.items()}, problems
+
+
+def score_frame(frame, skip_invalid=False):
+    """Validate and score ``frame``, one plant-month per row; returns ``(result, problems)``.
+
+    Like ``batch.score_frame``, with a prediction and a probability column per
+    model appended.
+    """
+    mapping, missing = match_columns(frame, PLANT_ID)
+    if missing:
+        return None, ["Missing columns: " + ", ".join(missing)]
+    if frame.empty:
+        return None, ["The file does not contain any rows."]
+
+    X, problems, invalid_rows = check_frame(frame, mapping, PLANT_ID)
+    if problems and not skip_invalid:
+        return None, problems
+
+    result = frame.copy()
+    valid = ~invalid_rows
+    scores = score_matrix(X[valid]) if valid.any() else {}
+    for model_id in PLANT_MODELS:
+        prediction_column, probability_column = RESULT_COLUMNS[model_id]
+        if not problems:
+            result[prediction_column], result[probability_column] = scores[model_id]
+            continue
+        predictions = pd.array([pd.NA] * len(frame), dtype="Int64")
+        probabilities = np.full(len(frame), np.nan)
+        if model_id in scores:
+            predictions[valid], probabilities[valid] = scores[model_id]
+        result[prediction_column] = predictions
+        result[probability_column] = probabilities
+    return result, problems
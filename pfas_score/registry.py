@@ -0,0 +1,200 @@
+"""Process-wide registry of the classifiers shipped in ``models/``.
+
+Streamlit re-executes a page script on every widget interaction, so a page that
+unpickles its model at the top reloads it on every keystroke of every session.
+Python modules are imported once per server process, so models cached here are
+loaded once and the very same object is handed to every session. A model is
+reloaded when its file in ``models/`` changes (size or modification time).
+
+The returned classifiers are shared between sessions and threads. Callers must
+treat them as read-only: call ``predict``/``predict_proba`` only, never refit
+or modify them.
+"""
+
+import hashlib
+import os
+import pickle
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from . import metrics
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODELS_DIR = os.path.join(ROOT_DIR, "models")
+
+# model id -> pickle in models/
+MODEL_FILES = {
+    "influent": "CatBoost_model_inf.pkl",
+    "effluent": "CatBoost_eff2_web.pkl",
+    "biosolid": "CatBoost_model_bio.pkl",
+    "effluent_pfas": "CatBoost_model_eff_web.pkl",
+    "biosolid_pfas": "AdaBoost_model_BIO_web.pkl",
+    # older effluent model, not served by any page
+    "effluent_alt": "CatBoost_model_eff.pkl",
+}
+
+# the models served by the pages
+PAGE_MODELS = ["influent", "effluent", "biosolid", "effluent_pfas", "biosolid_pfas"]
+
+
+@dataclass(frozen=True)
+class ModelInfo:
+    model_id: str
+    path: str
+    # "pickle", or "arrays"/"mmap"/"cbm" when a verified export was loaded
+    # instead; "mmap" arrays are shared with other processes (see store.py)
+    format: str
+    file_size: int
+    sha256: str
+    load_seconds: float
+    # growth of the process resident set while unpickling, None if unknown. The
+    # first model of each library also pays for importing catboost/sklearn.
+    resident_bytes: Optional[int]
+
+
+# model id -> (model, ModelInfo, (mtime_ns, size) of the file when it was loaded)
+_loaded = {}
+# loads are serialized so the resident size of each model can be attributed
+_load_lock = threading.Lock()
+
+
+def model_path(model_id):
+    try:
+        return os.path.join(MODELS_DIR, MODEL_FILES[model_id])
+    except KeyError:
+        raise KeyError("Unknown model id {0!r}, expected one of: {1}".format(
+            model_id, ", ".join(MODEL_FILES))) from None
+
+
+def _rss_bytes():
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _signature(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_pickle(path):
+    with open(path, "rb") as file:
+        return pickle.load(file)
+
+
+def get_model(model_id):
+    """Return the shared classifier for ``model_id``, loading it on first use."""
+    return get_model_with_info(model_id)[0]
+
+
+def get_model_with_info(model_id):
+    """Return ``(classifier, ModelInfo)`` for ``model_id``, reloading the model
+    if its file changed since it was loaded."""
+    path = model_path(model_id)
+    loaded = _loaded.get(model_id)
+    if loaded is not None and loaded[2] == _signature(path):
+        return loaded[:2]
+
+    with _load_lock:
+        # another thread may have finished loading while we waited
+        signature = _signature(path)
+        loaded = _loaded.get(model_id)
+        if loaded is not None and loaded[2] == signature:
+            return loaded[:2]
+
+        from . import adaboost, native, oblivious, store
+
+        sha256 = file_sha256(path)
+        # prefer the verified exports: NumPy arrays need neither catboost nor
+        # sklearn, native CatBoost files skip unpickling and the sklearn import
+        arrays_format = "mmap" if store.ENABLED else "arrays"
+        loaders = [
+            (oblivious.verified_export, oblivious.ObliviousTreeModel.load, arrays_format),
+            (adaboost.verified_export, adaboost.BoostedTreesModel.load, arrays_format),
+            (native.verified_export, native.load_native, "cbm"),
+        ]
+        for verified_export, load, model_format in loaders:
+            export = verified_export(model_id, sha256)
+            if export is not None:
+                break
+        else:
+            export, load, model_format = path, load_pickle, "pickle"
+
+        rss_before = _rss_bytes()
+        start = time.perf_counter()
+        model = load(export)
+        load_seconds = time.perf_counter() - start
+        rss_after = _rss_bytes()
+        if metrics.ENABLED:
+            metrics.observe("model_load", load_seconds, model=model_id, format=model_format)
+
+        resident = None
+        if rss_before is not None and rss_after is not None:
+            resident = max(rss_after - rss_before, 0)
+
+        info = ModelInfo(
+            model_id=model_id,
+            path=path,
+            format=model_format,
+            file_size=os.path.getsize(path),
+            sha256=sha256,
+            load_seconds=load_seconds,
+            resident_bytes=resident,
+        )
+        _loaded[model_id] = (model, info, signature)
+        return model, info
+
+
+def model_info(model_id):
+    """Return the ``ModelInfo`` of a loaded model, or None if it is not loaded yet."""
+    loaded = _loaded.get(model_id)
+    return loaded[1] if loaded is not None else None
+
+
+def load_all():
+    return [get_model_with_info(model_id)[1] for model_id in MODEL_FILES]
+
+
+def model_report():
+    """Load time and resident size of every model loaded so far, as plain dicts."""
+    return [
+        {
+            "model_id": info.model_id,
+            "file": os.path.basename(info.path),
+            "format": info.format,
+            "file_size": info.file_size,
+            "sha256": info.sha256,
+            "load_seconds": info.load_seconds,
+            "resident_bytes": info.resident_bytes,
+        }
+        for info in (_loaded[model_id][1] for model_id in MODEL_FILES if model_id in _loaded)
+    ]
+
+
+def format_bytes(size):
+    """``size`` in bytes as megabytes for reports, "n/a" if unknown."""
+    if size is None:
+        return "n/a"
+    return "{0:.1f} MB".format(size / 1e6)
+
+
+if __name__ == "__main__":
+    load_all()
+    print("{0:<15} {1:<30} {2:<7} {3:>10} {4:>10} {5:>12}".format(
+        "model", "file", "format", "file size", "load (ms)", "resident"))
+    for row in model_report():
+        print("{0:<15} {1:<30} {2:<7} {3:>10} {4:>10.1f} {5:>12}".format(
+            row["model_id"], row["file"], row["format"], format_bytes(row["file_size"]),
+            row["load_seconds"] * 1000, format_bytes(row["resident_bytes"])))
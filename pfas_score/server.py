@@ -0,0 +1,237 @@
+"""Local HTTP inference API, to run next to the Streamlit app.
+
+    python -m pfas_score.server --port 8502 --batch-window-ms 5
+
+Endpoints:
+
+    GET  /models                 model ids and their inputs, in model input order
+    POST /predict/<model id>     {"features": {"Year": 2024, ...}} or {"features": [2024, ...]}
+    GET  /stats                  latency (queued to scored) percentiles and batch size histograms
+    GET  /metrics                span timings in the Prometheus text format (see pfas_score/metrics.py)
+
+A single-row ``predict`` call on a CatBoost model spends most of its time in
+per-call overhead, so concurrent requests for the same model are not scored one
+by one: each model has a batcher thread that waits up to the batch window for
+more requests and scores everything it collected with one ``predict_proba``.
+"""
+
+import argparse
+import collections
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from . import metrics
+from .batch import predict_matrix, validate_row
+from .features import FEATURES
+from .registry import PAGE_MODELS, get_model
+
+SERVED_MODELS = PAGE_MODELS
+
+# upper bounds of the batch size histogram buckets
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128, 256]
+
+# latencies kept per model for the percentiles
+LATENCY_WINDOW = 10000
+
+
+class BatchStats:
+    """Latencies and batch sizes of one model, safe to update from any thread."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latencies = collections.deque(maxlen=LATENCY_WINDOW)
+        self._batch_sizes = collections.Counter()
+        self.requests = 0
+        self.batches = 0
+
+    def record_batch(self, size, latencies):
+        bucket = next((bound for bound in BATCH_SIZE_BUCKETS if size <= bound), float("inf"))
+        with self._lock:
+            self._latencies.extend(latencies)
+            self._batch_sizes[bucket] += 1
+            self.requests += size
+            self.batches += 1
+
+    def snapshot(self):
+        with self._lock:
+            latencies = np.array(self._latencies)
+            batch_sizes = dict(self._batch_sizes)
+            requests, batches = self.requests, self.batches
+
+        percentiles = {}
+        if len(latencies):
+            p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+            percentiles = {"p50_ms": round(p50, 3), "p99_ms": round(p99, 3)}
+        histogram = {
+            ("<={0}".format(bound) if bound != float("inf") else ">{0}".format(BATCH_SIZE_BUCKETS[-1])):
+                batch_sizes.get(bound, 0)
+            for bound in BATCH_SIZE_BUCKETS + [float("inf")]
+        }
+        return {
+            "requests": requests,
+            "batches": batches,
+            "mean_batch_size": round(requests / batches, 3) if batches else None,
+            "latency": percentiles,
+            "batch_size_histogram": histogram,
+        }
+
+
+class MicroBatcher:
+    """Coalesces concurrent single-row requests for one model into batches."""
+
+    def __init__(self, model_id, window=0.005, max_batch=64):
+        self.model_id = model_id
+        self.window = window
+        self.max_batch = max_batch
+        self.stats = BatchStats()
+        # load now so the first request does not wait for it; each batch asks the
+        # registry again, which reloads the model after its file is replaced
+        get_model(model_id)
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="batcher-" + model_id, daemon=True)
+        self._thread.start()
+
+    def submit(self, row):
+        """Queue a validated feature row; the future resolves to ``(prediction, probability)``."""
+        future = Future()
+        self._queue.put((row, future, time.perf_counter()))
+        return future
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                X = np.vstack([row for row, _, _ in batch])
+                with metrics.span("batch_predict", model=self.model_id):
+                    predictions, probabilities = predict_matrix(X, self.model_id)
+            except Exception as error:
+                for _, future, _ in batch:
+                    future.set_exception(error)
+                continue
+
+            done = time.perf_counter()
+            for (_, future, queued), prediction, probability in zip(batch, predictions, probabilities):
+                future.set_result((int(prediction), float(probability)))
+            self.stats.record_batch(len(batch), [done - queued for _, _, queued in batch])
+            if metrics.ENABLED:
+                for _, _, queued in batch:
+                    metrics.observe("request", done - queued, model=self.model_id)
+
+
+class InferenceHandler(BaseHTTPRequestHandler):
+    # set by make_server
+    batchers = {}
+
+    def _send_json(self, status, payload):
+        self._send(status, json.dumps(payload).encode("utf-8"), "application/json")
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/models":
+            self._send_json(200, {model_id: FEATURES[model_id] for model_id in self.batchers})
+        elif self.path == "/stats":
+            self._send_json(200, {model_id: batcher.stats.snapshot()
+                                  for model_id, batcher in self.batchers.items()})
+        elif self.path == "/metrics":
+            self._send(200, metrics.render().encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8")
+        else:
+            self._send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        prefix = "/predict/"
+        model_id = self.path[len(prefix):] if self.path.startswith(prefix) else None
+        batcher = self.batchers.get(model_id)
+        if batcher is None:
+            self._send_json(404, {"error": "Unknown model, expected one of: " + ", ".join(self.batchers)})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            features = json.loads(self.rfile.read(length))["features"]
+        except (ValueError, KeyError, TypeError):
+            self._send_json(400, {"error": 'Expected a JSON body of the form {"features": ...}'})
+            return
+
+        if not isinstance(features, (dict, list)):
+            self._send_json(400, {"error": "features must be an object or a list"})
+            return
+        row, problems = validate_row(features, model_id)
+        if problems:
+            self._send_json(400, {"error": "Invalid inputs", "problems": problems})
+            return
+
+        try:
+            prediction, probability = batcher.submit(row).result()
+        except Exception as error:
+            self._send_json(500, {"error": "Prediction failed: {0}".format(error)})
+            return
+        self._send_json(200, {"model": model_id, "prediction": prediction, "probability": probability})
+
+    def log_request(self, code="-", size="-"):
+        # keep the console quiet under load; errors are still logged
+        pass
+
+
+class InferenceServer(ThreadingHTTPServer):
+    # the socketserver default of 5 resets connections under concurrent load
+    request_queue_size = 128
+
+
+def make_server(host="127.0.0.1", port=8502, window=0.005, max_batch=64, models=SERVED_MODELS):
+    batchers = {model_id: MicroBatcher(model_id, window, max_batch) for model_id in models}
+    handler = type("Handler", (InferenceHandler,), {"batchers": batchers})
+    return InferenceServer((host, port), handler)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m pfas_score.server", description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8502)
+    parser.add_argument("--batch-window-ms", type=float, default=5.0,
+                        help="how long a batch waits for more requests (default: %(default)s)")
+    parser.add_argument("--max-batch", type=int, default=64,
+                        help="largest batch sent to predict (default: %(default)s)")
+    parser.add_argument("--metrics", action="store_true",
+                        help="record span timings for GET /metrics (same as PFAS_METRICS=1)")
+    args = parser.parse_args(argv)
+
+    if args.metrics:
+        metrics.enable()
+
+    server = make_server(args.host, args.port, args.batch_window_ms / 1000, args.max_batch)
+    print("Serving {0} on http://{1}:{2}".format(", ".join(SERVED_MODELS), args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Cold-start profiling, and the background warm-up started by Home.py.
+
+    python -m pfas_score.startup                       # import and load times of a fresh process
+    python -m pfas_score.startup --output startup.json
+
+The page scripts import only streamlit and the light parts of this package;
+numpy and whatever a model needs (catboost, scikit-learn) are imported by the
+registry when the first prediction loads the model. To keep that first
+prediction fast, ``warm_up`` loads the page models on a daemon thread once the
+home page has rendered, so a user who opens a model page usually finds its
+model in the registry already.
+
+Run the report in a fresh interpreter: modules already imported cost nothing.
+"""
+
+import argparse
+import importlib
+import json
+import logging
+import sys
+import threading
+import time
+
+from .registry import PAGE_MODELS, format_bytes, get_model, model_report
+
+# the expensive imports, in the order the app pays for them
+PROFILED_MODULES = [
+    "streamlit",
+    "numpy",
+    "pandas",
+    "sklearn",
+    "catboost",
+    "pfas_score.batch",
+    "pfas_score.oblivious",
+    "pfas_score.adaboost",
+]
+
+logger = logging.getLogger(__name__)
+
+_import_seconds = {}
+_warm_up = {}
+_warm_up_lock = threading.Lock()
+
+
+def timed_import(name):
+    """Import ``name``, recording how long it took if it was not imported yet."""
+    if name in sys.modules:
+        return sys.modules[name]
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    _import_seconds.setdefault(name, time.perf_counter() - start)
+    return module
+
+
+def _warm(models):
+    start = time.perf_counter()
+    try:
+        timed_import("numpy")
+        for model_id in models:
+            get_model(model_id)
+    except Exception:
+        # the page that needs the model will raise the same error to the user
+        logger.exception("Model warm-up failed")
+    _warm_up["seconds"] = time.perf_counter() - start
+
+
+def warm_up(models=PAGE_MODELS):
+    """Load ``models`` on a background thread, once per process.
+
+    Returns the thread, or None if the warm-up was already started.
+    """
+    with _warm_up_lock:
+        if "thread" in _warm_up:
+            return None
+        thread = threading.Thread(target=_warm, args=(list(models),), name="model-warm-up", daemon=True)
+        _warm_up["thread"] = thread
+    thread.start()
+    return thread
+
+
+def report():
+    """Import times, model load times and warm-up time of this process so far."""
+    return {
+        "imports": [{"module": name, "seconds": seconds} for name, seconds in _import_seconds.items()],
+        "models": model_report(),
+        "warm_up_seconds": _warm_up.get("seconds"),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m pfas_score.startup",
+                                     description="Profile the imports and model loads of a cold start.")
+    parser.add_argument("--output", "-o", help="also write the report to this JSON file")
+    args = parser.parse_args(argv)
+
+    for name in PROFILED_MODULES:
+        timed_import(name)
+    for model_id in PAGE_MODELS:
+        get_model(model_id)
+    result = report()
+
+    print("{0:<22} {1:>10}".format("module", "import (ms)"))
+    for row in result["imports"]:
+        print("{0:<22} {1:>10.1f}".format(row["module"], row["seconds"] * 1000))
+    print()
+    print("{0:<15} {1:<30} {2:<7} {3:>10} {4:>12}".format("model", "file", "format", "load (ms)", "resident"))
+    for row in result["models"]:
+        print("{0:<15} {1:<30} {2:<7} {3:>10.1f} {4:>12}".format(
+            row["model_id"], row["file"], row["format"], row["load_seconds"] * 1000,
+            format_bytes(row["resident_bytes"])))
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(result, file, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
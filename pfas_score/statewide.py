@@ -0,0 +1,314 @@
+"""Statewide influent, effluent and biosolid risk, precomputed per plant and county.
+
+    python -m pfas_score.statewide refresh plants.csv  # score the changed plants, update their counties
+    python -m pfas_score.statewide status
+    python -m pfas_score.statewide bench --plants 1000 --changed 10
+
+The statewide page only reads ``history/statewide.sqlite3``
+(``PFAS_STATEWIDE_DB``); page views never call a model. ``refresh`` takes a
+plant table, one row per WWTP, with a plant column (see
+``history.PLANT_COLUMNS``), a County column, optional Latitude and Longitude
+columns, and the inputs of the whole plant page. It brings the store in line
+with the table:
+
+- plants whose inputs or model files changed, and new plants, are scored with
+  the influent, effluent and biosolid models (pfas_score/plant.py), all in one
+  call per model;
+- plants that only moved (county, coordinates) keep their scores;
+- plants missing from the table are removed;
+- the totals of the counties that gained, lost or rescored a plant are
+  recomputed from their plants, in the same transaction.
+
+Unchanged plants and counties are not touched, so running it again after one
+plant's inputs changed scores one plant and updates one county.
+"""
+
+import argparse
+import contextlib
+import os
+import sqlite3
+import sys
+import time
+
+from .history import PLANT_COLUMNS
+from .plant import PLANT_ID, PLANT_MODELS
+from .registry import ROOT_DIR
+
+DATABASE = os.environ.get("PFAS_STATEWIDE_DB") or os.path.join(ROOT_DIR, "history", "statewide.sqlite3")
+
+COUNTY_COLUMN = "County"
+LATITUDE_COLUMN = "Latitude"
+LONGITUDE_COLUMN = "Longitude"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS plants (
+    plant TEXT PRIMARY KEY,
+    county TEXT NOT NULL,
+    latitude REAL,
+    longitude REAL,
+    -- float64 values in the input order of the whole plant page
+    inputs BLOB NOT NULL,
+    -- SHA-256 of the influent, effluent and biosolid model files, comma separated
+    model_sha256 TEXT NOT NULL,
+    {plant_scores},
+    refreshed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS plants_county ON plants (county);
+CREATE TABLE IF NOT EXISTS counties (
+    county TEXT PRIMARY KEY,
+    plants INTEGER NOT NULL,
+    -- mean coordinates of the plants that have them
+    latitude REAL,
+    longitude REAL,
+    {county_totals},
+    refreshed REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS refreshes (
+    time REAL NOT NULL,
+    plants INTEGER NOT NULL,
+    scored INTEGER NOT NULL,
+    removed INTEGER NOT NULL,
+    counties INTEGER NOT NULL,
+    seconds REAL NOT NULL
+);
+""".format(
+    plant_scores=",\n    ".join("{0}_prediction INTEGER NOT NULL,\n    {0}_probability REAL NOT NULL".format(model_id)
+                                   for model_id in PLANT_MODELS),
+    county_totals=",\n    ".join("{0}_high_risk INTEGER NOT NULL,\n    {0}_mean_probability REAL NOT NULL".format(
+        model_id) for model_id in PLANT_MODELS))
+
+_SCORE_COLUMNS = ["{0}_{1}".format(model_id, kind) for model_id in PLANT_MODELS for kind in ("prediction", "probability")]
+
+_PLANT_COLUMNS = ["plant", "county", "latitude", "longitude", "inputs", "model_sha256"] + _SCORE_COLUMNS + ["refreshed"]
+
+_COUNTY_TOTALS = ("SELECT county, COUNT(*), AVG(latitude), AVG(longitude), {0}, ? FROM plants "
+                  "WHERE county IN ({{0}}) GROUP BY county").format(", ".join(
+                      "SUM({0}_prediction), AVG({0}_probability)".format(model_id) for model_id in PLANT_MODELS))
+
+
+@contextlib.contextmanager
+def _connect(path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+    try:
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(_SCHEMA)
+        yield connection
+    finally:
+        connection.close()
+
+
+def _column(frame, name):
+    # the column of frame called name, ignoring case and surrounding spaces
+    return next((column for column in frame.columns if str(column).strip().lower() == name.lower()), None)
+
+
+def _validate(frame):
+    # (plants, counties, coordinates, X, problems) of a plant table
+    import numpy as np
+    import pandas as pd
+
+    from . import batch
+
+    plant_column = next((column for column in frame.columns if str(column).strip().lower() in PLANT_COLUMNS), None)
+    county_column = _column(frame, COUNTY_COLUMN)
+    missing = ([] if plant_column is not None else ["a plant column (one of {0})".format(", ".join(PLANT_COLUMNS))]) + (
+        [] if county_column is not None else [COUNTY_COLUMN])
+    mapping, missing_features = batch.match_columns(frame, PLANT_ID)
+    if missing or missing_features:
+        return None, None, None, None, ["Missing columns: " + ", ".join(missing + missing_features)]
+    if frame.empty:
+        return None, None, None, None, ["The file does not contain any rows."]
+
+    X, problems, _ = batch.check_frame(frame, mapping, PLANT_ID)
+    names = {}
+    for column in (plant_column, county_column):
+        values = frame[column].astype(str).str.strip()
+        blank = (frame[column].isna() | (values == "")).to_numpy()
+        if blank.any():
+            problems.append("{0}: missing in row(s) {1}".format(column, batch.row_list(frame.index, blank)))
+        names[column] = values.tolist()
+    duplicated = frame[plant_column].astype(str).str.strip().duplicated(keep=False).to_numpy()
+    if duplicated.any():
+        problems.append("{0}: the same plant in row(s) {1}".format(
+            plant_column, batch.row_list(frame.index, duplicated)))
+
+    coordinates = []
+    for name in (LATITUDE_COLUMN, LONGITUDE_COLUMN):
+        column = _column(frame, name)
+        if column is None:
+            coordinates.append([None] * len(frame))
+            continue
+        values = pd.to_numeric(frame[column], errors="coerce").to_numpy(dtype=np.float64)
+        coordinates.append([None if np.isnan(value) else float(value) for value in values])
+    if problems:
+        return None, None, None, None, problems
+    return names[plant_column], names[county_column], list(zip(*coordinates)), X, problems
+
+
+def refresh(frame, path=None):
+    """Bring the store in line with the plant table ``frame``.
+
+    Returns ``(summary, problems)``; ``summary`` is a dict of the plants in the
+    table, the plants scored and removed and the counties recomputed, or None
+    if the table did not validate.
+    """
+    import numpy as np
+
+    from .plant import score_matrix
+    from .registry import get_model_with_info
+
+    start = time.perf_counter()
+    plants, counties, coordinates, X, problems = _validate(frame)
+    if problems:
+        return None, problems
+
+    sha256 = ",".join(get_model_with_info(model_id)[1].sha256 for model_id in PLANT_MODELS)
+    inputs = [row.tobytes() for row in np.ascontiguousarray(X, dtype="<f8")]
+    with _connect(path or DATABASE) as connection:
+        stored = {row[0]: row for row in connection.execute(
+            "SELECT {0} FROM plants".format(", ".join(_PLANT_COLUMNS))).fetchall()}
+
+        rescore = np.array([plant not in stored or stored[plant][4] != inputs[i] or stored[plant][5] != sha256
+                            for i, plant in enumerate(plants)], dtype=bool)
+        moved = [i for i, plant in enumerate(plants) if not rescore[i] and stored[plant][1:4] != (
+            counties[i],) + tuple(coordinates[i])]
+        removed = set(stored) - set(plants)
+        affected = {counties[i] for i in np.flatnonzero(rescore)} | {counties[i] for i in moved} | {
+            stored[plants[i]][1] for i in list(np.flatnonzero(rescore)) + moved if plants[i] in stored} | {
+            stored[plant][1] for plant in removed}
+
+        now = time.time()
+        rows = []
+        if rescore.any():
+            scores = score_matrix(X[rescore])
+            columns = [values for model_id in PLANT_MODELS for values in scores[model_id]]
+            for j, i in enumerate(np.flatnonzero(rescore)):
+                rows.append((plants[i], counties[i]) + tuple(coordinates[i]) + (inputs[i], sha256) + tuple(
+                    float(values[j]) if k % 2 else int(values[j]) for k, values in enumerate(columns)) + (now,))
+        for i in moved:
+            rows.append((plants[i], counties[i]) + tuple(coordinates[i]) + stored[plants[i]][4:-1] + (now,))
+
+        connection.execute("BEGIN")
+        try:
+            connection.executemany("INSERT OR REPLACE INTO plants ({0}) VALUES ({1})".format(
+                ", ".join(_PLANT_COLUMNS), ", ".join("?" * len(_PLANT_COLUMNS))), rows)
+            connection.executemany("DELETE FROM plants WHERE plant = ?", [(plant,) for plant in removed])
+            affected = sorted(affected)
+            connection.executemany("DELETE FROM counties WHERE county = ?", [(county,) for county in affected])
+            for begin in range(0, len(affected), 500):
+                chunk = affected[begin:begin + 500]
+                connection.execute("INSERT INTO counties " + _COUNTY_TOTALS.format(", ".join("?" * len(chunk))),
+                                   [now] + chunk)
+            summary = {"plants": len(plants), "scored": int(rescore.sum()), "removed": len(removed),
+                       "counties": len(affected), "seconds": time.perf_counter() - start}
+            connection.execute("INSERT INTO refreshes (time, plants, scored, removed, counties, seconds) "
+                               "VALUES (?, ?, ?, ?, ?, ?)", (now,) + tuple(summary.values()))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+    return summary, []
+
+
+def county_table(path=None):
+    """The stored totals of every county, as a DataFrame."""
+    import pandas as pd
+
+    with _connect(path or DATABASE) as connection:
+        return pd.read_sql_query("SELECT * FROM counties ORDER BY county", connection)
+
+
+def plant_table(path=None):
+    """The stored scores of every plant, without their inputs, as a DataFrame."""
+    import pandas as pd
+
+    columns = [column for column in _PLANT_COLUMNS if column not in ("inputs", "model_sha256")]
+    with _connect(path or DATABASE) as connection:
+        return pd.read_sql_query("SELECT {0} FROM plants ORDER BY plant".format(", ".join(columns)), connection)
+
+
+def last_refresh(path=None):
+    """The summary of the latest refresh with its ``time``, or None."""
+    with _connect(path or DATABASE) as connection:
+        row = connection.execute("SELECT time, plants, scored, removed, counties, seconds FROM refreshes "
+                                 "ORDER BY time DESC LIMIT 1").fetchone()
+    return dict(zip(["time", "plants", "scored", "removed", "counties", "seconds"], row)) if row else None
+
+
+def synthetic_table(plants, counties=58, seed=0):
+    """A plant table of ``plants`` plants spread over ``counties`` counties, for benchmarking."""
+    import numpy as np
+    import pandas as pd
+
+    from .corpus import synthetic_corpus
+    from .features import FEATURES
+
+    rng = np.random.default_rng(seed)
+    county = rng.integers(0, counties, plants)
+    frame = pd.DataFrame({
+        "Plant": ["Plant {0:04d}".format(i) for i in range(plants)],
+        COUNTY_COLUMN: ["County {0:02d}".format(c) for c in county],
+        LATITUDE_COLUMN: 32.5 + county / counties * 9.5 + rng.normal(0, 0.1, plants),
+        LONGITUDE_COLUMN: -124 + rng.uniform(0, 10, plants),
+    })
+    inputs = pd.DataFrame(synthetic_corpus(PLANT_ID, plants, seed=seed), columns=FEATURES[PLANT_ID])
+    return pd.concat([frame, inputs], axis=1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m pfas_score.statewide",
+                                     description="Precomputed statewide risk of every WWTP and county.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    refresh_parser = subcommands.add_parser("refresh", help="score the changed plants of a plant table")
+    refresh_parser.add_argument("input", help="CSV or Excel file, one WWTP per row")
+    subcommands.add_parser("status", help="the latest refresh and the stored counties")
+    bench_parser = subcommands.add_parser("bench", help="full and incremental refresh of a synthetic table")
+    bench_parser.add_argument("--plants", type=int, default=1000)
+    bench_parser.add_argument("--changed", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    if args.command == "refresh":
+        from .batch import read_table
+
+        try:
+            summary, problems = refresh(read_table(args.input))
+        except (ValueError, UnicodeDecodeError) as error:
+            summary, problems = None, [str(error)]
+        if problems:
+            print("error: invalid input\n" + "\n".join(problems), file=sys.stderr)
+            return 1
+        print("{plants} plants: {scored} scored, {removed} removed, {counties} counties updated "
+              "in {seconds:.2f} s".format(**summary))
+        return 0
+
+    if args.command == "status":
+        latest = last_refresh()
+        if latest is None:
+            print("Nothing stored yet, run: python -m pfas_score.statewide refresh PLANTS.csv")
+            return 1
+        print("{0}: refreshed {1}, {2} plants".format(DATABASE, time.strftime(
+            "%Y-%m-%d %H:%M:%S", time.localtime(latest["time"])), latest["plants"]))
+        for _, county in county_table().iterrows():
+            print("{0:<24} {1:>5} plants ".format(county["county"], county["plants"]) + " ".join(
+                "{0} {1:>4}".format(model_id, county["{0}_high_risk".format(model_id)]) for model_id in PLANT_MODELS))
+        return 0
+
+    import tempfile
+
+    path = os.path.join(tempfile.gettempdir(), "pfas_statewide_bench.sqlite3")
+    if os.path.exists(path):
+        os.remove(path)
+    table = synthetic_table(args.plants)
+    changed = table.copy()
+    changed.loc[:args.changed - 1, "Total Organic Carbon (Influent)"] += 1.0
+    print("{0:<22} {1:>7} {2:>7} {3:>8} {4:>9}".format("step", "plants", "scored", "counties", "seconds"))
+    for step, frame in [("first refresh", table), ("unchanged", table),
+                        ("{0} plants changed".format(args.changed), changed)]:
+        summary, _ = refresh(frame, path)
+        print("{0:<22} {plants:>7} {scored:>7} {counties:>8} {seconds:>9.3f}".format(step, **summary))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,208 @@
+"""Serve the NumPy model exports from read-only memory maps shared by all processes.
+
+    python -m pfas_score.store report                  # RSS/PSS of 4 server-like processes, copied vs mapped
+    python -m pfas_score.store report --processes 8
+
+Several Streamlit servers behind a load balancer would each read the array
+exports (``models/native/*.npz``, see pfas_score/oblivious.py and
+pfas_score/adaboost.py) into private memory. Instead, every array is mapped
+read-only straight from its file: the exports are zips of uncompressed
+``.npy`` members, written by ``save_arrays`` with each member's data aligned
+for direct use. All processes then share the same physical pages through the
+page cache, loaded from disk once, and a model "load" only parses a few
+headers. For models that must stay in RAM regardless of disk, put
+``models/native`` on a tmpfs such as ``/dev/shm``.
+
+On by default; ``PFAS_MMAP_MODELS=0`` loads private copies instead. Models
+served from a pickle or a ``.cbm`` file cannot be shared this way. Exports are
+replaced by renaming a new file over the old one, never rewritten in place,
+because truncating a mapped file crashes the processes mapping it.
+
+The report starts the processes at the same time, loads every model in each
+and reads all of its arrays, then reads ``/proc/self/smaps_rollup`` while
+they are all alive. RSS counts every mapped page in full in every process;
+PSS splits shared pages between the processes that map them, so the sum of
+PSS over the processes is the memory actually used.
+"""
+
+import argparse
+import io
+import multiprocessing
+import os
+import sys
+import zipfile
+
+import numpy as np
+
+ENABLED = os.environ.get("PFAS_MMAP_MODELS", "1").lower() not in ("0", "false", "no")
+
+DEFAULT_PROCESSES = 4
+
+# byte boundary of the array data in the files written by save_arrays
+ALIGNMENT = 64
+
+# fixed size of a zip local file header, before the name and the extra field
+_LOCAL_HEADER_SIZE = 30
+# extra field id and header size of the alignment padding (as used by zipalign)
+_PADDING_ID = 0xD935
+_PADDING_HEADER_SIZE = 4
+
+
+def _map_member(path, file, info):
+    if info.compress_type != zipfile.ZIP_STORED:
+        return None
+    file.seek(info.header_offset)
+    header = file.read(_LOCAL_HEADER_SIZE)
+    name_length = int.from_bytes(header[26:28], "little")
+    extra_length = int.from_bytes(header[28:30], "little")
+    file.seek(info.header_offset + _LOCAL_HEADER_SIZE + name_length + extra_length)
+
+    if np.lib.format.read_magic(file) == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(file)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(file)
+    # unaligned data (exports written by np.savez) would slow every operation down
+    if dtype.hasobject or not shape or 0 in shape or file.tell() % dtype.alignment:
+        return None
+    mapped = np.memmap(path, dtype=dtype, mode="r", offset=file.tell(), shape=shape,
+                       order="F" if fortran_order else "C")
+    # a plain read-only ndarray over the mapping, so results of arithmetic are not memmaps
+    return mapped.view(np.ndarray)
+
+
+def open_arrays(path):
+    """Every array of the ``.npz`` at ``path``, by name, mapped read-only where possible.
+
+    Compressed or unaligned members, scalars and empty arrays are read into memory.
+    """
+    arrays = {}
+    with open(path, "rb") as file, zipfile.ZipFile(file) as archive, np.load(path, allow_pickle=False) as npz:
+        for info in archive.infolist():
+            name = info.filename[:-4] if info.filename.endswith(".npy") else info.filename
+            array = _map_member(path, file, info)
+            arrays[name] = array if array is not None else npz[name]
+    return arrays
+
+
+def load_arrays(path, mmap=None):
+    """The arrays of ``path``: mapped if ``mmap`` (default: ``ENABLED``), else private copies."""
+    if mmap is None:
+        mmap = ENABLED
+    if mmap:
+        return open_arrays(path)
+    with np.load(path, allow_pickle=False) as npz:
+        return {name: npz[name] for name in npz.files}
+
+
+def save_arrays(path, **arrays):
+    """Write ``arrays`` like ``np.savez``, with the data of every member aligned for mapping.
+
+    The data of a member starts after its local header, the name and the extra
+    field; the extra field is padded so that it starts on an ``ALIGNMENT``
+    boundary, as NumPy's own headers keep the data aligned within the member.
+    The file is written next to ``path`` and renamed over it, so processes that
+    map the old file keep it.
+    """
+    temporary = path + ".tmp"
+    with zipfile.ZipFile(temporary, "w", zipfile.ZIP_STORED) as archive:
+        for name, array in arrays.items():
+            buffer = io.BytesIO()
+            np.lib.format.write_array(buffer, np.asanyarray(array), allow_pickle=False)
+            info = zipfile.ZipInfo(name + ".npy", date_time=(1980, 1, 1, 0, 0, 0))
+            start = archive.fp.tell() + _LOCAL_HEADER_SIZE + len(info.filename.encode()) + _PADDING_HEADER_SIZE
+            padding = -start % ALIGNMENT
+            info.extra = _PADDING_ID.to_bytes(2, "little") + padding.to_bytes(2, "little") + bytes(padding)
+            archive.writestr(info, buffer.getvalue())
+    os.replace(temporary, path)
+
+
+def memory_usage():
+    """``(rss, pss)`` of this process in bytes, from ``/proc/self/smaps_rollup``; None where unavailable."""
+    try:
+        with open("/proc/self/smaps_rollup") as file:
+            next(file)  # the address range of the rollup
+            fields = dict(line.split(":", 1) for line in file)
+    except OSError:
+        return None
+    return int(fields["Rss"].split()[0]) * 1024, int(fields["Pss"].split()[0]) * 1024
+
+
+def _touch(model):
+    # read every array of a model once, so all its pages are resident
+    for value in vars(model).values():
+        if isinstance(value, np.ndarray):
+            value.sum()
+
+
+def _measure(barrier, results):
+    # runs in a fresh process; imports first, so that only the models are measured
+    from . import adaboost, native, oblivious
+    from .registry import MODEL_FILES, get_model_with_info
+
+    before = memory_usage()
+    formats = set()
+    for model_id in MODEL_FILES:
+        model, info = get_model_with_info(model_id)
+        _touch(model)
+        formats.add(info.format)
+    barrier.wait()
+    results.put(before + memory_usage() + (sorted(formats),))
+    # stay alive until everyone has measured, so the shared pages are split between all
+    barrier.wait()
+
+
+def report(processes=DEFAULT_PROCESSES):
+    """Per-process memory before and after loading the models, for private copies and memory maps.
+
+    Returns ``{"copy" | "mmap": [(rss before, pss before, rss after, pss after, formats), ...]}``.
+    """
+    context = multiprocessing.get_context("spawn")
+    rows = {}
+    setting = os.environ.get("PFAS_MMAP_MODELS")
+    try:
+        for mode in ("copy", "mmap"):
+            # read by the new processes when they import this module
+            os.environ["PFAS_MMAP_MODELS"] = "1" if mode == "mmap" else "0"
+            barrier = context.Barrier(processes)
+            results = context.Queue()
+            workers = [context.Process(target=_measure, args=(barrier, results)) for _ in range(processes)]
+            for worker in workers:
+                worker.start()
+            rows[mode] = [results.get() for _ in workers]
+            for worker in workers:
+                worker.join()
+    finally:
+        if setting is None:
+            del os.environ["PFAS_MMAP_MODELS"]
+        else:
+            os.environ["PFAS_MMAP_MODELS"] = setting
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m pfas_score.store",
+                                     description="Memory of the models in several processes, copied vs mapped.")
+    parser.add_argument("command", choices=["report"])
+    parser.add_argument("--processes", type=int, default=DEFAULT_PROCESSES,
+                        help="server-like processes to start (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    if memory_usage() is None:
+        print("error: /proc/self/smaps_rollup is not available on this system", file=sys.stderr)
+        return 1
+
+    rows = report(args.processes)
+    print("{0} processes, all six models loaded in each; MB per process (mean) and PSS added by all".format(
+        args.processes))
+    print("{0:<6} {1:<8} {2:>11} {3:>10} {4:>11} {5:>10} {6:>10}".format(
+        "mode", "format", "RSS before", "RSS after", "PSS before", "PSS after", "PSS total"))
+    for mode, measured in rows.items():
+        rss_before, pss_before, rss_after, pss_after = np.mean([row[:4] for row in measured], axis=0) / 1e6
+        pss_total = sum(row[3] - row[1] for row in measured) / 1e6
+        print("{0:<6} {1:<8} {2:>11.1f} {3:>10.1f} {4:>11.1f} {5:>10.1f} {6:>+10.1f}".format(
+            mode, ",".join(measured[0][4]), rss_before, rss_after, pss_before, pss_after, pss_total))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""Sensitivity sweeps: score one sample while one or two inputs vary over a grid.
+
+The whole grid is built as one matrix (the sample repeated, with the swept
+columns overwritten) and scored with a single ``predict_proba`` call, so a
+1000-point line or a 100 x 100 surface costs about as much as a handful of
+single predictions.
+"""
+
+import numpy as np
+import pandas as pd
+
+from .batch import PREDICTION_COLUMN, PROBABILITY_COLUMN, predict_matrix
+from .features import FEATURES, INTEGER_FEATURES, RANGES
+
+# grid points per swept input, for one and for two inputs
+POINTS = {1: 1000, 2: 100}
+
+# the models were trained on 2020-2023; further out they extrapolate flat
+YEAR_RANGE = (2015, 2035)
+
+# upper end of the range of an input whose value is 0 (the PFAS inputs and a few
+# effluent parameters), where a multiple of the value gives no range
+ZERO_VALUE_HIGH = 100.0
+
+
+def sweep_range(feature, value):
+    """Default ``(low, high)`` swept for ``feature`` around ``value``."""
+    if feature == "Year":
+        return min(YEAR_RANGE[0], value), max(YEAR_RANGE[1], value)
+    if feature in RANGES:
+        return RANGES[feature]
+    high = 4.0 * value if value > 0 else ZERO_VALUE_HIGH
+    return min(0.0, value), high
+
+
+def axis(feature, value, points):
+    """Grid values of one swept input, always including ``value`` itself."""
+    low, high = sweep_range(feature, value)
+    if feature in INTEGER_FEATURES:
+        values = np.arange(int(low), int(high) + 1, dtype=np.float64)
+    else:
+        values = np.linspace(low, high, points)
+    return np.union1d(values, [value])
+
+
+def run_sweep(model_id, base, features, points=None):
+    """Score ``base`` (the sample in model input order) over a grid of ``features``.
+
+    Returns a DataFrame with one column per swept input and the prediction and
+    probability of high risk of every grid point.
+    """
+    if points is None:
+        points = POINTS[len(features)]
+    base = np.asarray(base, dtype=np.float64)
+    columns = [FEATURES[model_id].index(feature) for feature in features]
+    axes = [axis(feature, base[column], points) for feature, column in zip(features, columns)]
+    mesh = [values.ravel() for values in np.meshgrid(*axes, indexing="ij")]
+
+    X = np.tile(base, (len(mesh[0]), 1))
+    for column, values in zip(columns, mesh):
+        X[:, column] = values
+    predictions, probabilities = predict_matrix(X, model_id)
+
+    frame = pd.DataFrame(dict(zip(features, mesh)))
+    frame[PREDICTION_COLUMN] = predictions
+    frame[PROBABILITY_COLUMN] = probabilities
+    return frame
+
+
+def flips(frame, feature):
+    """Where the prediction changes along a 1-D sweep: ``[(value, before, after), ...]``.
+
+    ``value`` is the midpoint between the last grid point before and the first
+    after the change.
+    """
+    values = frame[feature].to_numpy()
+    predictions = frame[PREDICTION_COLUMN].to_numpy()
+    changed = np.flatnonzero(predictions[1:] != predictions[:-1])
+    return [((values[i] + values[i + 1]) / 2, int(predictions[i]), int(predictions[i + 1])) for i in changed]
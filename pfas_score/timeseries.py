@@ -0,0 +1,285 @@
+"""Monthly risk history of many plants, rescoring only the months that changed.
+
+    python -m pfas_score.timeseries score history.csv --model influent --output scored.csv
+    python -m pfas_score.timeseries bench --plants 200 --years 5
+
+The influent, effluent and biosolid models take Year and Month as inputs, and
+a plant's monthly history is usually scored again every time a month of data
+is added. ``score_history`` keeps every scored plant-month in a SQLite store,
+``history/timeseries.sqlite3`` (``PFAS_TIMESERIES_DB``), keyed by model, model
+file SHA-256, plant, year and month, together with the inputs it was scored
+on. Scoring a file only calls the model on the plant-months that are new or
+whose inputs changed; all others are read back from the store. A new model
+file has a new SHA-256, so everything is scored once more with it.
+
+The rows of the file need a plant column (see ``history.PLANT_COLUMNS``).
+Plant-months missing from a later file stay in the store, so a file with only
+the newest month extends each plant's trajectory as well.
+"""
+
+import argparse
+import contextlib
+import os
+import sqlite3
+import sys
+import time
+
+from .history import PLANT_COLUMNS
+from .registry import ROOT_DIR
+
+DATABASE = os.environ.get("PFAS_TIMESERIES_DB") or os.path.join(ROOT_DIR, "history", "timeseries.sqlite3")
+
+# the models with Year and Month among their inputs
+TIMESERIES_MODELS = ["influent", "effluent", "biosolid"]
+
+# plants per lookup of stored scores
+_PLANTS_PER_QUERY = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS scores (
+    model_id TEXT NOT NULL,
+    model_sha256 TEXT NOT NULL,
+    plant TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    month INTEGER NOT NULL,
+    -- float64 values in model input order
+    inputs BLOB NOT NULL,
+    prediction INTEGER NOT NULL,
+    probability REAL NOT NULL,
+    -- unix seconds
+    scored REAL NOT NULL,
+    PRIMARY KEY (model_id, model_sha256, plant, year, month)
+) WITHOUT ROWID;
+"""
+
+
+@contextlib.contextmanager
+def _connect(path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+    try:
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(_SCHEMA)
+        yield connection
+    finally:
+        connection.close()
+
+
+def plant_column(frame):
+    """The column of ``frame`` naming the plant of each row, or None."""
+    return next((column for column in frame.columns if str(column).strip().lower() in PLANT_COLUMNS), None)
+
+
+def _stored(connection, model_id, sha256, plants):
+    # (plant, year, month) -> (inputs, prediction, probability) of the given plants
+    stored = {}
+    plants = sorted(plants)
+    for start in range(0, len(plants), _PLANTS_PER_QUERY):
+        chunk = plants[start:start + _PLANTS_PER_QUERY]
+        rows = connection.execute(
+            "SELECT plant, year, month, inputs, prediction, probability FROM scores "
+            "WHERE model_id = ? AND model_sha256 = ? AND plant IN ({0})".format(", ".join("?" * len(chunk))),
+            [model_id, sha256] + chunk)
+        for plant, year, month, inputs, prediction, probability in rows:
+            stored[plant, year, month] = (inputs, prediction, probability)
+    return stored
+
+
+def score_history(frame, model_id, path=None):
+    """Score the plant-months of ``frame`` that are not in the store yet or changed.
+
+    Returns ``(result, problems, scored)``: ``frame`` with the prediction and
+    the probability of high risk appended (None if it did not validate, as in
+    ``batch.score_frame``), and a boolean array marking the rows the model was
+    called on.
+    """
+    import numpy as np
+    import pandas as pd
+
+    from . import batch
+    from .features import FEATURES
+    from .registry import get_model_with_info
+
+    if model_id not in TIMESERIES_MODELS:
+        raise ValueError("{0} does not take Year and Month as inputs".format(model_id))
+    column = plant_column(frame)
+    if column is None:
+        return None, ["Missing a plant column: one of " + ", ".join(PLANT_COLUMNS)], None
+    mapping, missing = batch.match_columns(frame, model_id)
+    if missing:
+        return None, ["Missing columns: " + ", ".join(missing)], None
+    if frame.empty:
+        return None, ["The file does not contain any rows."], None
+    X, problems, _ = batch.check_frame(frame, mapping, model_id)
+    plants = frame[column].astype(str).str.strip()
+    if (plants == "").any() or frame[column].isna().any():
+        problems.append("{0}: missing in row(s) {1}".format(
+            column, batch.row_list(frame.index, ((plants == "") | frame[column].isna()).to_numpy())))
+    if problems:
+        return None, problems, None
+
+    features = FEATURES[model_id]
+    years = X[:, features.index("Year")].astype(np.int64)
+    months = X[:, features.index("Month")].astype(np.int64)
+    keys = list(zip(plants.tolist(), years.tolist(), months.tolist()))
+    duplicated = pd.Series(keys, dtype=object).duplicated(keep=False).to_numpy()
+    if duplicated.any():
+        return None, ["More than one row for the same plant, year and month in row(s) {0}".format(
+            batch.row_list(frame.index, duplicated))], None
+
+    model, info = get_model_with_info(model_id)
+    inputs = [row.tobytes() for row in np.ascontiguousarray(X, dtype="<f8")]
+    predictions = np.empty(len(X), dtype=np.int64)
+    probabilities = np.empty(len(X))
+    with _connect(path or DATABASE) as connection:
+        stored = _stored(connection, model_id, info.sha256, set(plants))
+        new = np.ones(len(X), dtype=bool)
+        for i, key in enumerate(keys):
+            found = stored.get(key)
+            if found is not None and found[0] == inputs[i]:
+                new[i] = False
+                predictions[i], probabilities[i] = found[1], found[2]
+        if new.any():
+            predictions[new], probabilities[new] = batch.predict_matrix(X[new], model_id, model)
+            now = time.time()
+            connection.execute("BEGIN")
+            connection.executemany(
+                "INSERT OR REPLACE INTO scores (model_id, model_sha256, plant, year, month, inputs, prediction, "
+                "probability, scored) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(model_id, info.sha256) + keys[i] + (inputs[i], int(predictions[i]), float(probabilities[i]), now)
+                 for i in np.flatnonzero(new)])
+            connection.execute("COMMIT")
+
+    result = frame.copy()
+    result[batch.PREDICTION_COLUMN] = predictions
+    result[batch.PROBABILITY_COLUMN] = probabilities
+    return result, [], new
+
+
+def trajectories(model_id, plants=None, path=None):
+    """Stored scores of the current model file, one row per plant-month in time order, as a DataFrame."""
+    import pandas as pd
+
+    from .registry import get_model_with_info
+
+    sha256 = get_model_with_info(model_id)[1].sha256
+    query = "SELECT plant, year, month, prediction, probability FROM scores WHERE model_id = ? AND model_sha256 = ?"
+    parameters = [model_id, sha256]
+    if plants:
+        query += " AND plant IN ({0})".format(", ".join("?" * len(plants)))
+        parameters.extend(plants)
+    with _connect(path or DATABASE) as connection:
+        rows = connection.execute(query + " ORDER BY plant, year, month", parameters).fetchall()
+    frame = pd.DataFrame(rows, columns=["plant", "year", "month", "prediction", "probability"])
+    frame["date"] = pd.to_datetime(dict(year=frame["year"], month=frame["month"], day=1))
+    return frame
+
+
+def stored_plants(model_id, path=None):
+    """The plants with stored scores of the current model file, sorted."""
+    from .registry import get_model_with_info
+
+    with _connect(path or DATABASE) as connection:
+        rows = connection.execute("SELECT DISTINCT plant FROM scores WHERE model_id = ? AND model_sha256 = ? "
+                                  "ORDER BY plant", (model_id, get_model_with_info(model_id)[1].sha256)).fetchall()
+    return [row[0] for row in rows]
+
+
+def synthetic_history(model_id, plants, years, end_year=2024, seed=0):
+    """A monthly history of ``plants`` plants over ``years`` years ending with December ``end_year``."""
+    import numpy as np
+    import pandas as pd
+
+    from .corpus import synthetic_corpus
+    from .features import FEATURES
+
+    months = years * 12
+    X = synthetic_corpus(model_id, plants * months, seed=seed)
+    features = FEATURES[model_id]
+    month_index = np.tile(np.arange(months), plants)
+    X[:, features.index("Year")] = end_year - years + 1 + month_index // 12
+    X[:, features.index("Month")] = month_index % 12 + 1
+    frame = pd.DataFrame(X, columns=features)
+    frame.insert(0, "Plant", np.repeat(["Plant {0:03d}".format(i) for i in range(plants)], months))
+    return frame
+
+
+def bench(model_id, plants, years, path):
+    """Score a synthetic history into a new store at ``path``, then again after a month was added.
+
+    Returns ``[(step, rows in the file, rows scored, seconds), ...]``.
+    """
+    import pandas as pd
+
+    from .features import FEATURES
+
+    if os.path.exists(path):
+        os.remove(path)
+    history = synthetic_history(model_id, plants, years)
+    steps = []
+
+    def run(step, frame):
+        start = time.perf_counter()
+        result, problems, scored = score_history(frame, model_id, path)
+        if problems:
+            raise ValueError("\n".join(problems))
+        steps.append((step, len(frame), int(scored.sum()), time.perf_counter() - start))
+
+    run("first run", history)
+    run("unchanged", history)
+    # one more month for every plant: January of the next year
+    latest = history.groupby("Plant").tail(1).copy()
+    latest[["Year", "Month"]] = latest["Year"].max() + 1, 1
+    run("new month", pd.concat([history, latest], ignore_index=True))
+    # a corrected value in one month of one plant
+    corrected = pd.concat([history, latest], ignore_index=True)
+    corrected.loc[0, FEATURES[model_id][2]] += 1.0
+    run("one correction", corrected)
+    return steps
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m pfas_score.timeseries",
+                                     description="Incremental scoring of monthly plant histories.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    score_parser = subcommands.add_parser("score", help="score a CSV or Excel file of plant-months")
+    score_parser.add_argument("input")
+    score_parser.add_argument("--model", required=True, choices=TIMESERIES_MODELS)
+    score_parser.add_argument("--output", "-o", help="CSV file to write the scored rows to")
+    bench_parser = subcommands.add_parser("bench", help="rescoring after one new month, on a synthetic history")
+    bench_parser.add_argument("--model", default="influent", choices=TIMESERIES_MODELS)
+    bench_parser.add_argument("--plants", type=int, default=200)
+    bench_parser.add_argument("--years", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    if args.command == "score":
+        from .batch import read_table, to_csv_bytes
+
+        try:
+            result, problems, scored = score_history(read_table(args.input), args.model)
+        except OSError as error:
+            print("error: {0}".format(error), file=sys.stderr)
+            return 1
+        except (ValueError, UnicodeDecodeError) as error:
+            problems = [str(error)]
+        if problems:
+            print("error: invalid input\n" + "\n".join(problems), file=sys.stderr)
+            return 1
+        print("{0} rows, {1} scored, {2} unchanged".format(len(result), scored.sum(), len(result) - scored.sum()))
+        if args.output:
+            with open(args.output, "wb") as file:
+                file.write(to_csv_bytes(result))
+        return 0
+
+    import tempfile
+
+    path = os.path.join(tempfile.gettempdir(), "pfas_timeseries_bench.sqlite3")
+    print("{0}: {1} plants x {2} years, monthly".format(args.model, args.plants, args.years))
+    print("{0:<15} {1:>8} {2:>8} {3:>9}".format("step", "rows", "scored", "seconds"))
+    for step, rows, scored, seconds in bench(args.model, args.plants, args.years, path):
+        print("{0:<15} {1:>8} {2:>8} {3:>9.3f}".format(step, rows, scored, seconds))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
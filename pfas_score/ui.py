@@ -0,0 +1,511 @@
+"""Streamlit building blocks shared by the prediction pages."""
+
+import io
+
+import streamlit as st
+
+INPUT_MODES = ["Single entry", "Batch upload", "Time series", "Sensitivity sweep", "Uncertainty"]
+
+# inputs shown in the explanation of a prediction
+EXPLAINED_INPUTS = 10
+
+
+def input_mode(modes=INPUT_MODES):
+    """Let the user choose how to enter the samples (see ``INPUT_MODES``)."""
+    return st.radio("Input mode", modes, horizontal=True)
+
+
+def _log_once(name, token, log):
+    # the scoring caches are shared by all sessions, so predictions are logged
+    # here instead, once for every upload (``token``) of this session; the
+    # reruns caused by the download button keep the token and log nothing
+    key = "logged-" + name
+    if st.session_state.get(key) != token:
+        log()
+        st.session_state[key] = token
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def _score_upload(data, file_name, model_id, contributions=False):
+    # cached on the file contents so the reruns caused by the download button
+    # do not score the whole file again
+    from . import batch, plant
+    from .metrics import span
+
+    frame = batch.read_table(io.BytesIO(data), file_name)
+    with span("batch_score", model=model_id):
+        if model_id == plant.PLANT_ID:
+            result, problems = plant.score_frame(frame)
+        else:
+            result, problems = batch.score_frame(frame, model_id)
+    if contributions and result is not None:
+        from .explain import contribution_frame
+
+        result = result.join(contribution_frame(frame, model_id))
+    csv = batch.to_csv_bytes(result) if result is not None else None
+    return result, problems, csv
+
+
+def batch_upload(model_id):
+    """Upload a CSV/Excel file, score every row and offer the results for download.
+
+    ``model_id`` may also be ``"plant"``, which scores the influent, effluent
+    and biosolid models on every row (see pfas_score/plant.py).
+    """
+    from . import batch, plant
+    from .features import FEATURES
+    from .jobs import KEEP_DAYS
+
+    st.write("""Upload a CSV or Excel file with one sample per row and one column per input. The column names must match
+             the input names below (case does not matter); any other columns, such as a plant name, are kept in the results.""")
+    st.caption("Expected columns: " + ", ".join(FEATURES[model_id]))
+    st.download_button("Download template", batch.template_csv(model_id),
+                       file_name="{0}_template.csv".format(model_id), mime="text/csv")
+
+    uploaded = st.file_uploader("Upload samples", type=["csv", "xlsx", "xls"])
+    background = st.checkbox("Score in the background: for large files, the results stay available for {0} days "
+                             "even if you close this page".format(KEEP_DAYS))
+    contributions = model_id != plant.PLANT_ID and not background and st.checkbox(
+        "Add the contribution of every input to each prediction (see \"Why this prediction?\" on the single entry form)")
+    if background and uploaded is not None and st.button("Score {0} in the background".format(uploaded.name)):
+        from .jobs import enqueue
+
+        job_id = enqueue(uploaded.getvalue(), uploaded.name, model_id)
+        # kept in the address of the page, so reloading or bookmarking it finds the job again
+        st.query_params["job"] = st.query_params.get_all("job") + [job_id]
+    background_jobs(model_id)
+    if uploaded is None or background:
+        return
+
+    try:
+        with st.spinner("Scoring {0}...".format(uploaded.name)):
+            result, problems, csv = _score_upload(uploaded.getvalue(), uploaded.name, model_id, contributions)
+    except (ValueError, UnicodeDecodeError) as error:
+        st.error("Could not read {0}: {1}".format(uploaded.name, error))
+        return
+
+    if problems:
+        st.error("The uploaded file has invalid inputs:\n\n" + "\n".join("- " + problem for problem in problems))
+        return
+
+    if model_id != plant.PLANT_ID:
+        from .history import log_frame
+
+        _log_once("upload-" + model_id, uploaded.file_id, lambda: log_frame(result, model_id))
+    if model_id == plant.PLANT_ID:
+        high_risk = {name: int(result[column].sum()) for name, (column, _) in plant.RESULT_COLUMNS.items()}
+    else:
+        high_risk = {model_id: int(result[batch.PREDICTION_COLUMN].sum())}
+    _write_summary(len(result), high_risk)
+    st.dataframe(result.head(1000))
+    st.download_button("Download results", csv,
+                       file_name="{0}_predictions.csv".format(model_id), mime="text/csv")
+
+
+def _write_summary(rows, high_risk):
+    # high_risk: model id -> rows predicted high risk
+    if len(high_risk) == 1:
+        count = next(iter(high_risk.values()))
+        st.write("Scored {0} samples: {1} high risk, {2} low risk.".format(rows, count, rows - count))
+        return
+    st.write("Scored {0} samples.".format(rows))
+    for name, count in high_risk.items():
+        st.write("{0}: {1} high risk, {2} low risk.".format(name.capitalize(), count, rows - count))
+
+
+@st.experimental_fragment(run_every=2)
+def _job_progress(job_id):
+    # redrawn every 2 seconds on its own; the whole page reruns once the job is over
+    from .jobs import get_job
+
+    job = get_job(job_id)
+    # None once the job was purged; the rerun then leaves it out of background_jobs
+    if job is None or not job.active:
+        st.rerun()
+    if job.state == "queued":
+        text = "Waiting for a worker..."
+    elif job.total_rows is None:
+        text = "Counting the rows..."
+    else:
+        text = "{0} of {1} samples scored".format(job.done_rows, job.total_rows)
+    st.progress(job.progress, text=text)
+
+
+def background_jobs(model_id):
+    """Show the progress and results of the background jobs started from this page (see pfas_score/jobs.py)."""
+    from .jobs import ensure_workers, get_job
+
+    jobs = [job for job in map(get_job, st.query_params.get_all("job")) if job is not None and job.model_id == model_id]
+    if any(job.active for job in jobs):
+        # after a restart of the machine, say
+        ensure_workers()
+    for job in jobs:
+        st.subheader(job.file_name)
+        st.caption("Job {0}. Bookmark this page to come back to it later.".format(job.id))
+        if job.active:
+            _job_progress(job.id)
+            if st.button("Cancel", key="cancel-" + job.id):
+                from .jobs import cancel
+
+                cancel(job.id)
+                st.rerun()
+        elif job.state == "done":
+            _write_summary(job.done_rows, job.high_risk)
+            if job.problems:
+                st.warning("Rows left without a prediction:\n\n" + "\n".join("- " + problem for problem in job.problems))
+            with open(job.result_path, "rb") as file:
+                st.download_button("Download results", file, key="download-" + job.id,
+                                   file_name="{0}_predictions.csv".format(model_id), mime="text/csv")
+        elif job.state == "failed":
+            st.error("The file could not be scored:\n\n" + "\n".join("- " + problem for problem in job.problems))
+        else:
+            st.write("Cancelled after {0} samples.".format(job.done_rows))
+
+
+def explanation(model_id, values):
+    """Show which inputs pushed one prediction towards high or low risk.
+
+    ``values`` are the valid inputs of the page in model input order.
+    """
+    import altair as alt
+    import pandas as pd
+
+    from .explain import explain_cached, global_importance
+    from .features import FEATURES
+
+    with st.expander("Why this prediction?"):
+        contributions, expected_value = explain_cached(model_id, values)
+        frame = pd.DataFrame({"input": FEATURES[model_id], "contribution": contributions})
+        frame = frame.loc[frame["contribution"].abs().sort_values(ascending=False).index[:EXPLAINED_INPUTS]]
+        frame["direction"] = frame["contribution"].gt(0).map({True: "towards high risk", False: "towards low risk"})
+        chart = alt.Chart(frame).mark_bar().encode(
+            x=alt.X("contribution:Q", title="Contribution to the log-odds of high risk"),
+            y=alt.Y("input:N", sort=None, title=None),
+            color=alt.Color("direction:N", title=None, scale=alt.Scale(
+                domain=["towards high risk", "towards low risk"], range=["#d62728", "#1f77b4"])))
+        st.altair_chart(chart, use_container_width=True)
+        st.caption("The {0} inputs that moved this prediction most. Starting from the model's average log-odds of {1:.2f}, "
+                   "the contributions of all inputs add up to this sample's log-odds of {2:.2f}.".format(
+                       len(frame), expected_value, expected_value + sum(contributions)))
+
+        summary = global_importance(model_id)
+        if summary is not None:
+            st.write("Most influential inputs over many samples: " + ", ".join(
+                list(summary["mean_abs_contribution"])[:EXPLAINED_INPUTS // 2]) + ".")
+
+
+def figure(name, caption):
+    """Show one of the home page figures.
+
+    With static serving enabled and the variants built (``python -m
+    pfas_score.figures build``) the browser gets a lazily loaded, responsive
+    image that opens at full resolution when clicked; otherwise a page-sized
+    JPEG cached for the life of the process goes through ``st.image``.
+    """
+    from .figures import figure_bytes, picture_html
+
+    markup = picture_html(name, caption) if st.get_option("server.enableStaticServing") else None
+    if markup is None:
+        st.image(figure_bytes(name), caption=caption)
+    else:
+        st.markdown(markup, unsafe_allow_html=True)
+
+
+def _score_history(uploaded, model_id, sha256):
+    # scored once for every upload of this session, not on every rerun: the
+    # store changes with each scoring, and only the first one of an upload
+    # says which months it scored and logs them
+    from .batch import read_table
+    from .history import log_frame
+    from .timeseries import score_history
+
+    key = "timeseries-" + model_id
+    token = (uploaded.file_id, sha256)
+    stored = st.session_state.get(key)
+    if stored is None or stored[0] != token:
+        result, problems, scored = score_history(read_table(io.BytesIO(uploaded.getvalue()), uploaded.name), model_id)
+        if result is not None:
+            log_frame(result[scored], model_id, source="timeseries")
+        stored = st.session_state[key] = (token, (result, problems, scored))
+    return stored[1]
+
+
+def time_series(model_id):
+    """Score the monthly history of many plants, only the new or changed months, and chart each plant's risk.
+
+    For the models with Year and Month inputs (see pfas_score/timeseries.py).
+    """
+    import altair as alt
+    import pandas as pd
+
+    from . import batch
+    from .features import DEFAULTS, FEATURES
+    from .registry import get_model_with_info
+    from .timeseries import plant_column, stored_plants, trajectories
+
+    st.write("""Upload a CSV or Excel file with one row per plant and month: a plant column (Plant, Plant Name, Plant ID,
+             Facility or WWTP) and the inputs below. Plant-months already scored with the same inputs by this model are not
+             scored again, so after adding a month of data only the new month is scored. Months left out of a later file
+             are kept, so a file with only the newest month also works.""")
+    st.caption("Expected columns: Plant, " + ", ".join(FEATURES[model_id]))
+    template = pd.DataFrame([dict({"Plant": "Plant A"}, **DEFAULTS[model_id])])
+    st.download_button("Download template", batch.to_csv_bytes(template),
+                       file_name="{0}_history_template.csv".format(model_id), mime="text/csv")
+
+    uploaded = st.file_uploader("Upload plant history", type=["csv", "xlsx", "xls"])
+    highlighted = []
+    if uploaded is not None:
+        sha256 = get_model_with_info(model_id)[1].sha256
+        try:
+            with st.spinner("Scoring {0}...".format(uploaded.name)):
+                result, problems, scored = _score_history(uploaded, model_id, sha256)
+        except (ValueError, UnicodeDecodeError) as error:
+            st.error("Could not read {0}: {1}".format(uploaded.name, error))
+            return
+        if problems:
+            st.error("The uploaded file has invalid inputs:\n\n" + "\n".join("- " + problem for problem in problems))
+            return
+        st.write("{0} plant-months: {1} new or changed and scored, {2} unchanged and taken from earlier runs.".format(
+            len(result), int(scored.sum()), len(result) - int(scored.sum())))
+        st.download_button("Download results", batch.to_csv_bytes(result),
+                           file_name="{0}_history_predictions.csv".format(model_id), mime="text/csv")
+        highlighted = result[plant_column(result)].astype(str).str.strip().unique().tolist()
+
+    plants = stored_plants(model_id)
+    if not plants:
+        st.info("No plant history has been scored with this model yet.")
+        return
+    selected = st.multiselect("Plants", plants, default=(highlighted or plants)[:5])
+    if not selected:
+        return
+    frame = trajectories(model_id, selected)
+    line = alt.Chart(frame).mark_line(point=True).encode(
+        x=alt.X("date:T", title="Month"),
+        y=alt.Y("probability:Q", title=batch.PROBABILITY_COLUMN, scale=alt.Scale(domain=[0, 1])),
+        color=alt.Color("plant:N", title=None),
+        tooltip=["plant:N", "year:Q", "month:Q", "prediction:Q", alt.Tooltip("probability:Q", format=".3f")])
+    threshold = alt.Chart(pd.DataFrame({"y": [0.5]})).mark_rule(strokeDash=[4, 4]).encode(y="y:Q")
+    st.altair_chart(line + threshold, use_container_width=True)
+    st.caption("Probability of high risk of every scored month; above the dashed line the prediction is high risk.")
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def _score_export(data, file_name, model_id, non_detects):
+    # cached on the file, so the reruns caused by the download button do not
+    # read it again; only the first rows are kept for the table on the page
+    from .batch import PREDICTION_COLUMN
+    from .labreport import read_export, score_export
+
+    with read_export(io.BytesIO(data), file_name, non_detects) as export:
+        if export.problems:
+            return None, None, 0, 0, export.problems, []
+        preview, csv, samples, high_risk = [], io.BytesIO(), 0, 0
+        for frame in score_export(export, model_id):
+            frame.to_csv(csv, index=False, header=not samples)
+            if samples < 1000:
+                preview.append(frame.head(1000 - samples))
+            samples += len(frame)
+            high_risk += int(frame[PREDICTION_COLUMN].sum())
+        notes = export.notes
+    if not samples:
+        return None, None, 0, 0, ["The file does not contain any results of the 39 analytes."], notes
+    import pandas as pd
+
+    return pd.concat(preview, ignore_index=True), csv.getvalue(), samples, high_risk, [], notes
+
+
+def _log_export(csv, model_id):
+    # the cache keeps the scored export as CSV only, so it is read back in chunks
+    import pandas as pd
+
+    from .history import log_frame
+    from .labreport import PLANT_COLUMN, SAMPLE_COLUMN
+
+    for frame in pd.read_csv(io.BytesIO(csv), chunksize=50000, dtype={SAMPLE_COLUMN: str, PLANT_COLUMN: str}):
+        log_frame(frame, model_id, source="labreport")
+
+
+def lab_report(model_id):
+    """Score a long-format lab export, one row per sample and analyte (see pfas_score/labreport.py)."""
+    from .labreport import DEFAULT_NON_DETECTS, NON_DETECTS, template_csv
+
+    st.write("""Upload a lab export as a CSV or Excel file with one row per sample and analyte: a sample column, an analyte
+             column (name, common synonym or CAS number), a result column and, if the lab provides them, qualifier, unit and
+             detection limit columns. The results of each sample are collected into the 39 inputs of the form, converted
+             to ng/L. Analytes a sample has no result for are 0, as on the form; other analytes, such as labelled
+             standards, are ignored.""")
+    st.download_button("Download example export", template_csv(), file_name="lab_export_example.csv", mime="text/csv")
+
+    uploaded = st.file_uploader("Upload lab export", type=["csv", "xlsx", "xls"])
+    names = {"zero": "0", "half": "Half the detection limit", "limit": "The detection limit"}
+    non_detects = st.radio("Count non-detects (qualified U or ND, or reported as <limit) as", list(NON_DETECTS),
+                           index=list(NON_DETECTS).index(DEFAULT_NON_DETECTS), format_func=names.get, horizontal=True)
+    if uploaded is None:
+        return
+
+    try:
+        with st.spinner("Scoring {0}...".format(uploaded.name)):
+            preview, csv, samples, high_risk, problems, notes = _score_export(
+                uploaded.getvalue(), uploaded.name, model_id, non_detects)
+    except (ValueError, UnicodeDecodeError) as error:
+        st.error("Could not read {0}: {1}".format(uploaded.name, error))
+        return
+
+    if problems:
+        st.error("The uploaded export has rows that could not be read:\n\n" +
+                 "\n".join("- " + problem for problem in problems))
+        return
+
+    _log_once("labreport-" + model_id, (uploaded.file_id, non_detects), lambda: _log_export(csv, model_id))
+    _write_summary(samples, {model_id: high_risk})
+    for note in notes:
+        st.caption(note)
+    st.dataframe(preview)
+    st.download_button("Download results", csv, file_name="{0}_lab_predictions.csv".format(model_id), mime="text/csv")
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _run_sweep(model_id, base, features):
+    # cached on the whole sweep, so moving the range slider only redraws the chart
+    from .sweep import run_sweep
+
+    return run_sweep(model_id, base, features)
+
+
+def sensitivity_sweep(model_id, inputs):
+    """Vary one or two of ``inputs`` and chart the predicted risk.
+
+    ``inputs`` are the page's values in model input order, as a dict or a list;
+    False marks an invalid value.
+    """
+    import altair as alt
+    import pandas as pd
+
+    from .batch import PREDICTION_COLUMN, PROBABILITY_COLUMN
+    from .features import FEATURES
+    from .sweep import flips
+
+    st.subheader("Sensitivity sweep")
+    base = list(inputs.values()) if isinstance(inputs, dict) else list(inputs)
+    if any(value is False for value in base):
+        st.info("Correct the invalid inputs above to run a sweep.")
+        return
+
+    features = FEATURES[model_id]
+    chosen = st.multiselect("Inputs to vary (one or two); the others keep the values above",
+                            features, default=features[2:3], max_selections=2)
+    if not chosen:
+        return
+
+    with st.spinner("Scoring the sweep..."):
+        frame = _run_sweep(model_id, tuple(float(value) for value in base), tuple(chosen))
+    current = {feature: float(base[features.index(feature)]) for feature in chosen}
+
+    if len(chosen) == 1:
+        feature = chosen[0]
+        low, high = float(frame[feature].min()), float(frame[feature].max())
+        shown = st.slider("Range shown", low, high, (low, high))
+        # plain column names: altair reads ":" in names like "6:2 FTS (ng/L)" as a type
+        window = frame[frame[feature].between(*shown)]
+        window = pd.DataFrame({"x": window[feature], "p": window[PROBABILITY_COLUMN]})
+        line = alt.Chart(window).mark_line().encode(
+            x=alt.X("x:Q", title=feature, scale=alt.Scale(zero=False)),
+            y=alt.Y("p:Q", title=PROBABILITY_COLUMN, scale=alt.Scale(domain=[0, 1])))
+        threshold = alt.Chart(pd.DataFrame({"y": [0.5]})).mark_rule(strokeDash=[4, 4]).encode(y="y:Q")
+        marker = alt.Chart(pd.DataFrame({"x": [current[feature]]})).mark_rule(color="gray").encode(x="x:Q")
+        st.altair_chart(line + threshold + marker, use_container_width=True)
+
+        changes = flips(frame, feature)
+        if not changes:
+            st.write("The prediction does not change between {0:g} and {1:g}.".format(low, high))
+        for value, before, after in changes:
+            st.write("{0} risk becomes {1} at {2} = {3:.4g} (current value {4:.4g}).".format(
+                "High" if before else "Low", "high" if after else "low", feature, value, current[feature]))
+    else:
+        x, y = chosen
+        grid = pd.DataFrame({"x": frame[x], "y": frame[y], "p": frame[PROBABILITY_COLUMN]})
+        heatmap = alt.Chart(grid).mark_rect().encode(
+            x=alt.X("x:Q", title=x, bin=alt.Bin(maxbins=100)),
+            y=alt.Y("y:Q", title=y, bin=alt.Bin(maxbins=100)),
+            color=alt.Color("mean(p):Q", title=PROBABILITY_COLUMN,
+                            scale=alt.Scale(domain=[0, 1], scheme="redblue", reverse=True)))
+        marker = alt.Chart(pd.DataFrame({"x": [current[x]], "y": [current[y]]})).mark_point(
+            color="black", size=80, filled=True).encode(x="x:Q", y="y:Q")
+        st.altair_chart(heatmap + marker, use_container_width=True)
+        high_risk = frame[PREDICTION_COLUMN].mean()
+        st.write("{0:.0%} of the grid is predicted high risk; the dot marks the values above.".format(high_risk))
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _simulate(model_id, base, errors, samples):
+    # cached, so the reruns after a simulation do not draw the samples again
+    from .uncertainty import simulate
+
+    return simulate(model_id, base, dict(errors), samples=samples)
+
+
+def uncertainty_analysis(model_id, inputs):
+    """Propagate measurement error of ``inputs`` through the model by Monte Carlo.
+
+    ``inputs`` are the page's values in model input order, as a dict or a list;
+    False marks an invalid value.
+    """
+    import altair as alt
+    import pandas as pd
+
+    from .features import FEATURES, INTEGER_FEATURES
+    from .uncertainty import (BINS, DEFAULT_SAMPLES, DISTRIBUTIONS, SAMPLE_CHOICES, SPREAD_LABELS, Error,
+                              typical_error)
+
+    st.subheader("Measurement uncertainty")
+    base = list(inputs.values()) if isinstance(inputs, dict) else list(inputs)
+    if any(value is False for value in base):
+        st.info("Correct the invalid inputs above to run a simulation.")
+        return
+    base = tuple(float(value) for value in base)
+
+    features = FEATURES[model_id]
+    values = dict(zip(features, base))
+    varied = [feature for feature in features if feature not in INTEGER_FEATURES]
+    suggested = [feature for feature in varied if typical_error(feature) is not None and values[feature] != 0]
+    chosen = st.multiselect("Inputs with measurement error; the others are taken as exact", varied,
+                            default=suggested)
+    st.caption("Errors are relative to the value entered, so inputs entered as 0 (not detected) stay 0.")
+
+    # no form, so that the spread is labelled for the distribution as soon as it is chosen
+    errors = []
+    for feature in chosen:
+        typical = typical_error(feature) or Error("normal", 0.1)
+        left, right = st.columns([1, 2])
+        distribution = left.selectbox(feature, DISTRIBUTIONS, index=DISTRIBUTIONS.index(typical.distribution))
+        if typical.relative:
+            spread = right.number_input(SPREAD_LABELS[distribution] + " (% of the value)", min_value=0.0,
+                                        max_value=500.0, value=100 * typical.spread, key=feature + " spread") / 100
+        else:
+            spread = right.number_input(SPREAD_LABELS[distribution], min_value=0.0, value=typical.spread,
+                                        key=feature + " spread")
+        errors.append((feature, Error(distribution, spread, typical.relative)))
+    samples = st.selectbox("Samples", SAMPLE_CHOICES, index=SAMPLE_CHOICES.index(DEFAULT_SAMPLES),
+                           format_func="{0:,}".format)
+    run = st.button("Run simulation")
+
+    if not run:
+        return
+    if not errors:
+        st.info("Choose at least one input with measurement error.")
+        return
+
+    with st.spinner("Scoring {0:,} samples...".format(samples)):
+        result = _simulate(model_id, base, tuple(errors), samples)
+    low, high = result.interval()
+    st.metric("Share of samples predicted high risk", "{0:.1%}".format(result.exceedance_probability))
+    st.write("95% confidence interval {0:.2%} to {1:.2%}, from {2:,} samples in {3:.1f} s. The model's probability "
+             "of high risk averages {4:.2f} (5th to 95th percentile {5:.2f} to {6:.2f}).".format(
+                 low, high, result.samples, result.seconds, result.mean_probability,
+                 result.probability_quantile(0.05), result.probability_quantile(0.95)))
+
+    histogram = pd.DataFrame({"p": [i / BINS for i in range(BINS)], "samples": result.histogram})
+    chart = alt.Chart(histogram).mark_bar().encode(
+        x=alt.X("p:Q", title="Probability of high risk", bin=alt.Bin(step=1 / BINS), scale=alt.Scale(domain=[0, 1])),
+        y=alt.Y("samples:Q", title="Samples"))
+    st.altair_chart(chart, use_container_width=True)
@@ -0,0 +1,244 @@
+"""Monte Carlo propagation of measurement error through the models.
+
+Lab values such as BOD, TOC or the individual PFAS carry analytical error, so a
+single 0/1 prediction overstates how certain the answer is. ``simulate`` draws
+many plausible true values of one sample from per-input error distributions,
+scores them all and reports the share predicted high risk (over 70 ng/L, or at
+high risk of detection for the biosolid models) with a Wilson confidence
+interval.
+
+The draws are split into chunks of ``CHUNK_SIZE`` rows, each with its own
+random stream spawned from one ``SeedSequence``, so a seed gives the same
+result whatever the number of workers. Each chunk is drawn and scored with one
+vectorized ``predict_proba`` call in a worker process, and only its counts come
+back. With a single CPU, or a single chunk, everything runs in-process.
+
+    python -m pfas_score.uncertainty influent --error "Biochemical Oxygen Demand=normal:0.15" --samples 1000000
+"""
+
+import argparse
+import math
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Tuple
+
+import numpy as np
+
+from .features import DEFAULTS, FEATURES, INTEGER_FEATURES, RANGES
+from .registry import PAGE_MODELS
+
+DISTRIBUTIONS = ["normal", "lognormal", "uniform"]
+
+# what ``Error.spread`` means for each distribution
+SPREAD_LABELS = {"normal": "Standard deviation", "lognormal": "Standard deviation", "uniform": "Half-width"}
+
+SAMPLE_CHOICES = [100000, 250000, 500000, 1000000]
+DEFAULT_SAMPLES = 100000
+
+CHUNK_SIZE = 25000
+
+# bins of the histogram of the probability of high risk over [0, 1]
+BINS = 100
+
+Z_95 = 1.959963984540054
+
+DEFAULT_SEED = 20240101
+
+
+@dataclass(frozen=True)
+class Error:
+    """Error distribution of one input around the entered value.
+
+    ``spread`` is the standard deviation (normal, lognormal) or the half-width
+    (uniform), as a fraction of the value if ``relative`` and in the input's
+    unit otherwise.
+    """
+    distribution: str
+    spread: float
+    relative: bool = True
+
+
+# typical error of common lab methods, by part of the input name (first match
+# wins); percent removals are derived values and are left alone
+TYPICAL_ERRORS = [
+    ("Percent Removal", None),
+    ("Biochemical Oxygen Demand", Error("normal", 0.15)),
+    ("Total Organic Carbon", Error("normal", 0.10)),
+    ("Total Suspended Solids", Error("normal", 0.10)),
+    ("Total Dissolved Solids", Error("normal", 0.05)),
+    ("Total Ammonia", Error("normal", 0.10)),
+    ("pH", Error("normal", 0.1, relative=False)),
+    ("(ng/L)", Error("lognormal", 0.30)),
+]
+
+
+@dataclass(frozen=True)
+class Result:
+    samples: int
+    # samples predicted high risk
+    exceedances: int
+    mean_probability: float
+    # samples per bin of the probability of high risk, BINS equal bins of [0, 1]
+    histogram: Tuple[int, ...]
+    seconds: float
+
+    @property
+    def exceedance_probability(self):
+        return self.exceedances / self.samples
+
+    def interval(self, z=Z_95):
+        """Wilson score interval of the exceedance probability."""
+        n, p = self.samples, self.exceedance_probability
+        center = (p + z * z / (2 * n)) / (1 + z * z / n)
+        half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / (1 + z * z / n)
+        return max(0.0, center - half), min(1.0, center + half)
+
+    def probability_quantile(self, q):
+        """Quantile ``q`` of the model's probability of high risk, to the bin width."""
+        cumulative = np.cumsum(self.histogram)
+        return (int(np.searchsorted(cumulative, q * self.samples)) + 1) / BINS
+
+
+def typical_error(feature):
+    """The ``Error`` suggested for ``feature``, or None for inputs without lab error."""
+    return next((error for word, error in TYPICAL_ERRORS if word in feature), None)
+
+
+def draw(value, error, size, rng, bounds=None):
+    """``size`` draws of the true value of a measurement ``value`` with ``error``."""
+    scale = error.spread * abs(value) if error.relative else error.spread
+    if error.distribution == "normal":
+        values = value + scale * rng.standard_normal(size)
+    elif error.distribution == "lognormal":
+        # mean-preserving: the draws average to ``value``
+        sigma = math.sqrt(math.log1p((scale / value) ** 2)) if value > 0 else 0.0
+        values = value * np.exp(sigma * rng.standard_normal(size) - sigma * sigma / 2)
+    elif error.distribution == "uniform":
+        values = rng.uniform(value - scale, value + scale, size)
+    else:
+        raise ValueError("Unknown distribution: {0}".format(error.distribution))
+    # concentrations, volumes and flows cannot be negative
+    low, high = bounds if bounds is not None else (0.0, np.inf)
+    return np.clip(values, low, high)
+
+
+def _score_chunk(model_id, base, errors, size, seed):
+    from .batch import predict_matrix
+
+    rng = np.random.default_rng(seed)
+    features = FEATURES[model_id]
+    X = np.tile(np.asarray(base, dtype=np.float64), (size, 1))
+    for feature, error in errors.items():
+        column = features.index(feature)
+        X[:, column] = draw(base[column], error, size, rng, RANGES.get(feature))
+    predictions, probabilities = predict_matrix(X, model_id)
+    histogram = np.bincount(np.minimum((probabilities * BINS).astype(np.int64), BINS - 1), minlength=BINS)
+    return int(predictions.sum()), float(probabilities.sum()), histogram
+
+
+_pool = {}
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers):
+    # one pool per process, kept for later runs so the workers load each model
+    # once; spawned, because the Streamlit server is multi-threaded and forking
+    # it can copy a lock in the held state
+    with _pool_lock:
+        if _pool.get("workers") != workers:
+            if "pool" in _pool:
+                _pool["pool"].shutdown(wait=False)
+            _pool["pool"] = ProcessPoolExecutor(max_workers=workers,
+                                                mp_context=multiprocessing.get_context("spawn"))
+            _pool["workers"] = workers
+        return _pool["pool"]
+
+
+def simulate(model_id, base, errors, samples=DEFAULT_SAMPLES, seed=DEFAULT_SEED, workers=None,
+             chunk_size=CHUNK_SIZE):
+    """Score ``samples`` draws of ``base`` (one sample in model input order).
+
+    ``errors`` maps input names to ``Error``; the other inputs keep their value,
+    and Year and Month are never varied. Returns a ``Result``.
+    """
+    invalid = (set(errors) - set(FEATURES[model_id])) | (INTEGER_FEATURES & set(errors))
+    if invalid:
+        raise ValueError("Cannot vary: " + ", ".join(sorted(invalid)))
+    base = [float(value) for value in base]
+    errors = dict(errors)
+    sizes = [min(chunk_size, samples - start) for start in range(0, samples, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    workers = workers or os.cpu_count() or 1
+
+    start = time.perf_counter()
+    if workers == 1 or len(sizes) == 1:
+        chunks = [_score_chunk(model_id, base, errors, size, child) for size, child in zip(sizes, seeds)]
+    else:
+        pool = _get_pool(workers)
+        futures = [pool.submit(_score_chunk, model_id, base, errors, size, child)
+                   for size, child in zip(sizes, seeds)]
+        chunks = [future.result() for future in futures]
+
+    return Result(
+        samples=samples,
+        exceedances=sum(chunk[0] for chunk in chunks),
+        mean_probability=sum(chunk[1] for chunk in chunks) / samples,
+        histogram=tuple(int(count) for count in sum(chunk[2] for chunk in chunks)),
+        seconds=time.perf_counter() - start,
+    )
+
+
+def _parse_error(text):
+    # "Total Organic Carbon=normal:0.1" or "pH=normal:0.2:abs"
+    feature, _, spec = text.rpartition("=")
+    parts = spec.split(":")
+    if not feature or len(parts) not in (2, 3) or parts[0] not in DISTRIBUTIONS:
+        raise argparse.ArgumentTypeError("expected INPUT=DISTRIBUTION:SPREAD[:abs], got {0!r}".format(text))
+    return feature, Error(parts[0], float(parts[1]), relative=parts[2:] != ["abs"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m pfas_score.uncertainty",
+                                     description="Propagate measurement error through a model by Monte Carlo.")
+    parser.add_argument("model", choices=PAGE_MODELS, help="model id")
+    parser.add_argument("--set", action="append", default=[], metavar="INPUT=VALUE",
+                        help="input value (default: the page default)")
+    parser.add_argument("--error", action="append", default=[], type=_parse_error,
+                        metavar="INPUT=DISTRIBUTION:SPREAD[:abs]",
+                        help="error of an input (default: the typical lab error of every input)")
+    parser.add_argument("--samples", type=int, default=DEFAULT_SAMPLES, help="draws (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: number of CPUs)")
+    args = parser.parse_args(argv)
+
+    values = dict(DEFAULTS[args.model])
+    for text in args.set:
+        feature, _, value = text.rpartition("=")
+        if feature not in values:
+            parser.error("unknown input {0!r}".format(feature))
+        values[feature] = float(value)
+    errors = dict(args.error) or {feature: typical_error(feature) for feature in FEATURES[args.model]
+                                  if typical_error(feature) is not None}
+
+    try:
+        result = simulate(args.model, [values[feature] for feature in FEATURES[args.model]], errors,
+                          samples=args.samples, seed=args.seed, workers=args.workers)
+    except ValueError as error:
+        parser.error(str(error))
+    low, high = result.interval()
+    print("varied: " + "; ".join("{0} {1} {2:g}{3}".format(feature, error.distribution, error.spread,
+                                                            "" if error.relative else " abs")
+                                 for feature, error in errors.items()))
+    print("P(high risk) = {0:.4f} (95% CI {1:.4f}-{2:.4f}), mean model probability {3:.4f}".format(
+        result.exceedance_probability, low, high, result.mean_probability))
+    print("{0} samples in {1:.2f} s".format(result.samples, result.seconds))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+
+from pfas_score.batch import PREDICTION_COLUMN, PROBABILITY_COLUMN, score_frame, validate_row
+from pfas_score.features import DEFAULTS, FEATURES
+
+
+def _frame(rows, model_id="influent"):
+    return pd.DataFrame([dict(DEFAULTS[model_id]) for _ in range(rows)], columns=FEATURES[model_id])
+
+
+def test_every_failed_check_of_a_column_is_masked():
+    frame = _frame(4).astype(object)
+    frame.loc[0, "Year"] = "n/a"
+    frame.loc[1, "Year"] = 1800
+    frame.loc[2, "Month"] = 6.5
+
+    result, problems = score_frame(frame, "influent", skip_invalid=True)
+
+    assert "Year: not a valid number in row(s) 2" in problems
+    assert "Year: must be between 1900 and 2100 in row(s) 3" in problems
+    assert "Month: not a whole number in row(s) 4" in problems
+    assert result[PREDICTION_COLUMN].isna().tolist() == [True, True, True, False]
+    assert np.isnan(result[PROBABILITY_COLUMN].to_numpy()[:3]).all()
+
+
+def test_invalid_rows_fail_without_skip_invalid():
+    frame = _frame(2).astype(object)
+    frame.loc[1, "Month"] = 13
+
+    result, problems = score_frame(frame, "influent")
+
+    assert result is None
+    assert problems == ["Month: must be between 1 and 12 in row(s) 3"]
+
+
+def test_validate_row_reports_each_reason():
+    values = dict(DEFAULTS["influent"], Year=1800.5)
+
+    row, problems = validate_row(values, "influent")
+
+    assert row is None
+    assert problems == ["Year: not a whole number", "Year: must be between 1900 and 2100"]
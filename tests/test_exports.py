@@ -0,0 +1,65 @@
+import os
+import warnings
+
+import numpy as np
+import pytest
+
+from pfas_score import adaboost, native, oblivious
+from pfas_score.corpus import synthetic_corpus
+from pfas_score.registry import MODEL_FILES, load_pickle, model_path
+
+ROWS = 2000
+
+FORMATS = {"native": native.FORMAT, "oblivious": oblivious.FORMAT, "adaboost": adaboost.FORMAT}
+
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore")
+    PICKLES = {model_id: load_pickle(model_path(model_id)) for model_id in MODEL_FILES}
+
+# the models each format exports
+CASES = [(name, model_id) for name, export_format in FORMATS.items() for model_id, pickled in PICKLES.items()
+         if export_format.source_model(pickled) is not None]
+
+
+@pytest.mark.parametrize("name, model_id", CASES)
+def test_export_predicts_like_the_pickle(name, model_id, tmp_path):
+    export_format = FORMATS[name]
+    model = export_format.source_model(PICKLES[model_id])
+
+    path = os.path.join(tmp_path, "model" + export_format.extension)
+    export_format.write(model, path)
+    exported = export_format.load(path)
+    X = synthetic_corpus(model_id, ROWS)
+
+    with warnings.catch_warnings():
+        # the AdaBoost pickle was fitted on a DataFrame
+        warnings.simplefilter("ignore", UserWarning)
+        expected_predictions = PICKLES[model_id].predict(X)
+        expected_probabilities = PICKLES[model_id].predict_proba(X)
+    np.testing.assert_array_equal(exported.predict(X), expected_predictions)
+    np.testing.assert_allclose(exported.predict_proba(X), expected_probabilities,
+                               rtol=0, atol=export_format.tolerance)
+
+
+def test_every_model_has_an_array_export():
+    array_exports = {model_id for name, model_id in CASES if name != "native"}
+    assert array_exports == set(MODEL_FILES)
+
+
+@pytest.mark.parametrize("value", [np.nan, np.inf, 1e300])
+def test_adaboost_export_refuses_what_the_pickle_refuses(value, tmp_path):
+    model_id = next(model_id for name, model_id in CASES if name == "adaboost")
+    path = os.path.join(tmp_path, "model.npz")
+    adaboost.FORMAT.write(adaboost.FORMAT.source_model(PICKLES[model_id]), path)
+    exported = adaboost.FORMAT.load(path)
+    X = synthetic_corpus(model_id, 3)
+    X[1, 2] = value
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)
+        with pytest.raises(ValueError):
+            PICKLES[model_id].predict_proba(X)
+    with pytest.raises(ValueError):
+        exported.predict_proba(X)
+    with pytest.raises(ValueError):
+        exported.predict(X)
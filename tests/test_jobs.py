@@ -0,0 +1,56 @@
+import os
+
+import pytest
+
+from pfas_score import jobs
+from pfas_score.features import DEFAULTS, FEATURES
+
+
+@pytest.fixture(autouse=True)
+def jobs_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "JOBS_DIR", str(tmp_path))
+
+
+def _enqueue(rows=3):
+    header = ",".join('"{0}"'.format(feature) for feature in FEATURES["influent"])
+    row = ",".join(str(DEFAULTS["influent"][feature]) for feature in FEATURES["influent"])
+    data = "\n".join([header] + [row] * rows) + "\n"
+    return jobs.enqueue(data.encode(), "samples.csv", "influent", start_workers=False)
+
+
+def test_missing_input_fails_the_job():
+    job_id = _enqueue()
+    os.remove(jobs._input_path(job_id, "samples.csv"))
+
+    assert jobs.run_job(jobs._claim(os.getpid())) == "failed"
+    job = jobs.get_job(job_id)
+    assert job.state == "failed"
+    assert "FileNotFoundError" in job.problems[0]
+
+
+def test_failing_model_fails_the_job(monkeypatch):
+    def broken(frame, model_id, skip_invalid):
+        raise RuntimeError("model exploded")
+
+    monkeypatch.setattr(jobs, "_score", broken)
+    job_id = _enqueue()
+
+    assert jobs.run_job(jobs._claim(os.getpid())) == "failed"
+    assert jobs.get_job(job_id).problems == ("Scoring samples.csv failed: RuntimeError: model exploded",)
+    # the worker goes on with the next job
+    assert jobs._claim(os.getpid()) is None
+
+
+def test_job_whose_workers_keep_dying_is_not_claimed_again():
+    job_id = _enqueue()
+    for _ in range(jobs.MAX_ATTEMPTS):
+        claimed = jobs._claim(os.getpid())
+        assert claimed.id == job_id
+        # the worker died: no heartbeat since long ago
+        with jobs._connect() as connection:
+            connection.execute("UPDATE jobs SET heartbeat = 0 WHERE id = ?", (job_id,))
+
+    assert jobs._claim(os.getpid()) is None
+    job = jobs.get_job(job_id)
+    assert job.state == "failed"
+    assert job.attempts == jobs.MAX_ATTEMPTS